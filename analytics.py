@@ -0,0 +1,790 @@
+import datetime
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+
+
+# Skale 0-10 pokazywane na wykresach trendów.
+TREND_COLUMNS = {
+    "Nastrój (0-10)": "Nastrój",
+    "Poziom lęku/napięcia (0-10)": "Lęk",
+    "Energia/motywacja (0-10)": "Energia",
+    "Apetyt (0-10)": "Apetyt",
+}
+TREND_WINDOWS = (7, 14, 30)
+EWMA_SPAN_DAYS = 7
+
+STAT_DAILY = "średnia dzienna"
+STAT_EWMA = "EWMA"
+STAT_WEEK_DELTA = "zmiana tydzień do tygodnia"
+
+# Dni przed pierwszą zmianą, które trzeba przeliczyć, żeby okna kroczące
+# i zmiana tygodniowa dały to samo co pełne przeliczenie.
+TAIL_CONTEXT_DAYS = max(TREND_WINDOWS) + 7
+
+TRENDS_CACHE_PATIENTS = 64
+
+# Najwięcej punktów jednej serii na wykresie; dłuższe zakresy są grupowane.
+CHART_MAX_POINTS = 366
+
+# (reguła resample, najmniejsza liczba dni w przedziale, opis dla wykresu)
+_CHART_BUCKETS = (
+    ("D", 1, "dzienne"),
+    ("W", 7, "tygodniowe"),
+    ("MS", 28, "miesięczne"),
+)
+
+# Reguły alertów sprawdzanych przy zapisie wpisu.
+ALERT_LOW_MOOD = "bardzo niski nastrój"
+ALERT_LOW_MOOD_STREAK = "seria obniżonego nastroju"
+ALERT_SELF_HARM = "samouszkodzenia"
+LOW_MOOD_THRESHOLD = 3
+STREAK_MOOD_THRESHOLD = 4
+STREAK_DAYS = 3
+# Dłuższa seria i tak ma już alert z dnia, w którym się zaczęła.
+STREAK_LOOKBACK_DAYS = 60
+
+# Porównanie ostatniego tygodnia z osobistą normą pacjenta (mediana i MAD
+# z dni poprzedzających ten tydzień). Kierunek: -1 gdy spadek jest
+# pogorszeniem, 1 gdy wzrost, 0 gdy niepokojące są oba.
+BASELINE_COLUMNS = {
+    "Nastrój (0-10)": -1,
+    "Poziom lęku/napięcia (0-10)": 1,
+    "Długość snu (h)": 0,
+}
+RECENT_DAYS = 7
+BASELINE_DAYS = 28
+MIN_RECENT_DAYS = 3
+MIN_BASELINE_DAYS = 10
+DEVIATION_THRESHOLD = 3.0
+# Najmniejsze MAD, żeby stała dotąd ocena nie dawała nieskończonego odchylenia.
+MIN_MAD = 0.5
+# MAD razy ta stała szacuje odchylenie standardowe rozkładu normalnego.
+MAD_SCALE = 1.4826
+
+# Kolumny ramki z parametrami snu (poza "Data i czas").
+SLEEP_COLUMNS = [
+    "Godzina zaśnięcia",
+    "Godzina wybudzenia",
+    "Liczba wybudzeń w nocy",
+    "Subiektywna jakość snu (0-10)",
+    "Godzina zaśnięcia (h)",
+    "Godzina wybudzenia (h)",
+    "Długość snu (h)",
+    "Środek snu (h)",
+]
+MINUTES_PER_DAY = 24 * 60
+
+# Dzienne wskaźniki w analizie zależności: kolumna -> podpis.
+CORRELATION_COLUMNS = {
+    "Długość snu (h)": "Długość snu",
+    "Subiektywna jakość snu (0-10)": "Jakość snu",
+    "Liczba wybudzeń w nocy": "Wybudzenia",
+    **TREND_COLUMNS,
+    "Objawy somatyczne": "Liczba objawów",
+    "Zachowania impulsywne": "Liczba zachowań impulsywnych",
+}
+# Kolumny z listą pozycji rozdzielonych przecinkami, liczone w ciągu dnia.
+ITEM_COUNT_COLUMNS = ("Objawy somatyczne", "Zachowania impulsywne")
+MAX_LAG_DAYS = 3
+# Mniej wspólnych dni daje przypadkowe współczynniki, więc zostają puste.
+MIN_CORRELATION_DAYS = 7
+LAG_LEVEL = "opóźnienie (dni)"
+INDICATOR_LEVEL = "wskaźnik"
+
+_ONE_DAY = pd.Timedelta(days=1)
+
+
+class _RecentResults:
+    """Kilka ostatnich wyników obliczeń dla całej poradni, kluczowanych wersją danych."""
+
+    def __init__(self, name: str, size: int = 4):
+        self._name = name
+        self._size = size
+        self._lock = threading.Lock()
+        self._results: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable, build) -> Any:
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                instrumentation.count(f"cache.{self._name}.hit")
+                return self._results[key]
+        instrumentation.count(f"cache.{self._name}.miss")
+        with instrumentation.span(self._name):
+            result = build()
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self._size:
+                self._results.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+
+def rolling_stat(days: int) -> str:
+    return f"średnia {days} dni"
+
+
+def downsample(
+    frame: pd.DataFrame,
+    max_points: int = CHART_MAX_POINTS,
+    how: str = "mean",
+) -> Tuple[pd.DataFrame, Optional[str]]:
+    """Grupuje punkty wykresu w przedziały czasu, gdy jest ich więcej niż `max_points`.
+
+    `frame` musi mieć indeks dat. Przedział (dzień, tydzień, miesiąc) jest
+    dobierany do długości zakresu; zwracany jest też jego opis albo None,
+    gdy punkty zostały bez zmian.
+    """
+    if len(frame) <= max_points:
+        return frame, None
+
+    days = (frame.index.max() - frame.index.min()).days + 1
+    for rule, width, label in _CHART_BUCKETS:
+        # Zapas na niepełne przedziały na początku i końcu zakresu.
+        if days / width <= max_points - 2:
+            break
+    else:
+        width = math.ceil(days / (max_points - 2))
+        rule, label = f"{width}D", f"z {width} dni"
+    grouped = frame.resample(rule).agg(how).dropna(how="all")
+    instrumentation.count("chart.downsampled")
+    return grouped, label
+
+
+def daily_means(entries: pd.DataFrame) -> pd.DataFrame:
+    """Średnie dzienne ocen na ciągłym kalendarzu; dni bez wpisów mają NaN."""
+    if entries.empty or "Data i czas" not in entries:
+        return _daily_means(entries, pd.Series(dtype="datetime64[ns]"))
+    return _daily_means(entries, pd.to_datetime(entries["Data i czas"], errors="coerce").dt.normalize())
+
+
+def _daily_means(entries: pd.DataFrame, days: pd.Series) -> pd.DataFrame:
+    columns = [column for column in TREND_COLUMNS if column in entries]
+    empty = pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name="Data"), dtype="float64")
+    if entries.empty or not columns:
+        return empty
+
+    values = entries[columns].apply(pd.to_numeric, errors="coerce")
+    daily = values.groupby(days.rename("Data")).mean()
+    if daily.empty:
+        return empty
+    return daily.asfreq("D")
+
+
+def _trend_stats(daily: pd.DataFrame, ewma_seed: Optional[pd.Series] = None) -> pd.DataFrame:
+    stats = {STAT_DAILY: daily}
+    for days in TREND_WINDOWS:
+        stats[rolling_stat(days)] = daily.rolling(days, min_periods=1).mean()
+
+    ewma_input = daily
+    if ewma_seed is not None:
+        # Przy adjust=False pierwsza obserwacja jest stanem początkowym EWMA,
+        # więc wartość z dnia poprzedzającego pozwala kontynuować szereg.
+        seed = pd.DataFrame(
+            [ewma_seed.to_numpy()],
+            columns=daily.columns,
+            index=pd.DatetimeIndex([daily.index[0] - _ONE_DAY], name=daily.index.name),
+        )
+        ewma_input = pd.concat([seed, daily])
+    ewma = ewma_input.ewm(span=EWMA_SPAN_DAYS, adjust=False, ignore_na=True).mean()
+    stats[STAT_EWMA] = ewma.iloc[1:] if ewma_seed is not None else ewma
+
+    weekly = stats[rolling_stat(7)]
+    stats[STAT_WEEK_DELTA] = weekly - weekly.shift(7)
+    return pd.concat(stats, axis=1, names=["statystyka", "kolumna"])
+
+
+class _EntryDays:
+    """Skróty wpisów (entry_id, wersja, oceny) z ich dniami.
+
+    Porównanie skrótów dwóch wersji wskazuje wpisy dodane, zmienione
+    i usunięte bez liczenia średnich dziennych od nowa; daty są parsowane
+    tylko dla wpisów, których nie było w poprzedniej wersji.
+    """
+
+    def __init__(self, hashes: np.ndarray, days: np.ndarray):
+        # W kolejności wierszy ramki oraz posortowane po skrócie do wyszukiwania.
+        self.hashes = hashes
+        self.days = days
+        order = np.argsort(hashes)
+        self.sorted_hashes = hashes[order]
+        self.sorted_days = days[order]
+
+    @staticmethod
+    def hash_entries(entries: pd.DataFrame) -> np.ndarray:
+        # Zmiana daty wpisu podnosi jego wersję, więc przy entry_id daty nie trzeba haszować.
+        keys = ("entry_id", "version") if "entry_id" in entries else ("Data i czas",)
+        columns = [column for column in (*keys, *TREND_COLUMNS) if column in entries]
+        # Bez kategoryzacji: identyfikatory i daty prawie się nie powtarzają.
+        return pd.util.hash_pandas_object(entries[columns], index=False, categorize=False).to_numpy()
+
+    @classmethod
+    def build(
+        cls,
+        entries: pd.DataFrame,
+        previous: Optional["_EntryDays"] = None,
+    ) -> Tuple["_EntryDays", np.ndarray]:
+        """Skróty obecnych wpisów i dni wpisów dodanych, zmienionych lub usuniętych."""
+        hashes = cls.hash_entries(entries) if not entries.empty else np.array([], dtype="uint64")
+        days = np.full(len(hashes), np.datetime64("NaT"), dtype="datetime64[ns]")
+        known = np.zeros(len(hashes), dtype=bool)
+        removed = np.array([], dtype="datetime64[ns]")
+        if previous is not None:
+            kept = len(previous.hashes)
+            if kept <= len(hashes) and np.array_equal(hashes[:kept], previous.hashes):
+                # Najczęstszy przypadek: bez zmian albo nowe wpisy na końcu.
+                if kept == len(hashes):
+                    return previous, removed
+                known[:kept] = True
+                days[:kept] = previous.days
+            elif kept:
+                positions = np.searchsorted(previous.sorted_hashes, hashes).clip(max=kept - 1)
+                known = previous.sorted_hashes[positions] == hashes
+                days[known] = previous.sorted_days[positions[known]]
+                removed = previous.sorted_days[~np.isin(previous.sorted_hashes, hashes)]
+        if not known.all() and "Data i czas" in entries:
+            days[~known] = pd.to_datetime(
+                entries["Data i czas"].iloc[np.flatnonzero(~known)], errors="coerce"
+            ).dt.normalize().to_numpy()
+        return cls(hashes, days), np.concatenate([days[~known], removed])
+
+    def has_duplicates(self) -> bool:
+        return bool((self.sorted_hashes[1:] == self.sorted_hashes[:-1]).any())
+
+
+def _updated_daily(
+    previous_daily: pd.DataFrame,
+    entries: pd.DataFrame,
+    days: np.ndarray,
+    changed: pd.Timestamp,
+) -> pd.DataFrame:
+    """Średnie dzienne: z poprzedniej wersji przed dniem `changed`, od niego liczone na nowo."""
+    tail = days >= changed
+    tail_daily = _daily_means(entries.loc[tail], pd.Series(days[tail], index=entries.index[tail]))
+    known = days[~np.isnat(days)]
+    calendar = pd.date_range(known.min(), known.max(), freq="D", name="Data")
+    # Sklejanie na tablicach numpy; pd.concat z reindex kosztuje więcej niż samo liczenie końcówki.
+    values = np.full((len(calendar), len(previous_daily.columns)), np.nan)
+    head = previous_daily.loc[: changed - _ONE_DAY].to_numpy()
+    values[: len(head)] = head[: len(calendar)]
+    tail_daily = tail_daily.reindex(columns=previous_daily.columns)
+    positions = calendar.get_indexer(tail_daily.index)
+    values[positions[positions >= 0]] = tail_daily.to_numpy()[positions >= 0]
+    return pd.DataFrame(values, index=calendar, columns=previous_daily.columns)
+
+
+def _extend_trends(
+    previous: pd.DataFrame,
+    daily: pd.DataFrame,
+    changed: pd.Timestamp,
+) -> Optional[pd.DataFrame]:
+    """Przelicza tylko dni od `changed`; None, gdy potrzebne jest pełne przeliczenie."""
+    if changed > daily.index[-1]:
+        # Wszystkie statystyki patrzą tylko wstecz, więc skrócenie historii ich nie zmienia.
+        return previous.loc[: daily.index[-1]]
+
+    start = changed - pd.Timedelta(days=TAIL_CONTEXT_DAYS)
+    if start <= daily.index[0]:
+        return None
+    tail = _trend_stats(daily.loc[start:], ewma_seed=previous.loc[start - _ONE_DAY, STAT_EWMA])
+    if not tail.columns.equals(previous.columns):
+        return None
+    head = previous.loc[: changed - _ONE_DAY].to_numpy()
+    return pd.DataFrame(
+        np.concatenate([head, tail.loc[changed:].to_numpy()]),
+        index=daily.index,
+        columns=previous.columns,
+    )
+
+
+class _TrendCache:
+    """Trendy ostatnio oglądanych pacjentów dla bieżącej wersji danych.
+
+    Po zmianie wersji średnie dzienne są liczone tylko od najwcześniejszego
+    dnia, w którym pacjentowi przybył, zmienił się lub ubył wpis; wcześniejsze
+    dni pochodzą z poprzedniej wersji. Gdy wpisy pacjenta się nie zmieniły
+    (np. zapisał inny pacjent), trendy są użyte bez przeliczania.
+    """
+
+    def __init__(self, max_patients: int):
+        self._lock = threading.Lock()
+        self._max_patients = max_patients
+        self._trends: "OrderedDict[str, Tuple[Hashable, _EntryDays, pd.DataFrame, pd.DataFrame]]" = OrderedDict()
+
+    def get(self, patient: str, version: Hashable, entries: pd.DataFrame) -> pd.DataFrame:
+        with self._lock:
+            cached = self._trends.get(patient)
+            if cached is not None:
+                self._trends.move_to_end(patient)
+        if cached is not None and cached[0] == version:
+            instrumentation.count("cache.trends.hit")
+            return cached[3].copy(deep=False)
+
+        with instrumentation.span("trendy pacjenta"):
+            entry_days, changed = _EntryDays.build(entries, cached[1] if cached is not None else None)
+            days = entry_days.days
+            changed = changed[~np.isnat(changed)]
+            daily = trends = None
+            if cached is not None and not entry_days.has_duplicates():
+                _, _, previous_daily, previous = cached
+                if not len(changed):
+                    daily, trends = previous_daily, previous
+                elif not previous_daily.empty and not np.isnat(days).all() and (
+                    days[~np.isnat(days)].min() == previous_daily.index[0]
+                ):
+                    # Dni między końcem poprzedniej historii a nowym wpisem też są nowe.
+                    first_changed = min(pd.Timestamp(changed.min()), previous_daily.index[-1] + _ONE_DAY)
+                    daily = _updated_daily(previous_daily, entries, days, first_changed)
+                    trends = _extend_trends(previous, daily, first_changed)
+            if trends is None:
+                instrumentation.count("cache.trends.miss")
+                if daily is None:
+                    daily = _daily_means(entries, pd.Series(days, index=entries.index))
+                trends = _trend_stats(daily)
+            else:
+                instrumentation.count("cache.trends.incremental")
+
+        with self._lock:
+            self._trends[patient] = (version, entry_days, daily, trends)
+            self._trends.move_to_end(patient)
+            while len(self._trends) > self._max_patients:
+                self._trends.popitem(last=False)
+        return trends.copy(deep=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._trends.clear()
+
+
+_trend_cache = _TrendCache(TRENDS_CACHE_PATIENTS)
+
+
+def patient_trends(patient: str, version: Hashable, entries: pd.DataFrame) -> pd.DataFrame:
+    """Średnie kroczące, EWMA i zmiana tygodniowa ocen pacjenta.
+
+    Wiersze to kolejne dni, kolumny to pary (statystyka, kolumna). Wynik jest
+    pamiętany dla `version`; po dopisaniu wpisów przeliczana jest tylko końcówka.
+    """
+    return _trend_cache.get(patient, version, entries)
+
+
+def entry_alerts(entry: Dict[str, Any], history: pd.DataFrame) -> List[Dict[str, str]]:
+    """Alerty kliniczne dla zapisywanego wpisu.
+
+    `history` to pozostałe wpisy pacjenta. Alert serii ma w polu "klucz"
+    dzień jej rozpoczęcia, więc kolejne dni tej samej serii go nie powtarzają;
+    pozostałe alerty dotyczą samego wpisu i mają pusty klucz.
+    """
+    alerts = []
+    mood = pd.to_numeric(pd.Series([entry.get("Nastrój (0-10)")]), errors="coerce").iloc[0]
+    if mood < LOW_MOOD_THRESHOLD:
+        alerts.append({"rodzaj": ALERT_LOW_MOOD, "klucz": "", "opis": f"Nastrój {mood:g}/10."})
+
+    behaviours = {item.strip() for item in str(entry.get("Zachowania impulsywne") or "").split(",")}
+    if ALERT_SELF_HARM in behaviours:
+        alerts.append({"rodzaj": ALERT_SELF_HARM, "klucz": "", "opis": "Pacjent zgłosił samouszkodzenia."})
+
+    day = pd.to_datetime(pd.Series([entry.get("Data i czas")]), errors="coerce").dt.normalize().iloc[0]
+    if pd.isna(day) or not mood < STREAK_MOOD_THRESHOLD:
+        return alerts
+
+    columns = ["Data i czas", "Nastrój (0-10)"]
+    entries = pd.concat(
+        [history.reindex(columns=columns), pd.DataFrame([entry]).reindex(columns=columns)],
+        ignore_index=True,
+    )
+    days = pd.to_datetime(entries["Data i czas"], errors="coerce").dt.normalize()
+    moods = pd.to_numeric(entries["Nastrój (0-10)"], errors="coerce")
+    window = days.between(day - pd.Timedelta(days=STREAK_LOOKBACK_DAYS), day)
+    daily = moods[window].groupby(days[window]).mean()
+    calendar = pd.date_range(day - pd.Timedelta(days=STREAK_LOOKBACK_DAYS), day, freq="D")
+    low = (daily.reindex(calendar) < STREAK_MOOD_THRESHOLD).to_numpy()[::-1]
+    # Liczba kolejnych dni z obniżonym nastrojem zakończonych dniem wpisu.
+    streak = int(low.cumprod().sum())
+    if streak >= STREAK_DAYS:
+        start = day - pd.Timedelta(days=streak - 1)
+        alerts.append(
+            {
+                "rodzaj": ALERT_LOW_MOOD_STREAK,
+                "klucz": f"{start:%Y-%m-%d}",
+                "opis": f"Nastrój poniżej {STREAK_MOOD_THRESHOLD}/10 przez {streak} dni od {start:%Y-%m-%d}.",
+            }
+        )
+    return alerts
+
+
+def _clock_minutes(values: pd.Series) -> np.ndarray:
+    """Minuty od północy z tekstów "HH:MM"; NaN dla pustych i błędnych wartości."""
+    # Różnych godzin jest najwyżej 1440, więc dekodowane są tylko unikalne wartości.
+    codes, uniques = pd.factorize(values.astype(str).str.strip())
+    if len(uniques) == 0:
+        return np.full(len(values), np.nan)
+    parts = np.char.partition(np.asarray(uniques, dtype=str), ":")
+    valid = (
+        (np.char.str_len(parts[:, 0]) >= 1)
+        & (np.char.str_len(parts[:, 0]) <= 2)
+        & (np.char.str_len(parts[:, 2]) == 2)
+        & np.char.isdigit(parts[:, 0])
+        & np.char.isdigit(parts[:, 2])
+    )
+    hours = np.where(valid, parts[:, 0], "0").astype("int64")
+    minutes = np.where(valid, parts[:, 2], "0").astype("int64")
+    decoded = np.where(valid & (hours < 24) & (minutes < 60), hours * 60 + minutes, np.nan)
+    return np.where(codes >= 0, decoded[codes], np.nan)
+
+
+def _sleep_minutes(entries: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Zaśnięcie, pobudka i długość snu w minutach; sen przez północ jest zawijany."""
+    if "Godzina zaśnięcia" not in entries or "Godzina wybudzenia" not in entries:
+        missing = np.full(len(entries), np.nan)
+        return missing, missing, missing
+    onset = _clock_minutes(entries["Godzina zaśnięcia"])
+    wake = _clock_minutes(entries["Godzina wybudzenia"])
+    return onset, wake, np.mod(wake - onset, MINUTES_PER_DAY)
+
+
+def sleep_hours(entries: pd.DataFrame) -> pd.Series:
+    """Długość snu w godzinach z godzin zaśnięcia i wybudzenia (także przez północ)."""
+    return pd.Series(_sleep_minutes(entries)[2] / 60, index=entries.index)
+
+
+def sleep_metrics(entries: pd.DataFrame) -> pd.DataFrame:
+    """Wpisy z parametrami snu: godziny jako liczby, długość i środek snu w godzinach."""
+    timestamps = pd.to_datetime(entries["Data i czas"], errors="coerce") if "Data i czas" in entries else None
+    if timestamps is None or timestamps.isna().all():
+        return pd.DataFrame(columns=["Data i czas", *SLEEP_COLUMNS])
+
+    onset, wake, duration = _sleep_minutes(entries)
+    midpoint = np.mod(onset + duration / 2, MINUTES_PER_DAY)
+    metrics = pd.DataFrame(
+        {
+            "Data i czas": timestamps,
+            "Godzina zaśnięcia": entries.get("Godzina zaśnięcia"),
+            "Godzina wybudzenia": entries.get("Godzina wybudzenia"),
+            "Liczba wybudzeń w nocy": pd.to_numeric(entries.get("Liczba wybudzeń w nocy"), errors="coerce"),
+            "Subiektywna jakość snu (0-10)": pd.to_numeric(
+                entries.get("Subiektywna jakość snu (0-10)"), errors="coerce"
+            ),
+            "Godzina zaśnięcia (h)": onset / 60,
+            "Godzina wybudzenia (h)": wake / 60,
+            "Długość snu (h)": duration / 60,
+            "Środek snu (h)": midpoint / 60,
+        },
+        index=entries.index,
+    )
+    return metrics.loc[timestamps.notna()].sort_values("Data i czas", kind="stable").reset_index(drop=True)
+
+
+def _circular_mean_std(minutes: np.ndarray) -> Tuple[float, float]:
+    """Średnia i odchylenie pory doby w minutach, z uwzględnieniem przejścia przez północ."""
+    minutes = minutes[~np.isnan(minutes)]
+    if minutes.size == 0:
+        return float("nan"), float("nan")
+    angles = minutes * (2 * np.pi / MINUTES_PER_DAY)
+    vector = np.exp(1j * angles).mean()
+    mean = np.mod(np.angle(vector) * MINUTES_PER_DAY / (2 * np.pi), MINUTES_PER_DAY)
+    spread = np.sqrt(-2 * np.log(min(abs(vector), 1.0))) * MINUTES_PER_DAY / (2 * np.pi)
+    return float(mean), float(spread)
+
+
+def sleep_regularity(metrics: pd.DataFrame) -> Dict[str, float]:
+    """Regularność snu w wybranym okresie (wartości w godzinach).
+
+    "środek snu" to średni środek snu jako godzina zegarowa, "zmienność" to
+    kołowe odchylenie standardowe środka snu, a "jetlag społeczny" to różnica
+    środka snu po nocach przed sobotą i niedzielą względem pozostałych nocy.
+    """
+    midpoint = metrics["Środek snu (h)"].to_numpy(dtype="float64") * 60
+    mean, spread = _circular_mean_std(midpoint)
+    free_days = metrics["Data i czas"].dt.dayofweek.isin([5, 6]).to_numpy()
+    free_mean, _ = _circular_mean_std(midpoint[free_days])
+    work_mean, _ = _circular_mean_std(midpoint[~free_days])
+    jetlag = abs(np.mod(free_mean - work_mean + MINUTES_PER_DAY / 2, MINUTES_PER_DAY) - MINUTES_PER_DAY / 2)
+    return {"środek snu": mean / 60, "zmienność": spread / 60, "jetlag społeczny": jetlag / 60}
+
+
+_sleep_cache = _RecentResults("sen pacjenta", TRENDS_CACHE_PATIENTS)
+
+
+def patient_sleep(patient: str, version: Hashable, entries: pd.DataFrame) -> pd.DataFrame:
+    """Parametry snu pacjenta (`sleep_metrics`) pamiętane dla wersji danych."""
+    return _sleep_cache.get((patient, version), lambda: sleep_metrics(entries)).copy(deep=False)
+
+
+def daily_indicators(entries: pd.DataFrame) -> pd.DataFrame:
+    """Dzienne wartości CORRELATION_COLUMNS na ciągłym kalendarzu; dni bez wpisów mają NaN.
+
+    Skale i parametry snu są uśredniane, a liczby pozycji z ITEM_COUNT_COLUMNS sumowane.
+    """
+    empty = pd.DataFrame(
+        columns=list(CORRELATION_COLUMNS), index=pd.DatetimeIndex([], name="Data"), dtype="float64"
+    )
+    if entries.empty or "Data i czas" not in entries:
+        return empty
+
+    days = pd.to_datetime(entries["Data i czas"], errors="coerce").dt.normalize().rename("Data")
+    values = {"Długość snu (h)": sleep_hours(entries)}
+    for column in CORRELATION_COLUMNS:
+        if column in ITEM_COUNT_COLUMNS or column in values or column not in entries:
+            continue
+        values[column] = pd.to_numeric(entries[column], errors="coerce")
+    for column in ITEM_COUNT_COLUMNS:
+        if column in entries:
+            # Pozycja to fragment między przecinkami zawierający coś poza spacjami.
+            values[column] = entries[column].fillna("").astype(str).str.count(r"[^,]*[^,\s][^,]*")
+
+    frame = pd.DataFrame(values, index=entries.index)
+    grouped = frame.groupby(days)
+    daily = grouped.mean()
+    counts = [column for column in ITEM_COUNT_COLUMNS if column in frame]
+    if counts:
+        daily[counts] = grouped[counts].sum()
+    if daily.empty:
+        return empty
+    return daily.reindex(columns=list(CORRELATION_COLUMNS)).astype("float64").asfreq("D")
+
+
+def _pairwise_correlations(left: np.ndarray, right: np.ndarray, min_periods: int) -> np.ndarray:
+    """Korelacje Pearsona każdej kolumny `left` z każdą kolumną `right` po wierszach bez NaN w obu."""
+    left_valid = ~np.isnan(left)
+    right_valid = ~np.isnan(right)
+    left_values = np.where(left_valid, left, 0.0)
+    right_values = np.where(right_valid, right, 0.0)
+    left_mask = left_valid.astype("float64")
+    right_mask = right_valid.astype("float64")
+
+    # Sumy liczone tylko po wierszach, w których obie kolumny pary mają wartość.
+    pairs = left_mask.T @ right_mask
+    left_sum = left_values.T @ right_mask
+    right_sum = left_mask.T @ right_values
+    left_squares = (left_values**2).T @ right_mask
+    right_squares = left_mask.T @ right_values**2
+    products = left_values.T @ right_values
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = products - left_sum * right_sum / pairs
+        left_variance = left_squares - left_sum**2 / pairs
+        right_variance = right_squares - right_sum**2 / pairs
+        correlation = covariance / np.sqrt(left_variance * right_variance)
+    # Stała seria (np. zawsze 0 objawów) nie ma korelacji; błędy zaokrągleń
+    # dają wtedy wariancję bliską zera zamiast dokładnego zera.
+    constant = (left_variance <= 1e-9 * pairs) | (right_variance <= 1e-9 * pairs)
+    correlation[(pairs < min_periods) | constant] = np.nan
+    return np.clip(correlation, -1.0, 1.0)
+
+
+def lagged_correlations(daily: pd.DataFrame, max_lag: int = MAX_LAG_DAYS) -> pd.DataFrame:
+    """Korelacje wskaźnika z dnia t (wiersz) ze wskaźnikiem z dnia t + opóźnienie (kolumna).
+
+    Wiersze mają indeks (LAG_LEVEL, INDICATOR_LEVEL), kolumny to podpisy
+    wskaźników; `result.loc[0]` to zwykła macierz korelacji.
+    """
+    labels = [CORRELATION_COLUMNS.get(column, column) for column in daily.columns]
+    values = daily.to_numpy(dtype="float64")
+    blocks = []
+    for lag in range(max_lag + 1):
+        if lag >= len(values):
+            correlation = np.full((len(labels), len(labels)), np.nan)
+        else:
+            correlation = _pairwise_correlations(values[: len(values) - lag], values[lag:], MIN_CORRELATION_DAYS)
+        blocks.append(correlation)
+    index = pd.MultiIndex.from_product([range(max_lag + 1), labels], names=[LAG_LEVEL, INDICATOR_LEVEL])
+    return pd.DataFrame(np.vstack(blocks), index=index, columns=labels)
+
+
+_correlations_cache = _RecentResults("korelacje pacjenta", TRENDS_CACHE_PATIENTS)
+
+
+def patient_correlations(
+    patient: str,
+    version: Hashable,
+    entries: pd.DataFrame,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+) -> pd.DataFrame:
+    """`lagged_correlations` dziennych wskaźników pacjenta z zakresu dat, pamiętane dla wersji danych."""
+
+    def build() -> pd.DataFrame:
+        daily = daily_indicators(entries)
+        if start is not None and end is not None:
+            daily = daily.loc[pd.Timestamp(start) : pd.Timestamp(end)]
+        return lagged_correlations(daily)
+
+    return _correlations_cache.get((patient, version, start, end), build).copy(deep=False)
+
+
+class DayIndex:
+    """Wpisy pacjenta pogrupowane po dniach kalendarzowych.
+
+    `rows` mapuje dzień na pozycje wierszy (iloc) w ramce, z której zbudowano
+    indeks, a `summary` ma liczbę wpisów i średni nastrój dla każdego dnia
+    z wpisami (indeks "Data").
+    """
+
+    __slots__ = ("rows", "summary")
+
+    def __init__(self, rows: Dict[datetime.date, np.ndarray], summary: pd.DataFrame):
+        self.rows = rows
+        self.summary = summary
+
+    @property
+    def first_day(self) -> datetime.date:
+        return self.summary.index[0].date()
+
+    @property
+    def last_day(self) -> datetime.date:
+        return self.summary.index[-1].date()
+
+    def day(self, entries: pd.DataFrame, day: datetime.date) -> pd.DataFrame:
+        """Wiersze `entries` z danego dnia; `entries` to ta sama ramka co przy budowie."""
+        return entries.iloc[self.rows.get(day, np.empty(0, dtype="int64"))]
+
+
+def day_index(entries: pd.DataFrame) -> DayIndex:
+    empty = DayIndex(
+        {},
+        pd.DataFrame(
+            {"wpisy": pd.Series(dtype="int64"), "Nastrój (0-10)": pd.Series(dtype="float64")},
+            index=pd.DatetimeIndex([], name="Data"),
+        ),
+    )
+    if entries.empty or "Data i czas" not in entries:
+        return empty
+
+    days = pd.to_datetime(entries["Data i czas"], errors="coerce").dt.normalize().rename("Data")
+    mood = entries.get("Nastrój (0-10)", pd.Series(np.nan, index=entries.index))
+    grouped = pd.to_numeric(mood, errors="coerce").groupby(days)
+    summary = pd.DataFrame({"wpisy": grouped.size(), "Nastrój (0-10)": grouped.mean()})
+    if summary.empty:
+        return empty
+    rows = {day.date(): positions for day, positions in grouped.indices.items()}
+    return DayIndex(rows, summary)
+
+
+_days_cache = _RecentResults("dni pacjenta", TRENDS_CACHE_PATIENTS)
+
+
+def patient_days(patient: str, version: Hashable, entries: pd.DataFrame) -> DayIndex:
+    """`day_index` wpisów pacjenta pamiętany dla wersji danych."""
+    return _days_cache.get((patient, version), lambda: day_index(entries))
+
+
+def _clinic_daily(entries: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    """Średnie dzienne wskaźników z BASELINE_COLUMNS dla wszystkich pacjentów."""
+    days = pd.to_datetime(entries["Data i czas"], errors="coerce").dt.normalize()
+    entries = entries.loc[days.between(start, end)]
+    values = pd.DataFrame(
+        {
+            "username": entries["username"].fillna("").astype(str).str.strip(),
+            "Data": days.loc[entries.index],
+            "Nastrój (0-10)": pd.to_numeric(entries.get("Nastrój (0-10)"), errors="coerce"),
+            "Poziom lęku/napięcia (0-10)": pd.to_numeric(
+                entries.get("Poziom lęku/napięcia (0-10)"), errors="coerce"
+            ),
+            "Długość snu (h)": sleep_hours(entries),
+        }
+    )
+    values = values.loc[values["username"] != ""]
+    return values.groupby(["username", "Data"], sort=True).mean().reset_index()
+
+
+def _change_points(window: pd.DataFrame, column: str) -> pd.Series:
+    """Dzień największej zmiany średniej w oknie każdego pacjenta.
+
+    Dla każdego możliwego podziału szeregu liczona jest różnica średnich
+    przed i po nim, ważona jak w statystyce CUSUM; wygrywa największa.
+    """
+    values = window[["username", "Data", column]].dropna()
+    grouped = values.groupby("username")[column]
+    position = grouped.cumcount()
+    total = grouped.transform("size")
+    before = grouped.cumsum() - values[column]
+    sum_all = grouped.transform("sum")
+    split = (position > 0) & (position < total)
+    mean_before = before / position
+    mean_after = (sum_all - before) / (total - position)
+    score = ((mean_after - mean_before).abs() * (position * (total - position) / total) ** 0.5).where(split)
+    # Stały szereg nie ma punktu zmiany.
+    score = score.where(score > 0).dropna()
+    best = score.groupby(values.loc[score.index, "username"]).idxmax()
+    return pd.Series(values.loc[best.to_numpy(), "Data"].to_numpy(), index=best.index)
+
+
+def _weekly_deviations(entries: pd.DataFrame, as_of: pd.Timestamp) -> pd.DataFrame:
+    columns = [
+        "username", "wskaźnik", "ostatni tydzień", "norma", "MAD",
+        "odchylenie", "pogorszenie", "zmiana od",
+    ]
+    if entries.empty or "username" not in entries:
+        return pd.DataFrame(columns=columns)
+
+    recent_start = as_of - pd.Timedelta(days=RECENT_DAYS - 1)
+    baseline_start = recent_start - pd.Timedelta(days=BASELINE_DAYS)
+    daily = _clinic_daily(entries, baseline_start, as_of)
+    recent = daily["Data"] >= recent_start
+
+    results = []
+    for column, direction in BASELINE_COLUMNS.items():
+        baseline = daily.loc[~recent, ["username", column]].dropna()
+        median = baseline.groupby("username")[column].median()
+        deviation = (baseline[column] - baseline["username"].map(median)).abs()
+        mad = deviation.groupby(baseline["username"]).median()
+        baseline_days = baseline.groupby("username").size()
+
+        current = daily.loc[recent, ["username", column]].dropna().groupby("username")[column]
+        frame = pd.DataFrame(
+            {
+                "ostatni tydzień": current.mean(),
+                "dni": current.size(),
+                "norma": median,
+                "MAD": mad,
+                "dni normy": baseline_days,
+            }
+        ).dropna(subset=["ostatni tydzień", "norma"])
+        frame = frame.loc[(frame["dni"] >= MIN_RECENT_DAYS) & (frame["dni normy"] >= MIN_BASELINE_DAYS)]
+        # Średnia z kilku dni waha się mniej niż pojedyncze dni, stąd pierwiastek z ich liczby.
+        frame["odchylenie"] = (frame["ostatni tydzień"] - frame["norma"]) / (
+            MAD_SCALE * frame["MAD"].clip(lower=MIN_MAD) / np.sqrt(frame["dni"])
+        )
+        frame["pogorszenie"] = frame["odchylenie"] * direction if direction else frame["odchylenie"].abs()
+        frame["zmiana od"] = _change_points(daily, column).reindex(frame.index)
+        frame["wskaźnik"] = column
+        results.append(frame.rename_axis("username").reset_index())
+
+    result = pd.concat(results, ignore_index=True).reindex(columns=columns)
+    return result.sort_values("pogorszenie", ascending=False, ignore_index=True)
+
+
+_deviations_cache = _RecentResults("pogorszenia w poradni")
+
+
+def weekly_deviations(
+    version: Hashable,
+    entries: pd.DataFrame,
+    as_of: Optional[datetime.date] = None,
+) -> pd.DataFrame:
+    """Odchylenia ostatniego tygodnia od osobistej normy każdego pacjenta.
+
+    Jeden wiersz na pacjenta i wskaźnik, od największego pogorszenia.
+    Kolumna "odchylenie" to odporny wynik z średniej z ostatniego tygodnia
+    względem mediany i MAD z wcześniejszych dni,
+    a "zmiana od" to dzień, od którego średnia wskaźnika zmieniła się najbardziej.
+    Wynik jest pamiętany dla `version` i dnia `as_of` (domyślnie dziś).
+    """
+    as_of = pd.Timestamp(as_of or datetime.date.today())
+    return _deviations_cache.get((version, as_of), lambda: _weekly_deviations(entries, as_of))
+
+
+def deteriorated_patients(deviations: pd.DataFrame, threshold: float = DEVIATION_THRESHOLD) -> pd.DataFrame:
+    """Wskaźniki, które pogorszyły się ponad próg, od największego pogorszenia."""
+    return deviations.loc[deviations["pogorszenie"] >= threshold]
@@ -1,29 +1,80 @@
 import io
 import datetime
 
-import matplotlib.pyplot as plt
 import pandas as pd
 import streamlit as st
-import streamlit_authenticator as stauth
 
+from analytics import (
+    BASELINE_DAYS,
+    CORRELATION_COLUMNS,
+    DEVIATION_THRESHOLD,
+    LAG_LEVEL,
+    MAX_LAG_DAYS,
+    MIN_CORRELATION_DAYS,
+    RECENT_DAYS,
+    STAT_EWMA,
+    STAT_WEEK_DELTA,
+    TREND_COLUMNS,
+    deteriorated_patients,
+    downsample,
+    patient_correlations,
+    patient_days,
+    patient_sleep,
+    patient_trends,
+    rolling_stat,
+    sleep_regularity,
+    weekly_deviations,
+)
+from charts import ChartConfigError, calendar_heatmap, get_chart_backend, line_chart
 from google_sheets import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
     GoogleSheetsError,
     GoogleSheetsQuotaError,
-    append_user_entry,
-    delete_user_entry,
-    load_all_entries,
-    load_user_entries,
-    load_users_config,
-    save_users_config,
-    update_user_entry,
+    acknowledge_alerts,
+    add_user,
+    delete_entry,
+    load_alerts_async,
+    load_all_entries_async,
+    load_notes,
+    load_user_entries_async,
+    load_users_config_async,
+    quota_usage,
+    with_notes,
+    without_entry_metadata,
+)
+from instrumentation import (
+    count,
+    finish_rerun,
+    render_diagnostics,
+    start_rerun,
+    timed,
 )
+from journal import JournalError, get_entry_journal, replaced_entries, with_pending_entries
+from notes_search import SEARCH_MAX_RESULTS, search_notes
+from passwords import PasswordHashingError, hash_password
 
 # --- Конфигурация страницы ---
 st.set_page_config(page_title="📓 Dziennik nastroju", layout="wide")
+start_rerun("app.py")
 
 # --- Google Sheets backend ---
+# Połączenie z Google Sheets i odczyt użytkowników startują w tle, a w tym
+# czasie przy zimnym starcie ładują się moduły logowania. Rola jest znana
+# dopiero po odczycie, więc priorytet admina pochodzi z poprzedniego przebiegu.
+users_config_future = load_users_config_async(
+    PRIORITY_LOW
+    if st.session_state.get("authentication_status") is True
+    and st.session_state.get("role") == "admin"
+    else PRIORITY_HIGH
+)
+
+import extra_streamlit_components as stx  # noqa: E402
+import streamlit_authenticator as stauth  # noqa: E402
+
 try:
-    config = load_users_config()
+    with st.spinner("⏳ Wczytywanie danych..."):
+        config = users_config_future.result()
 except GoogleSheetsQuotaError as exc:
     st.error(str(exc))
     st.stop()
@@ -36,12 +87,21 @@ except GoogleSheetsError as exc:
     st.stop()
 
 # --- Авторизация ---
-authenticator = stauth.Authenticate(
-    config['credentials'],
-    "dziennik_cookie",
-    "abcdef",
-    cookie_expiry_days=1
-)
+# Authenticate przechowuje stan logowania, więc jest cache'owany per sesja
+# i tworzony ponownie tylko po zmianie danych w worksheet "users".
+if st.session_state.get("authenticator_version") != config["version"]:
+    st.session_state["authenticator"] = stauth.Authenticate(
+        config['credentials'],
+        "dziennik_cookie",
+        "abcdef",
+        cookie_expiry_days=1
+    )
+    st.session_state["authenticator_version"] = config["version"]
+else:
+    # CookieManager to komponent, więc musi być renderowany w każdym przebiegu.
+    st.session_state["authenticator"].cookie_manager = stx.CookieManager()
+authenticator = st.session_state["authenticator"]
+config["credentials"] = authenticator.credentials
 
 # --- Стандартные значения состояния ---
 st.session_state.setdefault("authentication_status", None)
@@ -87,21 +147,21 @@ if st.session_state.get("authentication_status") is not True:
             reg_submitted = st.form_submit_button("Zarejestruj")
 
         if reg_submitted:
-            if new_username in config["credentials"]["usernames"]:
+            existing_logins = {login.strip().lower() for login in config["credentials"]["usernames"]}
+            if new_username.strip().lower() in existing_logins:
                 st.error("❌ Taki login już istnieje")
             elif not new_name or not new_username or not new_password:
                 st.error("⚠️ Wszystkie pola są wymagane")
             else:
-                hashed = stauth.Hasher([new_password]).generate()[0]
-                config["credentials"]["usernames"][new_username] = {
-                    "name": new_name,
-                    "password": hashed,
-                    "role": "pacjent"
-                }
                 try:
-                    save_users_config(config)
+                    with st.spinner("⏳ Rejestracja..."):
+                        hashed = hash_password(new_password)
+                except PasswordHashingError as exc:
+                    st.error(str(exc))
+                    st.stop()
+                try:
+                    add_user(new_username, new_name, hashed)
                 except GoogleSheetsError as exc:
-                    config["credentials"]["usernames"].pop(new_username, None)
                     st.error(str(exc))
                     st.stop()
 
@@ -174,16 +234,51 @@ if authentication_status:
         st.session_state["logout"] = True
         st.rerun()
     role = str(user_record.get("role", "pacjent")).strip().lower()
+    st.session_state["role"] = role
 
-    # --- Dane użytkownika z Google Sheets ---
-    df = pd.DataFrame()
+    # --- Dane z Google Sheets wczytywane w tle ---
+    def wait_for_data(future, message: str):
+        with st.spinner(message):
+            try:
+                return future.result()
+            except GoogleSheetsError as exc:
+                st.error(str(exc))
+                st.stop()
+
+    user_entries_future = None
     if role != "admin":
+        user_entries_future = load_user_entries_async(username)
         try:
-            df = load_user_entries(username)
-        except GoogleSheetsError as exc:
-            st.error(str(exc))
+            journal = get_entry_journal()
+        except (JournalError, OSError) as exc:
+            st.error(f"Nie udało się otworzyć lokalnego dziennika zapisów: {exc}")
             st.stop()
 
+        queued = len(journal.pending_ops(username))
+        if queued:
+            st.sidebar.info(f"⏳ Wpisy oczekujące na zapis w Google Sheets: {queued}")
+            if journal.last_error:
+                st.sidebar.caption(f"Ponawiam zapis. Ostatni błąd: {journal.last_error}")
+        failed = journal.failed_ops(username)
+        if failed:
+            st.sidebar.error(f"❌ Nie udało się zapisać wpisów: {len(failed)}.")
+            for op in failed:
+                with st.sidebar.expander(f"Wpis z {op['entry'].get('Data i czas', op['created_at'])}"):
+                    st.caption(op["error"])
+                    retry_col, dismiss_col = st.columns(2)
+                    if retry_col.button("Zapisz ponownie", key=f"retry_op_{op['op_id']}"):
+                        journal.retry_failed(op["op_id"])
+                        st.rerun()
+                    if dismiss_col.button("Odrzuć", key=f"dismiss_op_{op['op_id']}"):
+                        journal.dismiss_failed(op["op_id"])
+                        st.rerun()
+
+    try:
+        chart_backend = get_chart_backend()
+    except ChartConfigError as exc:
+        st.error(str(exc))
+        st.stop()
+
     def ensure_datetime(series: pd.Series) -> pd.Series:
         return pd.to_datetime(series, errors="coerce")
 
@@ -198,6 +293,7 @@ if authentication_status:
     AKTYWNOSCI = {"p": "praca", "n": "nauka", "d": "obowiązki domowe", "wf": "aktywność fizyczna"}
     IMPULSY = {"oż": "kompulsywne objadanie się", "su": "samouszkodzenia", "z": "zakupy kompulsywne", "h": "hazard", "s": "seks ryzykowny"}
 
+    @timed()
     def prepare_counts(column: pd.Series) -> pd.Series:
         tokens = (
             column.dropna()
@@ -256,6 +352,7 @@ if authentication_status:
         mask = filtered["Data i czas"].dt.date.between(start_date, end_date)
         return filtered.loc[mask]
 
+    @timed()
     def compute_daily_totals(df_time: pd.DataFrame, column: str) -> pd.Series:
         if column not in df_time or df_time.empty:
             return pd.Series(dtype="int64")
@@ -275,50 +372,287 @@ if authentication_status:
         grouped.name = column
         return grouped
 
+    DOWNSAMPLE_LABELS = {"mean": "średnie", "median": "mediany"}
+
+    def chart_points(frame: pd.DataFrame, how: str = "mean") -> pd.DataFrame:
+        # Długie zakresy są grupowane, żeby czas rysowania nie rósł z liczbą wpisów.
+        points, bucket = downsample(frame, how=how)
+        if bucket:
+            st.caption(f"Długi zakres: wykres pokazuje {DOWNSAMPLE_LABELS[how]} {bucket}.")
+        return points
+
     def render_daily_totals_chart(series: pd.Series, title: str, ylabel: str):
         st.markdown(f"**{title}**")
         if series.empty:
             st.info("Brak danych w wybranym okresie.")
             return
-        fig, ax = plt.subplots()
-        ax.plot(series.index, series.values, marker="o")
-        ax.set_xlabel("Data")
-        ax.set_ylabel(ylabel)
-        ax.set_title(title)
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
-
-    def prepare_sleep_dataframe(df_time: pd.DataFrame) -> pd.DataFrame:
-        if df_time.empty or "Data i czas" not in df_time:
-            return pd.DataFrame()
-        working = df_time.copy()
-        working["Data i czas"] = ensure_datetime(working["Data i czas"])
-        working = working.dropna(subset=["Data i czas"])
-        if working.empty:
-            return pd.DataFrame()
-        working["Zaśnięcie_dt"] = pd.to_datetime(
-            working.get("Godzina zaśnięcia"), format="%H:%M", errors="coerce"
+        points = chart_points(series.set_axis(pd.to_datetime(series.index)).to_frame())
+        line_chart(
+            points,
+            [(series.name, ylabel, "o")],
+            ylabel,
+            title,
+            chart_backend,
+            title=title,
+        )
+
+    TREND_SERIES = {
+        "Wpisy": None,
+        "Średnia 7 dni": rolling_stat(7),
+        "Średnia 14 dni": rolling_stat(14),
+        "Średnia 30 dni": rolling_stat(30),
+        "EWMA": STAT_EWMA,
+    }
+
+    def data_version(future, df_input: pd.DataFrame):
+        # Wpisy z lokalnego dziennika zmieniają dane bez zmiany wersji arkusza.
+        pending = ()
+        if "version" in df_input and "entry_id" in df_input:
+            pending = tuple(df_input.loc[df_input["version"].isna(), "entry_id"])
+        return future.version, pending
+
+    def render_trend_chart(
+        df_range: pd.DataFrame,
+        trends: pd.DataFrame,
+        date_range,
+        key_prefix: str,
+        name: str,
+    ) -> None:
+        series_label = st.radio(
+            "Seria",
+            list(TREND_SERIES),
+            index=1,
+            horizontal=True,
+            key=f"{key_prefix}_trend_series",
+        )
+        stat = TREND_SERIES[series_label]
+        if date_range:
+            start_date, end_date = date_range
+            trends = trends.loc[pd.Timestamp(start_date):pd.Timestamp(end_date)]
+
+        if stat is None:
+            columns = [col for col in TREND_COLUMNS if col in df_range]
+            points = chart_points(df_range.set_index("Data i czas")[columns])
+            marker = "o"
+        else:
+            points = chart_points(trends[stat])
+            marker = None
+
+        low = df_range.loc[df_range["Nastrój (0-10)"] < 3, ["Data i czas", "Nastrój (0-10)"]]
+        # Z każdego przedziału zostaje najniższy nastrój.
+        low, _ = downsample(low.set_index("Data i czas"), how="min")
+        line_chart(
+            points,
+            [(col, label, marker) for col, label in TREND_COLUMNS.items()],
+            "Poziom (0–10)",
+            name,
+            chart_backend,
+            highlight=low["Nastrój (0-10)"],
+            highlight_label="Bardzo niski nastrój",
+        )
+
+        weekly = trends[rolling_stat(7)].dropna(how="all")
+        if weekly.empty:
+            return
+        last_day = weekly.index[-1]
+        st.caption(
+            f"Średnia z 7 dni do {last_day:%Y-%m-%d} i zmiana względem poprzedniego tygodnia"
+        )
+        metric_columns = st.columns(len(TREND_COLUMNS))
+        for column_box, (col, label) in zip(metric_columns, TREND_COLUMNS.items()):
+            if col not in weekly:
+                continue
+            value = weekly.at[last_day, col]
+            delta = trends.at[last_day, (STAT_WEEK_DELTA, col)]
+            column_box.metric(
+                label,
+                "–" if pd.isna(value) else f"{value:.1f}",
+                None if pd.isna(delta) else f"{delta:+.1f}",
+                # Wzrost lęku to pogorszenie.
+                delta_color="inverse" if col == "Poziom lęku/napięcia (0-10)" else "normal",
+            )
+
+    SLEEP_SERIES = [
+        ("Godzina zaśnięcia (h)", "o", "Zaśnięcie (godz.)"),
+        ("Godzina wybudzenia (h)", "o", "Pobudka (godz.)"),
+        ("Liczba wybudzeń w nocy", "x", "Wybudzenia w nocy"),
+        ("Subiektywna jakość snu (0-10)", "s", "Jakość snu (0-10)"),
+        ("Długość snu (h)", "d", "Długość snu (h)"),
+    ]
+
+    def render_sleep_chart(sleep_frame: pd.DataFrame, name: str) -> None:
+        columns = [col for col, _, _ in SLEEP_SERIES if col in sleep_frame]
+        # Mediana, bo średnia godzin wokół północy (23:30 i 0:30) nie ma sensu.
+        points = chart_points(
+            sleep_frame.set_index("Data i czas")[columns].apply(pd.to_numeric, errors="coerce"),
+            how="median",
+        )
+        line_chart(
+            points,
+            [(col, label, marker) for col, marker, label in SLEEP_SERIES],
+            "Parametry snu",
+            name,
+            chart_backend,
+        )
+
+    def format_clock(hours: float) -> str:
+        minutes = int(round(hours * 60)) % (24 * 60)
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+    def render_sleep_summary(sleep_frame: pd.DataFrame) -> None:
+        avg_sleep = sleep_frame["Długość snu (h)"].mean()
+        avg_wakeups = sleep_frame["Liczba wybudzeń w nocy"].mean()
+        avg_quality = sleep_frame["Subiektywna jakość snu (0-10)"].mean()
+        total_wakeups = sleep_frame["Liczba wybudzeń w nocy"].sum()
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric(
+            "Średnia długość snu",
+            f"{avg_sleep:.1f} h" if not pd.isna(avg_sleep) else "–",
+        )
+        col2.metric(
+            "Średnia liczba wybudzeń",
+            f"{avg_wakeups:.1f}" if not pd.isna(avg_wakeups) else "–",
+        )
+        col3.metric(
+            "Średnia jakość snu",
+            f"{avg_quality:.1f}/10" if not pd.isna(avg_quality) else "–",
+        )
+        col4.metric("Łączna liczba wybudzeń", f"{int(total_wakeups)}")
+
+        regularity = sleep_regularity(sleep_frame)
+        col1, col2, col3 = st.columns(3)
+        col1.metric(
+            "Średni środek snu",
+            format_clock(regularity["środek snu"])
+            if not pd.isna(regularity["środek snu"])
+            else "–",
+        )
+        col2.metric(
+            "Zmienność pory snu",
+            f"± {regularity['zmienność'] * 60:.0f} min"
+            if not pd.isna(regularity["zmienność"])
+            else "–",
+        )
+        col3.metric(
+            "Jetlag społeczny",
+            f"{regularity['jetlag społeczny'] * 60:.0f} min"
+            if not pd.isna(regularity["jetlag społeczny"])
+            else "–",
+            help="Różnica środka snu w weekend i w dni robocze.",
+        )
+
+    def select_day(days, key: str) -> datetime.date:
+        # Dzień wybrany na kalendarzu trafia do pola daty przed jego utworzeniem.
+        clicked_key = f"{key}_clicked"
+        current = st.session_state.get(key)
+        if not isinstance(current, datetime.date) or not (
+            days.first_day <= current <= days.last_day
+        ):
+            st.session_state[key] = days.last_day
+
+        clicked = calendar_heatmap(
+            days.summary,
+            st.session_state[key],
+            "Nastrój (0-10)",
+            "Średni nastrój",
+            "dni z wpisami",
+            chart_backend,
+            key=f"{key}_calendar",
+        )
+        if (
+            clicked is not None
+            and clicked != st.session_state.get(clicked_key)
+            and days.first_day <= clicked <= days.last_day
+        ):
+            st.session_state[key] = clicked
+        st.session_state[clicked_key] = clicked
+        if chart_backend != "matplotlib":
+            st.caption("Kliknij dzień na kalendarzu albo wybierz datę poniżej.")
+
+        return st.date_input(
+            "Wybierz dzień",
+            min_value=days.first_day,
+            max_value=days.last_day,
+            key=key,
+        )
+
+    def current_notes():
+        try:
+            return load_notes()
+        except GoogleSheetsError as exc:
+            st.error(str(exc))
+            st.stop()
+
+    def attach_notes(df_input: pd.DataFrame) -> pd.DataFrame:
+        # Uwagi są czytane osobnym zapytaniem, tylko w widokach, które je pokazują.
+        return with_notes(df_input, current_notes()[0])
+
+    def show_notes(key: str) -> bool:
+        # Treść każdej zakładki wykonuje się przy każdym przebiegu, więc uwagi
+        # są czytane dopiero po włączeniu przełącznika.
+        return st.toggle("Pokaż uwagi", key=key)
+
+    def entries_table(df_input: pd.DataFrame, key: str) -> pd.DataFrame:
+        """Wpisy do tabeli i eksportu; kolumna Uwagi tylko po włączeniu przełącznika."""
+        if show_notes(key):
+            return without_entry_metadata(attach_notes(df_input))
+        st.caption("Eksport zawiera uwagi, gdy są pokazane.")
+        return without_entry_metadata(df_input).drop(columns=["Uwagi"], errors="ignore")
+
+    def render_day_notes(daily_df: pd.DataFrame, key: str) -> None:
+        st.markdown("### Uwagi pacjenta")
+        if not show_notes(key):
+            return
+        notes = attach_notes(daily_df)["Uwagi"].fillna("").astype(str).str.strip()
+        notes = notes[notes != ""]
+        if notes.empty:
+            st.write("Brak uwag dla wybranego dnia.")
+        else:
+            for note in notes:
+                st.markdown(f"- {note}")
+
+    def day_entries(days, df_input: pd.DataFrame, day: datetime.date) -> pd.DataFrame:
+        daily = days.day(df_input, day).copy()
+        daily["Data i czas"] = ensure_datetime(daily["Data i czas"])
+        return daily
+
+    LAG_LABELS = {0: "ten sam dzień", 1: "po 1 dniu"}
+
+    def render_correlations(correlations: pd.DataFrame, key_prefix: str) -> None:
+        if correlations.isna().all().all():
+            st.info(
+                "Za mało danych, żeby ocenić zależności "
+                f"(potrzeba co najmniej {MIN_CORRELATION_DAYS} dni z obiema wartościami)."
+            )
+            return
+        st.caption(
+            "Współczynnik korelacji średnich dziennych, od -1 do 1. Puste pola: "
+            f"mniej niż {MIN_CORRELATION_DAYS} wspólnych dni albo wartość, która się nie zmienia. "
+            "Korelacja nie oznacza, że jeden wskaźnik wpływa na drugi."
         )
-        working["Pobudka_dt"] = pd.to_datetime(
-            working.get("Godzina wybudzenia"), format="%H:%M", errors="coerce"
+        labels = list(CORRELATION_COLUMNS.values())
+        st.markdown("**Ten sam dzień**")
+        st.dataframe(correlations.loc[0].round(2), use_container_width=True)
+
+        outcome = st.selectbox(
+            "Wskaźnik w kolejnych dniach",
+            labels,
+            index=labels.index(TREND_COLUMNS["Nastrój (0-10)"]),
+            key=f"{key_prefix}_lag_outcome",
         )
-        working["Godzina zaśnięcia (h)"] = (
-            working["Zaśnięcie_dt"].dt.hour + working["Zaśnięcie_dt"].dt.minute / 60
+        lagged = (
+            correlations[outcome]
+            .unstack(LAG_LEVEL)
+            .reindex(labels)
+            .rename(
+                columns=lambda lag: LAG_LABELS.get(lag, f"po {lag} dniach")
+            )
         )
-        working["Godzina wybudzenia (h)"] = (
-            working["Pobudka_dt"].dt.hour + working["Pobudka_dt"].dt.minute / 60
+        st.markdown(
+            f"**{outcome} 0–{MAX_LAG_DAYS} dni po dniu wskaźnika z wiersza**"
         )
-        working["Długość snu (h)"] = (
-            working["Pobudka_dt"] - working["Zaśnięcie_dt"]
-        ).dt.total_seconds() / 3600
-        if "Długość snu (h)" in working:
-            working.loc[working["Długość snu (h)"] < 0, "Długość snu (h)"] += 24
-        return working
-
-    def get_numeric_series(df_input: pd.DataFrame, column: str) -> pd.Series:
-        if column not in df_input:
-            return pd.Series(dtype="float64")
-        return pd.to_numeric(df_input[column], errors="coerce")
+        st.dataframe(lagged.round(2), use_container_width=True)
 
     def clear_pending_entry():
         for key in [
@@ -331,14 +665,10 @@ if authentication_status:
     if role == "admin":
         st.title("👨‍⚕️ Panel admina")
 
-        try:
-            admin_config = load_users_config()
-            entries_df = load_all_entries()
-        except GoogleSheetsError as exc:
-            st.error(str(exc))
-            st.stop()
+        entries_future = load_all_entries_async()
+        alerts_future = load_alerts_async()
 
-        configured_users = admin_config["credentials"]["usernames"]
+        configured_users = config["credentials"]["usernames"]
         users_df = pd.DataFrame(
             [
                 {
@@ -349,28 +679,13 @@ if authentication_status:
                 for user_name, user_data in configured_users.items()
             ]
         )
-        st.write("DEBUG role:", role)
-        st.write("DEBUG username:", username)
-        st.write("DEBUG users count:", len(users_df))
-        st.write("DEBUG entries count:", len(entries_df))
-
-        usernames_from_users = {
-            str(user_name).strip()
-            for user_name, user_data in configured_users.items()
-            if str(user_name).strip()
-            and str(user_data.get("role", "pacjent")).strip().lower() != "admin"
-        }
-        usernames_from_entries = set()
-        if not entries_df.empty and "username" in entries_df:
-            usernames_from_entries = {
-                str(user_name).strip()
-                for user_name in entries_df["username"].dropna()
-                if str(user_name).strip()
-            }
-        list_of_usernames = sorted(usernames_from_users | usernames_from_entries)
-        patients = list_of_usernames
+        count("admin.users", len(users_df))
+        entries_status = st.empty()
 
         def load_patient_dataframe(patient_username: str):
+            entries_df = wait_for_data(
+                entries_future, "⏳ Wczytywanie wpisów pacjenta..."
+            )
             if entries_df.empty or "username" not in entries_df:
                 return pd.DataFrame(
                     columns=[
@@ -387,14 +702,77 @@ if authentication_status:
                 df_patient = df_patient.drop(columns=["username"])
             return df_patient.reset_index(drop=True)
 
-        if entries_df.empty:
-            st.info("Brak wpisów pacjentów")
+        # Alerty są wyliczane przy zapisie wpisów, więc wystarczy odczytać ich listę.
+        alerts_df = wait_for_data(alerts_future, "⏳ Wczytywanie alertów...")
+        open_alerts = alerts_df.loc[
+            alerts_df["przejrzano"].fillna("").astype(str).str.strip() == ""
+        ]
+        count("admin.alerts", len(open_alerts))
+        st.subheader(f"🚨 Alerty do przejrzenia ({len(open_alerts)})")
+        if open_alerts.empty:
+            st.success("Brak nowych alertów.")
+        else:
+            st.dataframe(
+                open_alerts[["Data i czas", "username", "rodzaj", "opis"]].rename(
+                    columns={"username": "Pacjent", "rodzaj": "Alert", "opis": "Opis"}
+                ),
+                use_container_width=True,
+                hide_index=True,
+            )
+            alert_labels = {
+                alert_id: f"{patient} · {entry_time} · {kind}"
+                for alert_id, patient, entry_time, kind in zip(
+                    open_alerts["alert_id"],
+                    open_alerts["username"],
+                    open_alerts["Data i czas"],
+                    open_alerts["rodzaj"],
+                )
+            }
+            with st.form("alerts_review"):
+                reviewed_alerts = st.multiselect(
+                    "Alerty do oznaczenia jako przejrzane",
+                    options=list(alert_labels),
+                    format_func=alert_labels.get,
+                )
+                if st.form_submit_button("✅ Oznacz jako przejrzane") and reviewed_alerts:
+                    try:
+                        acknowledge_alerts(reviewed_alerts, username)
+                    except GoogleSheetsError as exc:
+                        st.error(str(exc))
+                    else:
+                        st.rerun()
+
+        # Lista pacjentów zawsze obejmuje loginy znane tylko z wpisów, żeby opcje
+        # selectboxów nie zależały od tego, czy odczyt wpisów już się skończył.
+        # Alerty przyszły z tego samego odczytu arkusza, więc czekamy tylko na ramkę.
+        usernames_from_users = {
+            str(user_name).strip()
+            for user_name, user_data in configured_users.items()
+            if str(user_name).strip()
+            and str(user_data.get("role", "pacjent")).strip().lower() != "admin"
+        }
+        entries_df = wait_for_data(entries_future, "⏳ Wczytywanie wpisów...")
+        usernames_from_entries = set()
+        if not entries_df.empty and "username" in entries_df:
+            usernames_from_entries = {
+                str(user_name).strip()
+                for user_name in entries_df["username"].dropna()
+                if str(user_name).strip()
+            }
+        patients = sorted(usernames_from_users | usernames_from_entries)
 
         if not patients:
             if not entries_df.empty:
                 st.info("Brak pacjentów do wyświetlenia.")
         else:
-            tab_range, tab_day = st.tabs(["📈 Pacjent / zakres", "🗓 Pacjent / dzień"])
+            tab_range, tab_day, tab_deterioration, tab_search = st.tabs(
+                [
+                    "📈 Pacjent / zakres",
+                    "🗓 Pacjent / dzień",
+                    "📉 Pogorszenia w tygodniu",
+                    "🔎 Szukaj w uwagach",
+                ]
+            )
 
             with tab_range:
                 selected_user_range = st.selectbox(
@@ -410,10 +788,13 @@ if authentication_status:
                         st.info("Brak wpisów dla wybranego pacjenta.")
                     else:
                             st.markdown("### 📄 Wszystkie wpisy")
-                            st.dataframe(df_patient, use_container_width=True)
+                            df_patient_export = entries_table(
+                                df_patient, f"admin_notes_{selected_user_range}"
+                            )
+                            st.dataframe(df_patient_export, use_container_width=True)
 
                             st.markdown("### 📤 Eksport danych pacjenta")
-                            csv_data = df_patient.to_csv(index=False).encode("utf-8")
+                            csv_data = df_patient_export.to_csv(index=False).encode("utf-8")
                             st.download_button(
                                 "⬇️ Pobierz CSV",
                                 data=csv_data,
@@ -427,7 +808,7 @@ if authentication_status:
                                 st.info("📎 Eksport do XLSX wymaga pakietu `openpyxl`.")
                             else:
                                 buffer = io.BytesIO()
-                                df_patient.to_excel(
+                                df_patient_export.to_excel(
                                     buffer, index=False, engine="openpyxl"
                                 )
                                 st.download_button(
@@ -474,14 +855,14 @@ if authentication_status:
                                     "🗑 Usuń wybrany wpis",
                                     key=f"admin_delete_button_{selected_user_range}",
                                 ):
-                                    entry_datetime = admin_timestamps.loc[entry_to_delete]
-                                    if pd.isna(entry_datetime):
-                                        st.error("Nie można usunąć wpisu bez prawidłowej daty.")
+                                    entry_id = df_patient.at[entry_to_delete, "entry_id"]
+                                    if not entry_id:
+                                        st.error("Nie można usunąć wpisu bez identyfikatora.")
                                     else:
                                         try:
-                                            delete_user_entry(
-                                                selected_user_range,
-                                                entry_datetime,
+                                            delete_entry(
+                                                entry_id,
+                                                df_patient.at[entry_to_delete, "version"],
                                             )
                                         except GoogleSheetsError as exc:
                                             st.error(str(exc))
@@ -533,134 +914,37 @@ if authentication_status:
                                     st.info("Brak danych pacjenta w wybranym okresie.")
                                 else:
                                     st.subheader("📈 Trendy pacjenta (wybrany zakres)")
-                                    fig, ax = plt.subplots()
-                                    for col, label in [
-                                        ("Nastrój (0-10)", "Nastrój"),
-                                        ("Poziom lęku/napięcia (0-10)", "Lęk"),
-                                        ("Energia/motywacja (0-10)", "Energia"),
-                                        ("Apetyt (0-10)", "Apetyt"),
-                                    ]:
-                                        if col in df_patient_filtered:
-                                            ax.plot(
-                                                df_patient_filtered["Data i czas"],
-                                                df_patient_filtered[col],
-                                                marker="o",
-                                                label=label,
-                                            )
-
-                                    low = df_patient_filtered[
-                                        df_patient_filtered["Nastrój (0-10)"] < 3
-                                    ]
-                                    if not low.empty:
-                                        ax.scatter(
-                                            low["Data i czas"],
-                                            low["Nastrój (0-10)"],
-                                            color="red",
-                                            s=60,
-                                            zorder=5,
-                                            label="Bardzo niski nastrój",
-                                        )
-
-                                    ax.set_ylabel("Poziom (0–10)")
-                                    ax.set_xlabel("Data")
-                                    ax.legend()
-                                    plt.xticks(rotation=45)
-                                    st.pyplot(fig)
+                                    render_trend_chart(
+                                        df_patient_filtered,
+                                        patient_trends(
+                                            selected_user_range,
+                                            data_version(entries_future, df_patient),
+                                            df_patient_time,
+                                        ),
+                                        date_range,
+                                        f"{selected_user_range}_admin",
+                                        "trendy pacjenta",
+                                    )
 
                                     st.subheader("🌙 Sen pacjenta")
-                                    df_patient_sleep = prepare_sleep_dataframe(
-                                        df_patient_filtered
+                                    df_patient_sleep = patient_sleep(
+                                        selected_user_range,
+                                        data_version(entries_future, df_patient),
+                                        df_patient,
                                     )
+                                    if date_range:
+                                        df_patient_sleep = filter_by_range(
+                                            df_patient_sleep, start_date, end_date
+                                        )
                                     if df_patient_sleep.empty:
                                         st.info(
                                             "Brak danych o śnie w wybranym okresie."
                                         )
                                     else:
-                                        fig, ax = plt.subplots()
-                                        if "Godzina zaśnięcia (h)" in df_patient_sleep:
-                                            ax.plot(
-                                                df_patient_sleep["Data i czas"],
-                                                df_patient_sleep["Godzina zaśnięcia (h)"],
-                                                marker="o",
-                                                label="Zaśnięcie (godz.)",
-                                            )
-                                        if "Godzina wybudzenia (h)" in df_patient_sleep:
-                                            ax.plot(
-                                                df_patient_sleep["Data i czas"],
-                                                df_patient_sleep["Godzina wybudzenia (h)"],
-                                                marker="o",
-                                                label="Pobudka (godz.)",
-                                            )
-                                        if "Liczba wybudzeń w nocy" in df_patient_sleep:
-                                            ax.plot(
-                                                df_patient_sleep["Data i czas"],
-                                                df_patient_sleep["Liczba wybudzeń w nocy"],
-                                                marker="x",
-                                                label="Wybudzenia w nocy",
-                                            )
-                                        if "Subiektywna jakość snu (0-10)" in df_patient_sleep:
-                                            ax.plot(
-                                                df_patient_sleep["Data i czas"],
-                                                df_patient_sleep["Subiektywna jakość snu (0-10)"],
-                                                marker="s",
-                                                label="Jakość snu (0-10)",
-                                            )
-                                        if "Długość snu (h)" in df_patient_sleep:
-                                            ax.plot(
-                                                df_patient_sleep["Data i czas"],
-                                                df_patient_sleep["Długość snu (h)"],
-                                                marker="d",
-                                                label="Długość snu (h)",
-                                            )
-
-                                        ax.set_ylabel("Parametry snu")
-                                        ax.set_xlabel("Data")
-                                        ax.legend()
-                                        plt.xticks(rotation=45)
-                                        st.pyplot(fig)
+                                        render_sleep_chart(df_patient_sleep, "sen pacjenta")
 
                                         st.markdown("### 📊 Statystyki snu")
-                                        numeric_sleep = get_numeric_series(
-                                            df_patient_sleep,
-                                            "Długość snu (h)",
-                                        )
-                                        numeric_wakeups = get_numeric_series(
-                                            df_patient_sleep,
-                                            "Liczba wybudzeń w nocy",
-                                        )
-                                        numeric_quality = get_numeric_series(
-                                            df_patient_sleep,
-                                            "Subiektywna jakość snu (0-10)",
-                                        )
-
-                                        avg_sleep = numeric_sleep.dropna().mean()
-                                        avg_wakeups = numeric_wakeups.dropna().mean()
-                                        avg_quality = numeric_quality.dropna().mean()
-                                        total_wakeups = numeric_wakeups.dropna().sum()
-
-                                        col1, col2, col3, col4 = st.columns(4)
-                                        col1.metric(
-                                            "Średnia długość snu",
-                                            f"{avg_sleep:.1f} h"
-                                            if not pd.isna(avg_sleep)
-                                            else "–",
-                                        )
-                                        col2.metric(
-                                            "Średnia liczba wybudzeń",
-                                            f"{avg_wakeups:.1f}"
-                                            if not pd.isna(avg_wakeups)
-                                            else "–",
-                                        )
-                                        col3.metric(
-                                            "Średnia jakość snu",
-                                            f"{avg_quality:.1f}/10"
-                                            if not pd.isna(avg_quality)
-                                            else "–",
-                                        )
-                                        col4.metric(
-                                            "Łączna liczba wybudzeń",
-                                            f"{int(total_wakeups)}",
-                                        )
+                                        render_sleep_summary(df_patient_sleep)
 
                                         st.markdown("### 📋 Dane snu (wybrany zakres)")
                                         sleep_columns = [
@@ -689,6 +973,17 @@ if authentication_status:
                                                 "Brak szczegółowych danych o śnie w wybranym okresie."
                                             )
 
+                                    st.subheader("🔗 Zależności między wskaźnikami")
+                                    render_correlations(
+                                        patient_correlations(
+                                            selected_user_range,
+                                            data_version(entries_future, df_patient),
+                                            df_patient,
+                                            *(date_range or (None, None)),
+                                        ),
+                                        f"{selected_user_range}_admin",
+                                    )
+
                                     st.subheader(
                                         "📉 Objawy somatyczne i impulsywne zachowania"
                                     )
@@ -745,29 +1040,21 @@ if authentication_status:
                     if df_patient_day.empty:
                         st.info("Brak wpisów dla wybranego pacjenta.")
                     else:
-                            df_patient_day["Data i czas"] = ensure_datetime(
-                                df_patient_day["Data i czas"]
+                            patient_day_index = patient_days(
+                                selected_user_day,
+                                data_version(entries_future, df_patient_day),
+                                df_patient_day,
                             )
-                            df_patient_day = df_patient_day.dropna(subset=["Data i czas"])
 
-                            if df_patient_day.empty:
+                            if patient_day_index.summary.empty:
                                 st.info("Brak prawidłowych dat do wyświetlenia.")
                             else:
-                                available_dates = sorted(
-                                    df_patient_day["Data i czas"].dt.date.unique()
+                                selected_day = select_day(
+                                    patient_day_index, f"admin_daily_{selected_user_day}"
                                 )
-                                selected_day = st.date_input(
-                                    "Wybierz dzień",
-                                    value=available_dates[-1],
-                                    min_value=available_dates[0],
-                                    max_value=available_dates[-1],
-                                    key=f"admin_daily_{selected_user_day}",
+                                daily_df = day_entries(
+                                    patient_day_index, df_patient_day, selected_day
                                 )
-
-                                daily_df = df_patient_day[
-                                    df_patient_day["Data i czas"].dt.date
-                                    == selected_day
-                                ]
                                 if daily_df.empty:
                                     st.warning(
                                         "Brak wpisów pacjenta dla wybranego dnia."
@@ -775,20 +1062,13 @@ if authentication_status:
                                 else:
                                     st.markdown("### Wpisy z wybranego dnia")
                                     st.dataframe(
-                                        daily_df.drop(columns=["Uwagi"]),
+                                        without_entry_metadata(daily_df).drop(columns=["Uwagi"]),
                                         use_container_width=True,
                                     )
 
-                                    st.markdown("### Uwagi pacjenta")
-                                    notes = (
-                                        daily_df["Uwagi"].fillna("").str.strip()
+                                    render_day_notes(
+                                        daily_df, f"admin_daily_notes_{selected_user_day}"
                                     )
-                                    notes = notes[notes != ""]
-                                    if notes.empty:
-                                        st.write("Brak uwag dla wybranego dnia.")
-                                    else:
-                                        for note in notes:
-                                            st.markdown(f"- {note}")
 
                                     st.markdown("### Podsumowanie dnia")
                                     day_cols = [
@@ -833,6 +1113,82 @@ if authentication_status:
                                         ),
                                         d3,
                                     )
+
+            with tab_deterioration:
+                entries_df = wait_for_data(entries_future, "⏳ Wczytywanie wpisów...")
+                deviations = weekly_deviations(entries_future.version, entries_df)
+                deteriorated = deteriorated_patients(deviations)
+                st.caption(
+                    f"Średnia z ostatnich {RECENT_DAYS} dni w porównaniu z medianą "
+                    f"z {BASELINE_DAYS} wcześniejszych dni tego samego pacjenta. "
+                    f"Na liście są odchylenia w stronę pogorszenia od {DEVIATION_THRESHOLD:g} "
+                    "(odporny wynik z)."
+                )
+                deviations_view = deviations.drop(columns="pogorszenie").rename(
+                    columns={"username": "Pacjent", "MAD": "rozrzut (MAD)"}
+                )
+                if deteriorated.empty:
+                    st.success("W tym tygodniu nikt z pacjentów nie pogorszył się istotnie.")
+                else:
+                    count("admin.deteriorated", deteriorated["username"].nunique())
+                    st.dataframe(
+                        deviations_view.loc[deteriorated.index].round(2),
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+                with st.expander("Wszyscy pacjenci"):
+                    st.dataframe(
+                        deviations_view.round(2),
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+
+            with tab_search:
+                notes_query = st.text_input(
+                    "Szukaj w uwagach pacjentów",
+                    placeholder="np. zmiana leku",
+                    key="admin_notes_query",
+                )
+                notes_patient = st.selectbox(
+                    "Pacjent",
+                    ["Wszyscy", *patients],
+                    key="admin_notes_patient",
+                )
+                st.caption(
+                    "Wielkość liter i polskie znaki nie mają znaczenia, a słowa mogą być "
+                    "początkami wyrazów (\"lek\" znajdzie też \"leków\")."
+                )
+                if notes_query.strip():
+                    entries_df = wait_for_data(entries_future, "⏳ Wczytywanie wpisów...")
+                    notes, notes_version = current_notes()
+                    notes_results = search_notes(
+                        (entries_future.version, notes_version),
+                        with_notes(entries_df, notes),
+                        notes_query,
+                        None if notes_patient == "Wszyscy" else notes_patient,
+                    )
+                    count("admin.notes_results", len(notes_results))
+                    if notes_results.empty:
+                        st.info("Brak uwag pasujących do zapytania.")
+                    else:
+                        if len(notes_results) == SEARCH_MAX_RESULTS:
+                            st.caption(
+                                f"Pokazano {SEARCH_MAX_RESULTS} najnowszych trafień."
+                            )
+                        st.dataframe(
+                            notes_results.rename(
+                                columns={"username": "Pacjent", "fragment": "Uwagi"}
+                            ),
+                            use_container_width=True,
+                            hide_index=True,
+                        )
+
+        entries_df = wait_for_data(entries_future, "⏳ Wczytywanie wpisów...")
+        count("admin.entries", len(entries_df))
+        with entries_status.container():
+            if entries_df.empty:
+                st.info("Brak wpisów pacjentów")
+        render_diagnostics(st.sidebar, quota_usage())
     else:
         user_tabs = [
             "✍️ Formularz",
@@ -876,6 +1232,10 @@ if authentication_status:
 
                 submitted = st.form_submit_button("💾 Zapisz wpis")
 
+            df = wait_for_data(user_entries_future, "⏳ Wczytywanie wpisów...")
+            # Wpisy czekające w lokalnym dzienniku są widoczne od razu.
+            df = with_pending_entries(df, journal.pending_ops(username))
+
             if submitted:
                 now = datetime.datetime.now()
                 new_row = {
@@ -911,15 +1271,9 @@ if authentication_status:
                     st.session_state["pending_entry_user"] = username
                 else:
                     clear_pending_entry()
-                    try:
-                        append_user_entry(username, new_row)
-                    except GoogleSheetsError as exc:
-                        st.error(str(exc))
-                    else:
-                        df = pd.concat(
-                            [df, pd.DataFrame([new_row])], ignore_index=True
-                        )
-                        st.success("✅ Wpis dodany!")
+                    journal.submit_append(username, new_row)
+                    df = with_pending_entries(df, journal.pending_ops(username))
+                    st.success("✅ Wpis dodany!")
 
         pending_entry = st.session_state.get("pending_entry")
         pending_user = st.session_state.get("pending_entry_user")
@@ -940,14 +1294,15 @@ if authentication_status:
                     "Usuń poprzedni i zapisz nowy wpis",
                     key=f"confirm_replace_{username}",
                 ):
-                    try:
-                        update_user_entry(username, pending_date, pending_entry)
-                    except GoogleSheetsError as exc:
-                        st.error(str(exc))
-                    else:
-                        clear_pending_entry()
-                        st.success("Wpis został zaktualizowany.")
-                        st.rerun()
+                    journal.submit_replace(
+                        username,
+                        pending_date,
+                        pending_entry,
+                        replaced_entries(df, pending_date),
+                    )
+                    clear_pending_entry()
+                    st.success("Wpis został zaktualizowany.")
+                    st.rerun()
                 if cancel_col.button(
                     "Anuluj zapis",
                     key=f"cancel_pending_{username}",
@@ -963,7 +1318,8 @@ if authentication_status:
             if df.empty:
                 st.info("Brak zapisanych wpisów.")
             else:
-                st.dataframe(df, use_container_width=True)
+                df_export = entries_table(df, f"{username}_history_notes")
+                st.dataframe(df_export, use_container_width=True)
 
                 st.markdown("### 🗑 Usuń wpis")
                 user_timestamps = (
@@ -999,12 +1355,20 @@ if authentication_status:
                     "🗑 Usuń wybrany wpis",
                     key=f"user_delete_button_{username}",
                 ):
-                    entry_datetime = user_timestamps.loc[entry_to_delete_user]
-                    if pd.isna(entry_datetime):
-                        st.error("Nie można usunąć wpisu bez prawidłowej daty.")
+                    entry_id = df.at[entry_to_delete_user, "entry_id"]
+                    if not entry_id:
+                        st.error("Nie można usunąć wpisu bez identyfikatora.")
+                    elif pd.isna(df.at[entry_to_delete_user, "version"]):
+                        st.warning(
+                            "Ten wpis czeka jeszcze na zapis w Google Sheets. "
+                            "Spróbuj go usunąć za chwilę."
+                        )
                     else:
                         try:
-                            delete_user_entry(username, entry_datetime)
+                            delete_entry(
+                                entry_id,
+                                df.at[entry_to_delete_user, "version"],
+                            )
                         except GoogleSheetsError as exc:
                             st.error(str(exc))
                         else:
@@ -1012,7 +1376,7 @@ if authentication_status:
                             st.rerun()
 
                 st.markdown("### 📤 Eksport danych")
-                csv_data = df.to_csv(index=False).encode("utf-8")
+                csv_data = df_export.to_csv(index=False).encode("utf-8")
                 st.download_button(
                     "⬇️ Pobierz CSV",
                     data=csv_data,
@@ -1026,7 +1390,7 @@ if authentication_status:
                     st.info("📎 Eksport do XLSX wymaga pakietu `openpyxl`.")
                 else:
                     buffer = io.BytesIO()
-                    df.to_excel(buffer, index=False, engine="openpyxl")
+                    df_export.to_excel(buffer, index=False, engine="openpyxl")
                     st.download_button(
                         "⬇️ Pobierz XLSX",
                         data=buffer.getvalue(),
@@ -1060,39 +1424,17 @@ if authentication_status:
                         st.info("Brak danych w wybranym okresie.")
                     else:
                         st.subheader("📈 Trendy w czasie")
-                        fig, ax = plt.subplots()
-                        for col, label in [
-                            ("Nastrój (0-10)", "Nastrój"),
-                            ("Poziom lęku/napięcia (0-10)", "Lęk"),
-                            ("Energia/motywacja (0-10)", "Energia"),
-                            ("Apetyt (0-10)", "Apetyt"),
-                        ]:
-                            if col in chart_filtered:
-                                ax.plot(
-                                    chart_filtered["Data i czas"],
-                                    chart_filtered[col],
-                                    marker="o",
-                                    label=label,
-                                )
-
-                        low = chart_filtered[
-                            chart_filtered["Nastrój (0-10)"] < 3
-                        ]
-                        if not low.empty:
-                            ax.scatter(
-                                low["Data i czas"],
-                                low["Nastrój (0-10)"],
-                                color="red",
-                                s=60,
-                                zorder=5,
-                                label="Bardzo niski nastrój",
-                            )
-
-                        ax.set_ylabel("Poziom (0–10)")
-                        ax.set_xlabel("Data")
-                        ax.legend()
-                        plt.xticks(rotation=45)
-                        st.pyplot(fig)
+                        render_trend_chart(
+                            chart_filtered,
+                            patient_trends(
+                                username,
+                                data_version(user_entries_future, df),
+                                chart_df,
+                            ),
+                            date_range,
+                            username,
+                            "trendy",
+                        )
 
                         st.subheader(
                             "📉 Objawy somatyczne i impulsywne zachowania"
@@ -1141,7 +1483,9 @@ if authentication_status:
             if df.empty:
                 st.info("Brak zapisów dotyczących snu.")
             else:
-                sleep_df = prepare_sleep_dataframe(df)
+                sleep_df = patient_sleep(
+                    username, data_version(user_entries_future, df), df
+                )
                 if sleep_df.empty:
                     st.info("Brak prawidłowych danych o śnie.")
                 else:
@@ -1159,89 +1503,10 @@ if authentication_status:
                     if sleep_filtered.empty:
                         st.info("Brak danych o śnie w wybranym okresie.")
                     else:
-                        fig, ax = plt.subplots()
-                        if "Godzina zaśnięcia (h)" in sleep_filtered:
-                            ax.plot(
-                                sleep_filtered["Data i czas"],
-                                sleep_filtered["Godzina zaśnięcia (h)"],
-                                marker="o",
-                                label="Zaśnięcie (godz.)",
-                            )
-                        if "Godzina wybudzenia (h)" in sleep_filtered:
-                            ax.plot(
-                                sleep_filtered["Data i czas"],
-                                sleep_filtered["Godzina wybudzenia (h)"],
-                                marker="o",
-                                label="Pobudka (godz.)",
-                            )
-                        if "Liczba wybudzeń w nocy" in sleep_filtered:
-                            ax.plot(
-                                sleep_filtered["Data i czas"],
-                                sleep_filtered["Liczba wybudzeń w nocy"],
-                                marker="x",
-                                label="Wybudzenia w nocy",
-                            )
-                        if "Subiektywna jakość snu (0-10)" in sleep_filtered:
-                            ax.plot(
-                                sleep_filtered["Data i czas"],
-                                sleep_filtered["Subiektywna jakość snu (0-10)"],
-                                marker="s",
-                                label="Jakość snu (0-10)",
-                            )
-                        if "Długość snu (h)" in sleep_filtered:
-                            ax.plot(
-                                sleep_filtered["Data i czas"],
-                                sleep_filtered["Długość snu (h)"],
-                                marker="d",
-                                label="Długość snu (h)",
-                            )
-
-                        ax.set_ylabel("Parametry snu")
-                        ax.set_xlabel("Data")
-                        ax.legend()
-                        plt.xticks(rotation=45)
-                        st.pyplot(fig)
-
-                        numeric_sleep = get_numeric_series(
-                            sleep_filtered, "Długość snu (h)"
-                        )
-                        numeric_wakeups = get_numeric_series(
-                            sleep_filtered, "Liczba wybudzeń w nocy"
-                        )
-                        numeric_quality = get_numeric_series(
-                            sleep_filtered,
-                            "Subiektywna jakość snu (0-10)",
-                        )
-
-                        avg_sleep = numeric_sleep.dropna().mean()
-                        avg_wakeups = numeric_wakeups.dropna().mean()
-                        avg_quality = numeric_quality.dropna().mean()
-                        total_wakeups = numeric_wakeups.dropna().sum()
+                        render_sleep_chart(sleep_filtered, "sen")
 
                         st.markdown("### 📊 Statystyki snu (okres)")
-                        c1, c2, c3, c4 = st.columns(4)
-                        c1.metric(
-                            "Średnia długość snu",
-                            f"{avg_sleep:.1f} h"
-                            if not pd.isna(avg_sleep)
-                            else "–",
-                        )
-                        c2.metric(
-                            "Średnia liczba wybudzeń",
-                            f"{avg_wakeups:.1f}"
-                            if not pd.isna(avg_wakeups)
-                            else "–",
-                        )
-                        c3.metric(
-                            "Średnia jakość snu",
-                            f"{avg_quality:.1f}/10"
-                            if not pd.isna(avg_quality)
-                            else "–",
-                        )
-                        c4.metric(
-                            "Łączna liczba wybudzeń",
-                            f"{int(total_wakeups)}",
-                        )
+                        render_sleep_summary(sleep_filtered)
 
                         st.markdown("### 📋 Dane snu")
                         sleep_columns = [
@@ -1272,44 +1537,25 @@ if authentication_status:
             if df.empty:
                 st.info("Brak zapisanych wpisów.")
             else:
-                df_dates = df.copy()
-                df_dates["Data i czas"] = ensure_datetime(df_dates["Data i czas"])
-                df_dates = df_dates.dropna(subset=["Data i czas"])
+                user_day_index = patient_days(
+                    username, data_version(user_entries_future, df), df
+                )
 
-                if df_dates.empty:
+                if user_day_index.summary.empty:
                     st.info("Brak prawidłowych dat w zapisach.")
                 else:
-                    available_dates = sorted(
-                        df_dates["Data i czas"].dt.date.unique()
-                    )
-                    selected_day = st.date_input(
-                        "Wybierz dzień",
-                        value=available_dates[-1],
-                        min_value=available_dates[0],
-                        max_value=available_dates[-1],
-                        key=f"{username}_daily_view",
-                    )
-
-                    daily_df = df_dates[
-                        df_dates["Data i czas"].dt.date == selected_day
-                    ]
+                    selected_day = select_day(user_day_index, f"{username}_daily_view")
+                    daily_df = day_entries(user_day_index, df, selected_day)
                     if daily_df.empty:
                         st.warning("Brak wpisów dla wybranego dnia.")
                     else:
                         st.markdown("### Zapisane dane")
                         st.dataframe(
-                            daily_df.drop(columns=["Uwagi"]),
+                            without_entry_metadata(daily_df).drop(columns=["Uwagi"]),
                             use_container_width=True,
                         )
 
-                        st.markdown("### Uwagi pacjenta")
-                        notes = daily_df["Uwagi"].fillna("").str.strip()
-                        notes = notes[notes != ""]
-                        if notes.empty:
-                            st.write("Brak uwag dla wybranego dnia.")
-                        else:
-                            for note in notes:
-                                st.markdown(f"- {note}")
+                        render_day_notes(daily_df, f"{username}_daily_notes")
 
                         st.markdown("### Podsumowanie dnia")
                         summary_cols = [
@@ -1354,3 +1600,5 @@ st.markdown(
     "**Lek. Aleksy Kasperowicz** · specjalista psychiatra · "
     "[www.drkasperowicz.pl](https://www.drkasperowicz.pl)"
 )
+
+finish_rerun()
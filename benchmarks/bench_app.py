@@ -0,0 +1,214 @@
+"""Czas przebiegów app.py dla pacjenta i admina na atrapie arkusza.
+
+Każda sesja to osobny AppTest, który loguje się przez formularz i wykonuje
+typowe kroki widoku. Równoległe sesje działają w wątkach jednego procesu na
+wspólnej atrapie arkusza, tak jak sesje jednego serwera Streamlit: dzielą
+cache odczytów, ramki wpisów, dziennik zapisów i limit zapytań.
+
+    python -m benchmarks.bench_app --entries 10000 --patients 4 --admins 1 --json raport.jsonl
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import math
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+from unittest.mock import MagicMock
+
+import bcrypt
+import streamlit as st
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest, app_test
+
+import google_sheets
+from benchmarks.fake_sheets import install, synthetic_spreadsheet
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+PASSWORD = "haslo-testowe"
+PATIENTS = 50
+
+
+def _share_streamlit_globals(journal_path: str) -> None:
+    """Ustawia raz na cały proces to, co AppTest podmienia przy każdym przebiegu.
+
+    AppTest przed przebiegiem ustawia globalny Runtime, opcje konfiguracji
+    i st.secrets, a po nim je zdejmuje, więc kończąca się sesja psułaby
+    przebieg trwający w innym wątku. Przypisania AppTest trafiają tu do
+    zastępczej klasy, a wspólne wartości są ustawione na stałe.
+    """
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    app_test.Runtime = type("Runtime", (), {"_instance": None})
+
+    config.set_option("global.appTest", True)
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+
+    secrets = Secrets([])
+    secrets._secrets = {"journal": {"path": journal_path}}
+    st.secrets = secrets
+
+
+class _Session:
+    def __init__(self, timeout: float):
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.timings: Dict[str, List[float]] = {}
+        self.errors: List[str] = []
+
+    def step(self, name: str, action: Callable[[AppTest], Any] = lambda app: None) -> None:
+        action(self.app)
+        started = time.perf_counter()
+        self.app.run()
+        self.timings.setdefault(name, []).append(time.perf_counter() - started)
+        self.errors.extend(f"{name}: {exc.value}" for exc in self.app.exception)
+
+    def login(self, username: str) -> None:
+        self.step("strona logowania")
+
+        def fill(app: AppTest) -> None:
+            app.text_input[0].input(username)
+            app.text_input[1].input(PASSWORD)
+            next(button for button in app.button if button.label == "Login").click()
+
+        self.step("logowanie", fill)
+
+
+def _button(app: AppTest, label: str):
+    return next(button for button in app.button if button.label == label)
+
+
+def _patient_session(session: _Session, index: int, rounds: int) -> None:
+    session.login(f"pacjent{index % PATIENTS}")
+    for round_number in range(rounds):
+        session.step("pacjent: formularz", lambda app: _button(app, "💾 Zapisz wpis").click())
+
+        def pick_day(app: AppTest) -> None:
+            day_input = next(field for field in app.date_input if field.label == "Wybierz dzień")
+            day_input.set_value(day_input.min + datetime.timedelta(days=round_number))
+
+        session.step("pacjent: dzień", pick_day)
+        session.step("pacjent: przebieg")
+
+
+def _admin_session(session: _Session, index: int, rounds: int) -> None:
+    session.login(google_sheets.DEFAULT_ADMIN_USERNAME.lower())
+    for round_number in range(rounds):
+        patient = f"pacjent{(index + round_number) % PATIENTS}"
+        session.step(
+            "admin: pacjent / zakres",
+            lambda app: app.selectbox(key="admin_range_patient").set_value(patient),
+        )
+        session.step(
+            "admin: pacjent / dzień",
+            lambda app: app.selectbox(key="admin_day_patient").set_value(patient),
+        )
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def _run_session(scenario: str, index: int, rounds: int, timeout: float) -> Dict[str, Any]:
+    session = _Session(timeout)
+    if scenario == "admin":
+        _admin_session(session, index, rounds)
+    else:
+        _patient_session(session, index, rounds)
+    return {"timings": session.timings, "errors": session.errors}
+
+
+def run(entries: int, patients: int, admins: int, rounds: int, timeout: float) -> Dict[str, Any]:
+    logging.disable(logging.WARNING)
+    spreadsheet = synthetic_spreadsheet(entries, PATIENTS)
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds=4)).decode()
+    for row in spreadsheet.sheets["users"].rows[1:]:
+        row[2] = password_hash
+    install(spreadsheet)
+    journal_dir = tempfile.mkdtemp(prefix="dziennik-bench-")
+    _share_streamlit_globals(os.path.join(journal_dir, "journal.jsonl"))
+    scenarios = ["patient"] * patients + ["admin"] * admins
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(scenarios), thread_name_prefix="bench-session") as executor:
+        futures = [
+            executor.submit(_run_session, scenario, index, rounds, timeout)
+            for index, scenario in enumerate(scenarios)
+        ]
+        sessions = [future.result() for future in futures]
+    wall_time = time.perf_counter() - started
+
+    timings: Dict[str, List[float]] = {}
+    for session in sessions:
+        for name, values in session["timings"].items():
+            timings.setdefault(name, []).extend(values)
+
+    return {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "entries": entries,
+        "patient_sessions": patients,
+        "admin_sessions": admins,
+        "rounds": rounds,
+        "wall_time_s": wall_time,
+        # ru_maxrss na Linuksie jest w KiB.
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "api_calls": dict(spreadsheet.backend.calls),
+        "steps": {
+            name: {
+                "count": len(values),
+                "p50_ms": _percentile(values, 50) * 1000,
+                "p90_ms": _percentile(values, 90) * 1000,
+                "p99_ms": _percentile(values, 99) * 1000,
+                "max_ms": max(values) * 1000,
+            }
+            for name, values in timings.items()
+        },
+        "errors": [error for session in sessions for error in session["errors"]],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=10_000)
+    parser.add_argument("--patients", type=int, default=1, help="liczba równoległych sesji pacjentów")
+    parser.add_argument("--admins", type=int, default=1, help="liczba równoległych sesji admina")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120.0, help="limit czasu jednego przebiegu w sekundach")
+    parser.add_argument("--json", help="plik, do którego zostanie dopisany raport (JSON Lines)")
+    args = parser.parse_args()
+
+    report = run(args.entries, args.patients, args.admins, args.rounds, args.timeout)
+
+    print(f"{'krok':<26} {'n':>4} {'p50':>9} {'p90':>9} {'p99':>9}")
+    for name, step in report["steps"].items():
+        print(
+            f"{name:<26} {step['count']:>4} "
+            f"{step['p50_ms']:>7.0f}ms {step['p90_ms']:>7.0f}ms {step['p99_ms']:>7.0f}ms"
+        )
+    print(
+        f"czas całkowity: {report['wall_time_s']:.1f} s, "
+        f"szczytowa pamięć procesu: {report['peak_rss_mb']:.0f} MB"
+    )
+    for error in report["errors"]:
+        print(f"BŁĄD {error}")
+
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
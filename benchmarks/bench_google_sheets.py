@@ -0,0 +1,137 @@
+"""Pomiary warstwy google_sheets na atrapie arkusza.
+
+Uruchomienie z katalogu repozytorium:
+
+    python -m benchmarks.bench_google_sheets --sizes 1000 10000 100000
+    python -m benchmarks.bench_google_sheets --sizes 1000000 --repeat 1 --json wyniki.json
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import google_sheets
+from benchmarks.fake_sheets import FakeBackend, install, synthetic_spreadsheet
+
+PATIENTS = 50
+
+
+def _cold_cache() -> None:
+    google_sheets.invalidate_cache()
+    google_sheets._frame_cache.clear()
+
+
+def _operations(entries: int) -> Dict[str, Callable[[int], Any]]:
+    days = max(entries // PATIENTS, 1)
+
+    def day(run: int) -> datetime.date:
+        return datetime.date(2020, 1, 1) + datetime.timedelta(days=(run * 7) % days)
+
+    def entry(run: int) -> Dict[str, Any]:
+        return {"Data i czas": f"{day(run).isoformat()} 21:00", "Nastrój (0-10)": run % 11}
+
+    def load_all_entries(run: int) -> Any:
+        _cold_cache()
+        return google_sheets.load_all_entries()
+
+    def load_notes(run: int) -> Any:
+        _cold_cache()
+        return google_sheets.load_notes()
+
+    def entries_dataframe(run: int) -> Any:
+        records, _ = google_sheets._worksheet_records("entries")
+        return google_sheets._entries_dataframe(records, include_username=True)
+
+    return {
+        "load_all_entries": load_all_entries,
+        "load_notes": load_notes,
+        "load_user_entries": lambda run: google_sheets.load_user_entries(f"pacjent{run % PATIENTS}"),
+        "_entries_dataframe": entries_dataframe,
+        "_matching_entries": lambda run: google_sheets._matching_entries("pacjent1", day(run)),
+        "update_user_entry": lambda run: google_sheets.update_user_entry("pacjent2", day(run), entry(run)),
+        "delete_user_entry": lambda run: google_sheets.delete_user_entry("pacjent3", day(run)),
+    }
+
+
+def _measure(operation: Callable[[int], Any], backend: FakeBackend, repeat: int) -> Dict[str, Any]:
+    timings: List[float] = []
+    errors = 0
+    calls_before = sum(backend.calls.values())
+    for run in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        try:
+            operation(run)
+        except google_sheets.GoogleSheetsError:
+            errors += 1
+        timings.append(time.perf_counter() - started)
+    api_calls = sum(backend.calls.values()) - calls_before
+
+    # Osobny przebieg pod tracemalloc, bo śledzenie alokacji spowalnia kod.
+    tracemalloc.start()
+    try:
+        operation(repeat)
+    except google_sheets.GoogleSheetsError:
+        errors += 1
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "max_s": max(timings),
+        "api_calls_per_run": api_calls / repeat,
+        "peak_memory_mb": peak / 1024 / 1024,
+        "errors": errors,
+    }
+
+
+def run(sizes: List[int], repeat: int, latency: float, quota_error_rate: float) -> List[Dict[str, Any]]:
+    results = []
+    for size in sizes:
+        backend = FakeBackend(latency=latency, quota_error_rate=quota_error_rate)
+        install(synthetic_spreadsheet(size, PATIENTS, backend))
+        for name, operation in _operations(size).items():
+            _cold_cache()
+            try:
+                google_sheets.load_all_entries()
+            except google_sheets.GoogleSheetsError:
+                pass
+            result = {"operation": name, "entries": size, **_measure(operation, backend, repeat)}
+            results.append(result)
+            print(
+                f"{name:<20} {size:>8} "
+                f"{result['median_s'] * 1000:>10.1f} ms "
+                f"{result['api_calls_per_run']:>6.1f} API "
+                f"{result['peak_memory_mb']:>8.1f} MB"
+                + (f"  błędy: {result['errors']}" if result["errors"] else "")
+            )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="opóźnienie każdego wywołania API w sekundach")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0, help="odsetek wywołań kończonych błędem 429")
+    parser.add_argument("--json", help="plik, do którego zostaną zapisane wyniki")
+    args = parser.parse_args()
+
+    # Bez secrets.toml Streamlit loguje ostrzeżenia przy każdym odczycie ustawień.
+    logging.disable(logging.WARNING)
+    print(f"{'operacja':<20} {'wpisy':>8} {'mediana':>13} {'':>10} {'pamięć':>11}")
+    results = run(args.sizes, args.repeat, args.latency, args.quota_error_rate)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
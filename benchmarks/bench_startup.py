@@ -0,0 +1,119 @@
+"""Zimny start procesu i pierwszy widok (strona logowania) app.py.
+
+Każdy pomiar to nowy proces Pythona z `-X importtime`, jak przy wybudzeniu
+aplikacji w Streamlit Cloud. Raportowany jest czas całego procesu, czas
+pierwszego przebiegu app.py oraz czas importu najcięższych modułów.
+
+    python -m benchmarks.bench_startup --repeat 5 --json start.jsonl
+"""
+
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_DIR, "app.py")
+
+TRACKED_MODULES = [
+    "pandas",
+    "google_sheets",
+    "gspread",
+    "pyarrow",
+    "streamlit_authenticator",
+    "extra_streamlit_components",
+    "matplotlib",
+    "matplotlib.pyplot",
+    "openpyxl",
+]
+
+
+def _child(app_path: str) -> None:
+    import logging
+
+    logging.disable(logging.WARNING)
+    from streamlit.testing.v1 import AppTest
+
+    from benchmarks.fake_sheets import install, synthetic_spreadsheet
+
+    install(synthetic_spreadsheet(1_000))
+    app = AppTest.from_file(app_path, default_timeout=120)
+    started = time.perf_counter()
+    app.run()
+    first_paint = time.perf_counter() - started
+    print(json.dumps({"first_paint_s": first_paint, "errors": [str(exc.value) for exc in app.exception]}))
+
+
+def _import_times(stderr: str) -> Dict[str, float]:
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        if name in TRACKED_MODULES:
+            times[name] = int(cumulative) / 1000
+    return times
+
+
+def _measure(app_path: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "benchmarks.bench_startup", "--child", app_path],
+        cwd=REPO_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    process_s = time.perf_counter() - started
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {"process_s": process_s, **result, "imports_ms": _import_times(completed.stderr)}
+
+
+def run(app_path: str, repeat: int) -> Dict[str, Any]:
+    samples: List[Dict[str, Any]] = [_measure(app_path) for _ in range(repeat)]
+    return {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "app": app_path,
+        "repeat": repeat,
+        "process_s": statistics.median(sample["process_s"] for sample in samples),
+        "first_paint_s": statistics.median(sample["first_paint_s"] for sample in samples),
+        "imports_ms": {
+            name: statistics.median(sample["imports_ms"].get(name, 0.0) for sample in samples)
+            for name in TRACKED_MODULES
+        },
+        "errors": [error for sample in samples for error in sample["errors"]],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=APP_PATH, help="ścieżka do app.py (np. z innej wersji)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="plik, do którego zostanie dopisany raport (JSON Lines)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child)
+        return
+
+    report = run(os.path.abspath(args.app), args.repeat)
+    print(f"proces: {report['process_s']:.2f} s, pierwszy widok: {report['first_paint_s']:.2f} s")
+    for name, value in report["imports_ms"].items():
+        print(f"  {name:<28} {value:>8.0f} ms" if value else f"  {name:<28} {'nie ładowany':>11}")
+    for error in report["errors"]:
+        print(f"BŁĄD {error}")
+
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
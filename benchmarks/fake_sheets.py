@@ -0,0 +1,257 @@
+"""Atrapa gspread w pamięci do pomiarów warstwy google_sheets bez konta Google."""
+
+import datetime
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import requests
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol, numericise_all
+
+import google_sheets
+
+
+def _api_error(code: int, message: str, status: str) -> APIError:
+    response = requests.Response()
+    response.status_code = code
+    response._content = json.dumps(
+        {"error": {"code": code, "message": message, "status": status}}
+    ).encode()
+    return APIError(response)
+
+
+def _quota_error() -> APIError:
+    return _api_error(429, "Quota exceeded for quota metric 'Read requests'.", "RESOURCE_EXHAUSTED")
+
+
+def _split_range(range_name: str) -> Tuple[Optional[str], str]:
+    if "!" not in range_name:
+        return None, range_name
+    sheet_name, cells = range_name.split("!", 1)
+    return sheet_name.strip("'"), cells
+
+
+def _cell_bounds(cells: str) -> Tuple[int, int, Optional[int], Optional[int]]:
+    def parse(cell: str) -> Tuple[Optional[int], Optional[int]]:
+        column, row = re.match(r"([A-Z]*)(\d*)", cell).groups()
+        return (
+            int(row) if row else None,
+            a1_to_rowcol(f"{column}1")[1] if column else None,
+        )
+
+    start, _, end = cells.partition(":")
+    first_row, first_col = parse(start)
+    last_row, last_col = parse(end or start)
+    return first_row or 1, first_col or 1, last_row, last_col
+
+
+class FakeBackend:
+    """Wspólny stan atrapy: licznik wywołań API, opóźnienie i wstrzykiwane błędy."""
+
+    def __init__(self, latency: float = 0.0, quota_error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self.calls: Counter = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] += 1
+            fail = self._random.random() < self.quota_error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise _quota_error()
+
+
+class FakeWorksheet:
+    def __init__(self, backend: FakeBackend, title: str, rows: List[List[Any]], cols: int):
+        self._backend = backend
+        self.title = title
+        self.rows = [list(row) for row in rows]
+        self.col_count = cols
+
+    @property
+    def row_count(self) -> int:
+        return max(len(self.rows), 1000)
+
+    def read(self, cells: str) -> List[List[str]]:
+        first_row, first_col, last_row, last_col = _cell_bounds(cells)
+        last_row = min(last_row or len(self.rows), len(self.rows))
+        last_col = last_col or self.col_count
+        values = []
+        for row in self.rows[first_row - 1:last_row]:
+            cells_out = [str(value) for value in row[first_col - 1:last_col]]
+            while cells_out and cells_out[-1] == "":
+                cells_out.pop()
+            values.append(cells_out)
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def write(self, cells: str, values: Sequence[Sequence[Any]]) -> None:
+        first_row, first_col, _, _ = _cell_bounds(cells)
+        for offset, row_values in enumerate(values):
+            row_number = first_row + offset
+            while len(self.rows) < row_number:
+                self.rows.append([])
+            row = self.rows[row_number - 1]
+            if first_col - 1 + len(row_values) > self.col_count:
+                raise ValueError(f"Zakres {cells} wykracza poza worksheet {self.title}.")
+            row.extend([""] * (first_col - 1 + len(row_values) - len(row)))
+            row[first_col - 1:first_col - 1 + len(row_values)] = list(row_values)
+
+    def row_values(self, row: int) -> List[str]:
+        self._backend.call("row_values")
+        values = self.read(f"A{row}:ZZ{row}") if row <= len(self.rows) else []
+        return values[0] if values else []
+
+    def col_values(self, col: int) -> List[str]:
+        self._backend.call("col_values")
+        return [str(row[col - 1]) if len(row) >= col else "" for row in self.rows]
+
+    def get_all_values(self) -> List[List[str]]:
+        self._backend.call("get_all_values")
+        return [[str(value) for value in row] for row in self.rows]
+
+    def get_all_records(self) -> List[Dict[str, Any]]:
+        self._backend.call("get_all_records")
+        headers = [str(value) for value in self.rows[0]]
+        return [
+            dict(zip(headers, numericise_all([str(value) for value in (row + [""] * len(headers))[:len(headers)]])))
+            for row in self.rows[1:]
+        ]
+
+    def append_row(self, values: Sequence[Any], value_input_option: Optional[str] = None) -> Dict[str, Any]:
+        self._backend.call("append_row")
+        self.rows.append(list(values))
+        row_number = len(self.rows)
+        return {"updates": {"updatedRange": f"{self.title}!A{row_number}:Z{row_number}"}}
+
+    def append_rows(self, rows: Sequence[Sequence[Any]], value_input_option: Optional[str] = None) -> Dict[str, Any]:
+        self._backend.call("append_rows")
+        first_row = len(self.rows) + 1
+        self.rows.extend(list(values) for values in rows)
+        return {"updates": {"updatedRange": f"{self.title}!A{first_row}:Z{len(self.rows)}"}}
+
+    def update(self, range_name: str, values: Sequence[Sequence[Any]], value_input_option: Optional[str] = None) -> None:
+        self._backend.call("update")
+        self.write(range_name, values)
+
+    def delete_rows(self, start_index: int, end_index: Optional[int] = None) -> None:
+        self._backend.call("delete_rows")
+        del self.rows[start_index - 1:end_index or start_index]
+
+    def batch_clear(self, ranges: Sequence[str]) -> None:
+        self._backend.call("batch_clear")
+        for cells in ranges:
+            first_row, first_col, last_row, last_col = _cell_bounds(cells)
+            for row in self.rows[first_row - 1:last_row or len(self.rows)]:
+                for col in range(first_col - 1, min(last_col or len(row), len(row))):
+                    row[col] = ""
+
+    def add_cols(self, cols: int) -> None:
+        self._backend.call("add_cols")
+        self.col_count += cols
+
+
+class FakeSpreadsheet:
+    def __init__(self, sheets: Dict[str, List[List[Any]]], backend: Optional[FakeBackend] = None):
+        self.backend = backend or FakeBackend()
+        self.sheets = {
+            title: FakeWorksheet(self.backend, title, rows, len(rows[0]) if rows else 26)
+            for title, rows in sheets.items()
+        }
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self.backend.call("worksheet")
+        if title not in self.sheets:
+            raise WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def add_worksheet(self, title: str, rows: int, cols: int) -> FakeWorksheet:
+        self.backend.call("add_worksheet")
+        self.sheets[title] = FakeWorksheet(self.backend, title, [], cols)
+        return self.sheets[title]
+
+    def values_batch_get(self, ranges: Sequence[str], params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self.backend.call("values_batch_get")
+        value_ranges = []
+        for range_name in ranges:
+            title, cells = _split_range(range_name)
+            if title not in self.sheets:
+                # Tak jak API, gdy worksheet jeszcze nie istnieje.
+                raise _api_error(400, f"Unable to parse range: {range_name}", "INVALID_ARGUMENT")
+            value_ranges.append({"range": range_name, "values": self.sheets[title].read(cells)})
+        return {"valueRanges": value_ranges}
+
+    def values_batch_update(self, body: Dict[str, Any]) -> None:
+        self.backend.call("values_batch_update")
+        for data in body["data"]:
+            title, cells = _split_range(data["range"])
+            self.sheets[title].write(cells, data["values"])
+
+
+def synthetic_entry_rows(count: int, patients: int = 50, seed: int = 0) -> List[List[Any]]:
+    """Wiersze worksheet "entries": po jednym wpisie dziennie na pacjenta."""
+    rng = random.Random(seed)
+    start = datetime.datetime(2020, 1, 1, 20, 0)
+    symptoms = ["drżenie", "ból głowy", "napięcie mięśni", "zawroty głowy"]
+    rows = []
+    for index in range(count):
+        day, patient = divmod(index, patients)
+        rows.append(
+            [
+                f"pacjent{patient}",
+                (start + datetime.timedelta(days=day)).strftime("%Y-%m-%d %H:%M"),
+                rng.randint(0, 10),
+                rng.randint(0, 10),
+                ", ".join(rng.sample(symptoms, rng.randint(0, 2))),
+                f"{rng.choice([22, 23, 0, 1])}:{rng.choice(['00', '30'])}",
+                f"0{rng.randint(5, 9)}:00",
+                rng.randint(0, 4),
+                rng.randint(0, 10),
+                rng.randint(0, 10),
+                rng.randint(0, 10),
+                "praca" if rng.random() < 0.6 else "",
+                "zakupy kompulsywne" if rng.random() < 0.05 else "",
+                "Notatka pacjenta " * rng.randint(0, 8),
+                f"{index:032x}",
+                1,
+            ]
+        )
+    return rows
+
+
+def synthetic_spreadsheet(
+    entries: int,
+    patients: int = 50,
+    backend: Optional[FakeBackend] = None,
+) -> FakeSpreadsheet:
+    users = [
+        [google_sheets.DEFAULT_ADMIN_USERNAME, google_sheets.DEFAULT_ADMIN_NAME, google_sheets.DEFAULT_ADMIN_HASH, "admin"],
+        *[[f"pacjent{index}", f"Pacjent {index}", google_sheets.DEFAULT_ADMIN_HASH, "pacjent"] for index in range(patients)],
+    ]
+    return FakeSpreadsheet(
+        {
+            "users": [google_sheets.USERS_HEADERS, *users],
+            "entries": [google_sheets.ENTRIES_HEADERS, *synthetic_entry_rows(entries, patients)],
+            "alerts": [google_sheets.ALERTS_HEADERS],
+        },
+        backend,
+    )
+
+
+def install(spreadsheet: FakeSpreadsheet) -> None:
+    """Podmienia arkusz Google w module google_sheets na atrapę."""
+    google_sheets.get_spreadsheet = lambda: spreadsheet
+    google_sheets.get_worksheet.clear()
+    google_sheets._ensure_worksheet_cached.clear()
+    google_sheets._frame_cache.clear()
+    google_sheets.invalidate_cache()
@@ -0,0 +1,283 @@
+import datetime
+import io
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from instrumentation import span
+
+
+# Można nadpisać w st.secrets w sekcji [charts].
+DEFAULT_CHART_SETTINGS: Dict[str, str] = {
+    # "vega-lite" rysuje wykresy w przeglądarce, "matplotlib" jako obrazy PNG na serwerze.
+    "backend": "vega-lite",
+}
+
+CHART_BACKENDS = ("vega-lite", "matplotlib")
+
+WEEKDAY_LABELS = ["Pn", "Wt", "Śr", "Cz", "Pt", "So", "Nd"]
+MONTH_NAMES = [
+    "styczeń", "luty", "marzec", "kwiecień", "maj", "czerwiec",
+    "lipiec", "sierpień", "wrzesień", "październik", "listopad", "grudzień",
+]
+# Kolor dni bez wartości na kalendarzu.
+EMPTY_DAY_COLOR = "#eeeeee"
+
+# Seria wykresu: (kolumna, podpis w legendzie, znacznik punktów matplotlib albo None).
+ChartSeries = Tuple[str, str, Optional[str]]
+
+
+class ChartConfigError(Exception):
+    """Base exception with a user-facing message for Streamlit."""
+
+
+def get_chart_backend() -> str:
+    settings = dict(DEFAULT_CHART_SETTINGS)
+    try:
+        overrides = dict(st.secrets.get("charts", {}))
+    except Exception:
+        overrides = {}
+    for key, value in overrides.items():
+        if key in settings:
+            settings[key] = str(value).strip().lower()
+
+    if settings["backend"] not in CHART_BACKENDS:
+        raise ChartConfigError(
+            f'st.secrets["charts"]["backend"] musi mieć jedną z wartości: {", ".join(CHART_BACKENDS)}.'
+        )
+    return settings["backend"]
+
+
+def line_chart(
+    points: pd.DataFrame,
+    series: Sequence[ChartSeries],
+    ylabel: str,
+    name: str,
+    backend: str,
+    title: Optional[str] = None,
+    highlight: Optional[pd.Series] = None,
+    highlight_label: str = "",
+) -> None:
+    """Wykres liniowy serii z `points` (indeks dat) i opcjonalnych punktów wyróżnionych na czerwono."""
+    series = [item for item in series if item[0] in points]
+    if highlight is not None and highlight.empty:
+        highlight = None
+    with span(f"wykres: {name}", "chart"):
+        if backend == "matplotlib":
+            _matplotlib_chart(points, series, ylabel, title, highlight, highlight_label)
+        else:
+            _vega_lite_chart(points, series, ylabel, title, highlight, highlight_label)
+
+
+def _matplotlib_chart(
+    points: pd.DataFrame,
+    series: Sequence[ChartSeries],
+    ylabel: str,
+    title: Optional[str],
+    highlight: Optional[pd.Series],
+    highlight_label: str,
+) -> None:
+    # matplotlib jest ładowany dopiero przy pierwszym wykresie i bez pyplot:
+    # figury rysuje bezpośrednio backend Agg, więc nie zostają w pamięci
+    # globalnego menedżera figur.
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    for column, label, marker in series:
+        ax.plot(points.index, points[column], marker=marker, label=label)
+    if highlight is not None:
+        ax.scatter(highlight.index, highlight, color="red", s=60, zorder=5, label=highlight_label)
+
+    ax.set_xlabel("Data")
+    ax.set_ylabel(ylabel)
+    if title:
+        ax.set_title(title)
+    if len(series) > 1 or highlight is not None:
+        ax.legend()
+    ax.tick_params(axis="x", labelrotation=45)
+
+    # Te same ustawienia co w st.pyplot, który sam importuje pyplot.
+    image = io.BytesIO()
+    fig.savefig(image, format="png", bbox_inches="tight", dpi=200)
+    st.image(image, use_column_width=True)
+
+
+def _vega_lite_chart(
+    points: pd.DataFrame,
+    series: Sequence[ChartSeries],
+    ylabel: str,
+    title: Optional[str],
+    highlight: Optional[pd.Series],
+    highlight_label: str,
+) -> None:
+    # Do przeglądarki trafiają tylko punkty w długim formacie (Arrow);
+    # rysowanie, podpowiedzi i przybliżanie obsługuje Vega-Lite.
+    labels = [label for _, label, _ in series]
+    frames = [
+        points[column].rename("Wartość").rename_axis("Data").reset_index().assign(Seria=label)
+        for column, label, _ in series
+    ]
+    if highlight is not None:
+        frames.append(
+            highlight.rename("Wartość").rename_axis("Data").reset_index().assign(Seria=highlight_label)
+        )
+    data = pd.concat(frames, ignore_index=True).dropna(subset=["Wartość"])
+
+    x = {"field": "Data", "type": "temporal", "title": "Data"}
+    y = {"field": "Wartość", "type": "quantitative", "title": ylabel}
+    tooltip = [
+        {"field": "Seria", "type": "nominal"},
+        {"field": "Data", "type": "temporal", "format": "%Y-%m-%d %H:%M"},
+        {"field": "Wartość", "type": "quantitative", "format": ".1f"},
+    ]
+    layers: List[Dict[str, Any]] = [
+        {
+            "transform": [{"filter": {"field": "Seria", "oneOf": labels}}],
+            "mark": {"type": "line", "point": any(marker for _, _, marker in series)},
+            "encoding": {
+                "x": x,
+                "y": y,
+                "color": {"field": "Seria", "type": "nominal", "title": None, "scale": {"domain": labels}},
+                "tooltip": tooltip,
+            },
+            # Przesuwanie i przybliżanie osi czasu kółkiem myszy.
+            "params": [{"name": "zoom", "select": "interval", "bind": "scales"}],
+        }
+    ]
+    if highlight is not None:
+        layers.append(
+            {
+                "transform": [{"filter": {"field": "Seria", "equal": highlight_label}}],
+                "mark": {"type": "point", "filled": True, "size": 80, "color": "red"},
+                "encoding": {"x": x, "y": y, "tooltip": tooltip},
+            }
+        )
+
+    spec: Dict[str, Any] = {"layer": layers}
+    if title:
+        spec["title"] = title
+    st.vega_lite_chart(data, spec, use_container_width=True)
+
+
+def calendar_heatmap(
+    days: pd.DataFrame,
+    month: datetime.date,
+    column: str,
+    label: str,
+    name: str,
+    backend: str,
+    key: str,
+) -> Optional[datetime.date]:
+    """Kalendarz miesiąca z kolorem wartości `column` (skala 0-10) dla dni z indeksu `days`.
+
+    Zwraca dzień kliknięty na kalendarzu; wykres matplotlib nie jest klikalny.
+    """
+    first = pd.Timestamp(month.replace(day=1))
+    dates = pd.date_range(first, first + pd.offsets.MonthEnd(0), freq="D", name="Data")
+    grid = days.reindex(dates)
+    offset = first.dayofweek
+    cells = pd.DataFrame(
+        {
+            "Dzień": dates.strftime("%Y-%m-%d"),
+            "Dzień miesiąca": dates.day,
+            "Tydzień": (dates.day - 1 + offset) // 7,
+            "Dzień tygodnia": [WEEKDAY_LABELS[weekday] for weekday in dates.dayofweek],
+            label: grid[column].to_numpy(),
+            "Wpisy": grid["wpisy"].fillna(0).astype("int64").to_numpy(),
+        }
+    )
+    title = f"{MONTH_NAMES[first.month - 1]} {first.year}"
+    with span(f"kalendarz: {name}", "chart"):
+        if backend == "matplotlib":
+            _matplotlib_calendar(cells, label, title)
+            return None
+        return _vega_lite_calendar(cells, label, title, key)
+
+
+def _matplotlib_calendar(cells: pd.DataFrame, label: str, title: str) -> None:
+    import numpy as np
+    from matplotlib import colormaps
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    weeks = int(cells["Tydzień"].max()) + 1
+    values = np.full((weeks, len(WEEKDAY_LABELS)), np.nan)
+    weekdays = cells["Dzień tygodnia"].map(WEEKDAY_LABELS.index)
+    values[cells["Tydzień"], weekdays] = cells[label]
+
+    fig = Figure(figsize=(6, 0.8 * weeks + 0.8))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    image = ax.imshow(
+        np.ma.masked_invalid(values),
+        cmap=colormaps["RdYlGn"].with_extremes(bad=EMPTY_DAY_COLOR),
+        vmin=0,
+        vmax=10,
+    )
+    for week, weekday, day in zip(cells["Tydzień"], weekdays, cells["Dzień miesiąca"]):
+        ax.text(weekday, week, str(day), ha="center", va="center")
+    ax.set_xticks(range(len(WEEKDAY_LABELS)), WEEKDAY_LABELS)
+    ax.xaxis.tick_top()
+    ax.set_yticks([])
+    ax.set_title(title)
+    fig.colorbar(image, ax=ax, label=label)
+
+    output = io.BytesIO()
+    fig.savefig(output, format="png", bbox_inches="tight", dpi=200)
+    st.image(output, use_column_width=True)
+
+
+def _vega_lite_calendar(cells: pd.DataFrame, label: str, title: str, key: str) -> Optional[datetime.date]:
+    # Zaznaczenia w Streamlit działają tylko na wykresach z jedną warstwą,
+    # więc numery dni są w opisach wierszy tygodni i w podpowiedzi.
+    weeks = cells.groupby("Tydzień")["Dzień miesiąca"].agg(["min", "max"])
+    week_labels = [f"{first}–{last}" for first, last in zip(weeks["min"], weeks["max"])]
+    cells = cells.assign(Dni=[week_labels[week] for week in cells["Tydzień"]])
+    spec: Dict[str, Any] = {
+        "title": title,
+        # Bez "invalid": null Vega-Lite pominęłaby dni bez wartości.
+        "mark": {"type": "rect", "invalid": None, "cornerRadius": 3, "stroke": "white", "cursor": "pointer"},
+        # Dzień jest tekstem, żeby zaznaczenie wracało z przeglądarki bez przesunięcia strefy czasowej.
+        "params": [{"name": "dzien", "select": {"type": "point", "fields": ["Dzień"]}}],
+        "encoding": {
+            "x": {
+                "field": "Dzień tygodnia",
+                "type": "ordinal",
+                "sort": WEEKDAY_LABELS,
+                "title": None,
+                "axis": {"orient": "top", "labelAngle": 0},
+            },
+            "y": {"field": "Dni", "type": "ordinal", "sort": week_labels, "title": None},
+            "color": {
+                "condition": {
+                    "test": f"isValid(datum['{label}'])",
+                    "field": label,
+                    "type": "quantitative",
+                    "scale": {"domain": [0, 10], "scheme": "redyellowgreen"},
+                },
+                "value": EMPTY_DAY_COLOR,
+            },
+            "strokeWidth": {"condition": {"param": "dzien", "empty": False, "value": 3}, "value": 1},
+            "tooltip": [
+                {"field": "Dzień", "type": "nominal"},
+                {"field": label, "type": "quantitative", "format": ".1f"},
+                {"field": "Wpisy", "type": "quantitative"},
+            ],
+        },
+    }
+    event = st.vega_lite_chart(
+        cells,
+        spec,
+        use_container_width=True,
+        key=key,
+        on_select="rerun",
+        selection_mode="dzien",
+    )
+    selected = event.selection.get("dzien") if event is not None else None
+    if not selected:
+        return None
+    return datetime.date.fromisoformat(selected[0]["Dzień"])
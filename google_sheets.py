@@ -1,12 +1,35 @@
+import contextlib
+import contextvars
 import datetime
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import fcntl
+import functools
+import hashlib
+import itertools
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from collections.abc import Sequence as SequenceABC
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlparse
 
 import pandas as pd
+import requests
 import streamlit as st
-from google.auth.exceptions import GoogleAuthError
+from google.auth.exceptions import GoogleAuthError, TransportError
+from google.auth.transport.requests import AuthorizedSession, Request
 from google.oauth2.service_account import Credentials
 import gspread
 from gspread.exceptions import APIError, SpreadsheetNotFound, WorksheetNotFound
+from gspread.utils import a1_to_rowcol, absolute_range_name, numericise_all, rowcol_to_a1
+from requests.adapters import HTTPAdapter
+
+import analytics
+import instrumentation
 
 
 SCOPES = [
@@ -32,7 +55,48 @@ ENTRY_DATA_HEADERS = [
     "Uwagi",
 ]
 
-ENTRIES_HEADERS = ["username", *ENTRY_DATA_HEADERS]
+# Stabilny identyfikator wpisu i numer wersji do optymistycznej kontroli
+# współbieżności. Arkusze sprzed tej zmiany są uzupełniane automatycznie.
+ENTRY_META_HEADERS = ["entry_id", "version"]
+
+LEGACY_ENTRIES_HEADERS = ["username", *ENTRY_DATA_HEADERS]
+
+ENTRIES_HEADERS = [*LEGACY_ENTRIES_HEADERS, *ENTRY_META_HEADERS]
+
+USER_ENTRY_HEADERS = [*ENTRY_DATA_HEADERS, *ENTRY_META_HEADERS]
+
+# Alerty kliniczne wyliczane przy zapisie wpisu. Worksheet jest tylko
+# dopisywany, a admin oznacza alerty jako przejrzane.
+ALERTS_HEADERS = [
+    "alert_id",
+    "username",
+    "entry_id",
+    "Data i czas",
+    "rodzaj",
+    "opis",
+    "utworzono",
+    "przejrzano",
+    "przejrzał",
+]
+
+# Kolumny, których gspread nie powinien zamieniać na liczby.
+TEXT_COLUMNS = {"entry_id", "alert_id"}
+
+WORKSHEET_HEADERS: Dict[str, List[str]] = {
+    "users": USERS_HEADERS,
+    "entries": ENTRIES_HEADERS,
+    "alerts": ALERTS_HEADERS,
+}
+
+# Najdłuższa kolumna wpisów. Zwykły odczyt ją pomija, a widoki, które ją
+# pokazują, czytają ją osobno przez `load_notes`.
+NOTES_COLUMN = "Uwagi"
+
+# Kolumny czytane przy każdym odczycie worksheetów.
+WORKSHEET_COLUMNS: Dict[str, List[str]] = {
+    name: [header for header in headers if header != NOTES_COLUMN]
+    for name, headers in WORKSHEET_HEADERS.items()
+}
 
 ENTRY_NUMERIC_COLUMNS = [
     "Nastrój (0-10)",
@@ -43,6 +107,55 @@ ENTRY_NUMERIC_COLUMNS = [
     "Apetyt (0-10)",
 ]
 
+# Można nadpisać w st.secrets w sekcji [google_sheets_http].
+DEFAULT_HTTP_SETTINGS: Dict[str, float] = {
+    "pool_size": 20,
+    "connect_timeout": 5.0,
+    "read_timeout": 30.0,
+    "token_refresh_margin": 300.0,
+    "token_retry_interval": 30.0,
+}
+
+HTTP_USER_AGENT = "dziennik-nastroju (gzip)"
+
+# Wszystkie worksheety są czytane jednym zapytaniem values_batch_get i mają wspólną
+# wersję danych. Po CACHE_SOFT_TTL_SECONDS dane są odświeżane w tle, a sesje
+# dostają jeszcze poprzednią wersję; po CACHE_TTL_SECONDS trzeba poczekać
+# na nowy odczyt.
+CACHE_SOFT_TTL_SECONDS = 45
+CACHE_TTL_SECONDS = 60
+
+# Katalog wspólny dla kilku procesów Streamlit na jednym serwerze, ustawiany
+# w st.secrets w sekcji [cluster]. Pusty oznacza pracę w jednym procesie.
+SHARED_GENERATION_FILE = "generation"
+# Plik ze wskazaniem na aktualną migawkę worksheetów i blokada jej autora.
+SHARED_SNAPSHOT_POINTER = "snapshot"
+SHARED_SNAPSHOT_LOCK = "snapshot.lock"
+# Migawka młodsza niż to zastępuje odczyt z API w pozostałych procesach;
+# krótko, bo każdy proces trzyma potem dane jeszcze przez CACHE_SOFT_TTL_SECONDS.
+SHARED_SNAPSHOT_MAX_AGE_SECONDS = 15.0
+
+# Limity Google Sheets API na minutę (domyślnie limity na użytkownika, czyli
+# na service account). Można nadpisać w st.secrets w sekcji [google_sheets_quota].
+DEFAULT_QUOTA_SETTINGS: Dict[str, float] = {
+    "read_per_minute": 60.0,
+    "write_per_minute": 60.0,
+    # Część limitu odczytów zostawiana dla zapytań o wysokim priorytecie.
+    "low_priority_reserve": 0.25,
+    # Po tym czasie zapytanie idzie do API mimo braku budżetu.
+    "max_wait_seconds": 10.0,
+}
+
+# Priorytet odczytów: zapisy pacjentów i ich własne odczyty mają pierwszeństwo
+# przed odczytami admina i odświeżaniem cache w tle.
+PRIORITY_HIGH = "high"
+PRIORITY_LOW = "low"
+
+# Można nadpisać w st.secrets w sekcji [cache].
+DEFAULT_CACHE_SETTINGS: Dict[str, float] = {
+    "memory_budget_mb": 256.0,
+}
+
 DEFAULT_ADMIN_USERNAME = "Kasper"
 DEFAULT_ADMIN_NAME = "Lek. Aleksy Kasperowicz"
 DEFAULT_ADMIN_HASH = "$2b$12$ei/CshYLjrjCx5xp0vKZ1.saL2avwM2mel1ySKKrxXjAJy6C3sEQC"
@@ -64,14 +177,30 @@ class GoogleSheetsQuotaError(GoogleSheetsError):
     """Raised when Google Sheets API quota is exceeded."""
 
 
-def _is_quota_error(exc: Exception) -> bool:
+class GoogleSheetsConflictError(GoogleSheetsError):
+    """Raised when a concurrent write changed the rows being modified."""
+
+
+class GoogleSheetsUnavailableError(GoogleSheetsError):
+    """Raised when Google Sheets API fails with a server error (5xx)."""
+
+
+def _status_code(exc: Exception) -> Optional[int]:
     response = getattr(exc, "response", None)
     status_code = getattr(response, "status_code", None)
     error = getattr(exc, "error", None)
-    error_status = ""
     if isinstance(error, dict):
-        error_status = str(error.get("status", ""))
         status_code = status_code or error.get("code")
+    try:
+        return int(status_code) if status_code is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_quota_error(exc: Exception) -> bool:
+    status_code = _status_code(exc)
+    error = getattr(exc, "error", None)
+    error_status = str(error.get("status", "")) if isinstance(error, dict) else ""
 
     message = str(exc)
     return (
@@ -89,6 +218,12 @@ def _api_error_message(action: str, exc: Exception) -> GoogleSheetsError:
             "Przekroczono limit Google Sheets API dla odczytów/zapisów. "
             "Odczekaj 1-2 minuty i odśwież aplikację."
         )
+    status_code = _status_code(exc)
+    if status_code is not None and status_code >= 500:
+        return GoogleSheetsUnavailableError(
+            f"Google Sheets API jest chwilowo niedostępne (błąd {status_code}) "
+            f"podczas operacji: {action}. Spróbuj ponownie za chwilę."
+        )
 
     return GoogleSheetsError(
         f"Google Sheets API zwróciło błąd podczas operacji: {action}. "
@@ -96,6 +231,19 @@ def _api_error_message(action: str, exc: Exception) -> GoogleSheetsError:
     )
 
 
+def is_transient_error(exc: Exception) -> bool:
+    """Czy ponowienie może się udać: limit zapytań, błąd serwera (5xx) albo sieci."""
+    return isinstance(
+        exc,
+        (
+            GoogleSheetsQuotaError,
+            GoogleSheetsUnavailableError,
+            requests.RequestException,
+            TransportError,
+        ),
+    )
+
+
 def _get_secret(key: str) -> Any:
     try:
         value = st.secrets[key]
@@ -154,14 +302,400 @@ def _sheet_id() -> str:
     return str(_get_secret("GOOGLE_SHEET_ID")).strip()
 
 
-@st.cache_resource(show_spinner=False)
+def _get_http_settings() -> Dict[str, float]:
+    settings = dict(DEFAULT_HTTP_SETTINGS)
+    try:
+        overrides = dict(st.secrets.get("google_sheets_http", {}))
+    except Exception:
+        overrides = {}
+
+    for key, value in overrides.items():
+        if key not in settings:
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise GoogleSheetsConfigError(
+                f'st.secrets["google_sheets_http"]["{key}"] musi być liczbą.'
+            )
+        if number <= 0:
+            raise GoogleSheetsConfigError(
+                f'st.secrets["google_sheets_http"]["{key}"] musi być większe od zera.'
+            )
+        settings[key] = number
+    return settings
+
+
+def _get_quota_settings() -> Dict[str, float]:
+    settings = dict(DEFAULT_QUOTA_SETTINGS)
+    try:
+        overrides = dict(st.secrets.get("google_sheets_quota", {}))
+    except Exception:
+        overrides = {}
+
+    for key, value in overrides.items():
+        if key not in settings:
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise GoogleSheetsConfigError(
+                f'st.secrets["google_sheets_quota"]["{key}"] musi być liczbą.'
+            )
+        if number < 0 or (number == 0 and key.endswith("_per_minute")):
+            raise GoogleSheetsConfigError(
+                f'st.secrets["google_sheets_quota"]["{key}"] ma nieprawidłową wartość.'
+            )
+        settings[key] = number
+    if settings["low_priority_reserve"] >= 1:
+        raise GoogleSheetsConfigError(
+            'st.secrets["google_sheets_quota"]["low_priority_reserve"] musi być mniejsze od 1.'
+        )
+    return settings
+
+
+def _get_cache_settings() -> Dict[str, float]:
+    settings = dict(DEFAULT_CACHE_SETTINGS)
+    try:
+        overrides = dict(st.secrets.get("cache", {}))
+    except Exception:
+        overrides = {}
+
+    for key, value in overrides.items():
+        if key not in settings:
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise GoogleSheetsConfigError(f'st.secrets["cache"]["{key}"] musi być liczbą.')
+        if number <= 0:
+            raise GoogleSheetsConfigError(
+                f'st.secrets["cache"]["{key}"] musi być większe od zera.'
+            )
+        settings[key] = number
+    return settings
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_dir() -> Optional[str]:
+    try:
+        shared_dir = str(dict(st.secrets.get("cluster", {})).get("shared_dir", "")).strip()
+    except Exception:
+        shared_dir = ""
+    if not shared_dir:
+        return None
+    try:
+        os.makedirs(shared_dir, exist_ok=True)
+    except OSError as exc:
+        raise GoogleSheetsConfigError(
+            f'Nie można utworzyć katalogu st.secrets["cluster"]["shared_dir"]: {exc}'
+        )
+    return shared_dir
+
+
+def _token_request() -> Request:
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+    return Request(session)
+
+
+def _authorized_session(
+    credentials: Credentials,
+    auth_request: Request,
+    settings: Dict[str, float],
+) -> AuthorizedSession:
+    session = AuthorizedSession(
+        credentials,
+        auth_request=auth_request,
+        refresh_timeout=settings["read_timeout"],
+    )
+    # Jedna pula połączeń keep-alive dla wszystkich sesji Streamlit.
+    pool_size = int(settings["pool_size"])
+    session.mount(
+        "https://",
+        HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size),
+    )
+    session.headers.update(
+        {
+            "Accept-Encoding": "gzip",
+            "User-Agent": HTTP_USER_AGENT,
+        }
+    )
+
+    # Każde wywołanie API (gspread używa tylko session.request) przechodzi
+    # przez limiter i trafia do pomiarów.
+    request = session.request
+
+    @functools.wraps(request)
+    def timed_request(method: str, url: str, *args: Any, **kwargs: Any):
+        kind = "read" if method.upper() == "GET" else "write"
+        _get_quota_governor().acquire(kind, _request_priority.get())
+        instrumentation.count(f"api.{kind}")
+        with instrumentation.span(f"sheets {method.upper()} {_api_operation(url)}", "api"):
+            return request(method, url, *args, **kwargs)
+
+    session.request = timed_request
+    return session
+
+
+def _api_operation(url: str) -> str:
+    path = urlparse(url).path
+    segment = path.rstrip("/").rsplit("/", 1)[-1]
+    action = segment.rsplit(":", 1)[-1] if ":" in segment else ""
+    if not action.isalpha():
+        action = "values" if "/values/" in path else "metadata"
+    return action
+
+
+class _TokenRefresher:
+    """Odświeża token OAuth w tle, zanim wygaśnie."""
+
+    def __init__(self, credentials: Credentials, request: Request, settings: Dict[str, float]):
+        self._credentials = credentials
+        self._request = request
+        self._margin = settings["token_refresh_margin"]
+        self._retry_interval = settings["token_retry_interval"]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="google-sheets-token-refresh",
+            daemon=True,
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _seconds_until_refresh(self) -> float:
+        expiry = self._credentials.expiry
+        if not self._credentials.token or expiry is None:
+            return 0.0
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        remaining = (expiry - now).total_seconds()
+        return max(remaining - self._margin, 0.0)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._seconds_until_refresh()):
+            try:
+                self._credentials.refresh(self._request)
+            except Exception:
+                # Zapytanie w wątku sesji i tak odświeży token, jeśli tu się nie uda.
+                self._stop.wait(self._retry_interval)
+
+
+_token_refresher: Optional[_TokenRefresher] = None
+_token_refresher_lock = threading.Lock()
+
+
+def _restart_token_refresher(
+    credentials: Credentials,
+    auth_request: Request,
+    settings: Dict[str, float],
+) -> None:
+    global _token_refresher
+    with _token_refresher_lock:
+        if _token_refresher is not None:
+            _token_refresher.stop()
+        _token_refresher = _TokenRefresher(credentials, auth_request, settings)
+        _token_refresher.start()
+
+
+_request_priority: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "google_sheets_request_priority", default=PRIORITY_HIGH
+)
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: float, reserve: float):
+        self.capacity = per_minute
+        self.reserve = per_minute * reserve
+        self.tokens = per_minute
+        self._rate = per_minute / 60
+        self._updated = time.monotonic()
+        self._calls: deque = deque()
+        self.delayed = 0
+        self.forced = 0
+
+    @contextlib.contextmanager
+    def _state(self) -> Iterator[None]:
+        # Stan lokalny dla procesu; _SharedTokenBucket trzyma go w pliku.
+        yield
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        while self._calls and self._calls[0] < now - 60:
+            self._calls.popleft()
+
+    def _floor(self, priority: str) -> float:
+        return self.reserve if priority == PRIORITY_LOW else 0.0
+
+    def has_budget(self, priority: str) -> bool:
+        with self._state():
+            self._refill(time.monotonic())
+            return self.tokens - 1 >= self._floor(priority)
+
+    def try_take(self, priority: str) -> float:
+        """Zwraca 0, jeśli pobrano token, albo czas oczekiwania na niego w sekundach."""
+        with self._state():
+            now = time.monotonic()
+            self._refill(now)
+            floor = self._floor(priority)
+            if self.tokens - 1 >= floor:
+                self._take(now)
+                return 0.0
+            return (floor + 1 - self.tokens) / self._rate
+
+    def take(self) -> None:
+        with self._state():
+            self._take(time.monotonic())
+
+    def _take(self, now: float) -> None:
+        self.tokens -= 1
+        self._calls.append(now)
+
+    def usage(self) -> Dict[str, float]:
+        with self._state():
+            self._refill(time.monotonic())
+            return {
+                "limit_per_minute": self.capacity,
+                "used_last_minute": len(self._calls),
+                "available": round(max(self.tokens, 0.0), 1),
+                "delayed": self.delayed,
+                "over_budget": self.forced,
+            }
+
+
+class _SharedTokenBucket(_TokenBucket):
+    """Token bucket wspólny dla procesów: tokeny i czas uzupełnienia leżą w pliku.
+
+    Limit API dotyczy całego service account, więc przy kilku procesach za
+    nginx każdy z nich pobiera tokeny z tej samej puli (pod blokadą pliku).
+    time.monotonic() na Linuksie jest wspólny dla procesów jednej maszyny.
+    Liczniki w `usage()` poza "available" dotyczą tylko bieżącego procesu.
+    """
+
+    def __init__(self, per_minute: float, reserve: float, path: str):
+        super().__init__(per_minute, reserve)
+        self._handle = open(path, "a+", encoding="utf-8")
+
+    @contextlib.contextmanager
+    def _state(self) -> Iterator[None]:
+        fcntl.flock(self._handle.fileno(), fcntl.LOCK_EX)
+        try:
+            self._handle.seek(0)
+            stored = self._handle.read().split()
+            if len(stored) == 2:
+                self.tokens, self._updated = float(stored[0]), float(stored[1])
+            yield
+            self._handle.seek(0)
+            self._handle.truncate()
+            self._handle.write(f"{self.tokens!r} {self._updated!r}")
+            self._handle.flush()
+        finally:
+            fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+
+
+class _QuotaGovernor:
+    """Limiter zapytań do Sheets API (token bucket osobno dla odczytów i zapisów).
+
+    Zapytania o niskim priorytecie nie mogą zejść poniżej rezerwy, więc
+    odczyty admina i odświeżanie w tle czekają jako pierwsze.
+    """
+
+    def __init__(self, settings: Dict[str, float], shared_dir: Optional[str] = None):
+        def bucket(kind: str, reserve: float) -> _TokenBucket:
+            if shared_dir is None:
+                return _TokenBucket(settings[f"{kind}_per_minute"], reserve)
+            return _SharedTokenBucket(
+                settings[f"{kind}_per_minute"],
+                reserve,
+                os.path.join(shared_dir, f"quota-{kind}"),
+            )
+
+        self._buckets = {
+            "read": bucket("read", settings["low_priority_reserve"]),
+            # Zapisy zawsze mają wysoki priorytet, rezerwa ich nie dotyczy.
+            "write": bucket("write", 0.0),
+        }
+        self._max_wait = settings["max_wait_seconds"]
+        self._lock = threading.Lock()
+
+    def has_budget(self, kind: str, priority: str) -> bool:
+        with self._lock:
+            return self._buckets[kind].has_budget(priority)
+
+    def acquire(self, kind: str, priority: str) -> None:
+        bucket = self._buckets[kind]
+        deadline = time.monotonic() + self._max_wait
+        delayed = False
+        while True:
+            with self._lock:
+                wait = bucket.try_take(priority)
+                if wait == 0:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Lepiej spróbować i ewentualnie dostać 429, niż blokować sesję bez końca.
+                    bucket.take()
+                    bucket.forced += 1
+                    return
+                if not delayed:
+                    bucket.delayed += 1
+                    delayed = True
+            instrumentation.count(f"quota.{kind}.delayed")
+            time.sleep(min(wait, remaining))
+
+    def usage(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {kind: bucket.usage() for kind, bucket in self._buckets.items()}
+
+
+def _shared_resource(func):
+    """Jak st.cache_resource, ale działa też w wątkach w tle.
+
+    st.cache_resource bez ScriptRunContext za każdym razem wywołuje funkcję
+    od nowa, a odczyty w tle i kolejka zapisów działają poza sesją Streamlit.
+    """
+    cache: Dict[Tuple[Any, ...], Any] = {}
+    lock = threading.Lock()
+
+    @functools.wraps(func)
+    def wrapper(*args: Any) -> Any:
+        with lock:
+            if args not in cache:
+                cache[args] = func(*args)
+            return cache[args]
+
+    wrapper.clear = cache.clear  # type: ignore[attr-defined]
+    return wrapper
+
+
+@_shared_resource
+def _get_quota_governor() -> _QuotaGovernor:
+    return _QuotaGovernor(_get_quota_settings(), _shared_dir())
+
+
+def quota_usage() -> Dict[str, Dict[str, float]]:
+    return _get_quota_governor().usage()
+
+
+@_shared_resource
 def get_google_client():
     try:
+        settings = _get_http_settings()
         credentials = Credentials.from_service_account_info(
             _get_service_account_info(),
             scopes=SCOPES,
         )
-        return gspread.authorize(credentials)
+        auth_request = _token_request()
+        session = _authorized_session(credentials, auth_request, settings)
+        client = gspread.authorize(None, session=session)
+        client.set_timeout((settings["connect_timeout"], settings["read_timeout"]))
+        _restart_token_refresher(credentials, auth_request, settings)
+        return client
     except GoogleSheetsConfigError:
         raise
     except GoogleAuthError as exc:
@@ -177,7 +711,7 @@ def get_google_client():
         )
 
 
-@st.cache_resource(show_spinner=False)
+@_shared_resource
 def get_spreadsheet():
     sheet_id = _sheet_id()
     try:
@@ -191,7 +725,7 @@ def get_spreadsheet():
         raise _api_error_message("otwieranie arkusza", exc)
 
 
-@st.cache_resource(show_spinner=False)
+@_shared_resource
 def get_worksheet(sheet_name: str):
     try:
         return get_spreadsheet().worksheet(sheet_name)
@@ -201,14 +735,21 @@ def get_worksheet(sheet_name: str):
         raise _api_error_message(f'odczyt worksheet "{sheet_name}"', exc)
 
 
+# Nagłówki sprawdzone przy zbiorczym odczycie nie wymagają osobnego row_values(1).
+_validated_headers: Set[Tuple[str, Tuple[str, ...]]] = set()
+
+
 def ensure_worksheet(sheet_name: str, headers: Sequence[str]):
     return _ensure_worksheet_cached(sheet_name, tuple(headers))
 
 
-@st.cache_resource(show_spinner=False)
+@_shared_resource
 def _ensure_worksheet_cached(sheet_name: str, headers: Tuple[str, ...]):
+    return _prepare_worksheet(get_spreadsheet(), sheet_name, headers)
+
+
+def _prepare_worksheet(spreadsheet, sheet_name: str, headers: Tuple[str, ...]):
     try:
-        spreadsheet = get_spreadsheet()
         try:
             worksheet = spreadsheet.worksheet(sheet_name)
         except WorksheetNotFound:
@@ -224,20 +765,19 @@ def _ensure_worksheet_cached(sheet_name: str, headers: Tuple[str, ...]):
                     f"Szczegóły: {exc}"
                 )
 
+        if (sheet_name, headers) in _validated_headers:
+            return worksheet
+
         current_headers = worksheet.row_values(1)
         if not current_headers:
             worksheet.append_row(list(headers), value_input_option="RAW")
             return worksheet
 
-        expected_headers = list(headers)
-        if current_headers != expected_headers:
-            expected = ", ".join(expected_headers)
-            found = ", ".join(current_headers)
-            raise GoogleSheetsHeaderError(
-                f'Worksheet "{sheet_name}" ma nieprawidłowe nagłówki. '
-                f"Oczekiwane: {expected}. Obecne: {found}."
-            )
+        if sheet_name == "entries" and current_headers == LEGACY_ENTRIES_HEADERS:
+            _migrate_entries_headers(worksheet)
+            current_headers = list(ENTRIES_HEADERS)
 
+        _check_headers(sheet_name, current_headers, headers)
         return worksheet
     except GoogleSheetsError:
         raise
@@ -245,16 +785,702 @@ def _ensure_worksheet_cached(sheet_name: str, headers: Tuple[str, ...]):
         raise _api_error_message(f'przygotowanie worksheet "{sheet_name}"', exc)
 
 
-@st.cache_data(ttl=60)
-def load_users_config() -> Dict[str, Any]:
-    worksheet = ensure_worksheet("users", USERS_HEADERS)
+def _migrate_entries_headers(worksheet) -> None:
+    if worksheet.col_count < len(ENTRIES_HEADERS):
+        worksheet.add_cols(len(ENTRIES_HEADERS) - worksheet.col_count)
+    first = rowcol_to_a1(1, len(LEGACY_ENTRIES_HEADERS) + 1)
+    last = rowcol_to_a1(1, len(ENTRIES_HEADERS))
+    worksheet.update(
+        range_name=f"{first}:{last}",
+        values=[ENTRY_META_HEADERS],
+        value_input_option="RAW",
+    )
+
+
+def _check_headers(sheet_name: str, current_headers: Sequence[Any], headers: Sequence[str]) -> None:
+    current = [str(value) for value in current_headers]
+    expected_headers = list(headers)
+    if current != expected_headers:
+        expected = ", ".join(expected_headers)
+        found = ", ".join(current)
+        raise GoogleSheetsHeaderError(
+            f'Worksheet "{sheet_name}" ma nieprawidłowe nagłówki. '
+            f"Oczekiwane: {expected}. Obecne: {found}."
+        )
+    _validated_headers.add((sheet_name, tuple(headers)))
+
+
+class _Flight:
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.done = threading.Event()
+        self.value: Any = None
+        self.version = 0
+        self.error: Optional[Exception] = None
+
+
+class _SingleFlightCache:
+    """Wspólny dla procesu cache odczytów z jednym zapytaniem na klucz naraz."""
+
+    def __init__(self, soft_ttl: float, hard_ttl: float):
+        self._soft_ttl = soft_ttl
+        self._hard_ttl = hard_ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Any, int, float]] = {}
+        self._sizes: Dict[str, int] = {}
+        # Ostatni odczyt każdego klucza, zachowany także po unieważnieniu.
+        self._latest: Dict[str, Tuple[Any, int]] = {}
+        self._inflight: Dict[str, _Flight] = {}
+        self._generation = 0
+        self._versions = itertools.count(1)
+
+    def get(self, key: str, fetch) -> Tuple[Any, int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, version, fetched_at = entry
+                age = time.monotonic() - fetched_at
+                if age < self._soft_ttl:
+                    instrumentation.count(f"cache.{key}.hit")
+                    return value, version
+                if age < self._hard_ttl or (
+                    _request_priority.get() == PRIORITY_LOW
+                    and not _get_quota_governor().has_budget("read", PRIORITY_LOW)
+                ):
+                    # Odczyt o niskim priorytecie bez budżetu dostaje starsze dane.
+                    instrumentation.count(f"cache.{key}.stale")
+                    if key not in self._inflight and _get_quota_governor().has_budget(
+                        "read", PRIORITY_LOW
+                    ):
+                        flight = self._inflight[key] = _Flight(self._generation)
+                        threading.Thread(
+                            target=self._run_low_priority,
+                            args=(key, flight, fetch),
+                            name=f"google-sheets-refresh-{key}",
+                            daemon=True,
+                        ).start()
+                    return value, version
+
+            instrumentation.count(f"cache.{key}.miss")
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight(self._generation)
+
+        if leader:
+            self._run(key, flight, fetch)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value, flight.version
+
+    def _run_low_priority(self, key: str, flight: _Flight, fetch) -> None:
+        _request_priority.set(PRIORITY_LOW)
+        self._run(key, flight, fetch)
+
+    def _run(self, key: str, flight: _Flight, fetch) -> None:
+        started_at = time.monotonic()
+        try:
+            value = fetch()
+            size = _cached_value_size(value)
+        except Exception as exc:
+            flight.error = exc
+        else:
+            with self._lock:
+                flight.value = value
+                flight.version = next(self._versions)
+                if flight.generation == self._generation:
+                    self._entries[key] = (value, flight.version, started_at)
+                    self._sizes[key] = size
+                    self._latest[key] = (value, flight.version)
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.done.set()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._sizes.clear()
+            self._inflight.clear()
+
+    def latest(self, key: str) -> Optional[Tuple[Any, int]]:
+        """Ostatni odczyt klucza bez względu na wiek i unieważnienia, bez zapytania do API."""
+        with self._lock:
+            return self._latest.get(key)
+
+    def memory_usage(self) -> int:
+        """Przybliżony rozmiar trzymanych odczytów w bajtach."""
+        with self._lock:
+            return sum(self._sizes.values())
+
+
+def _sampled_mean(values: Sequence[Any], size_of) -> float:
+    # Pomiar co n-tego elementu wystarcza przy jednorodnych rekordach.
+    sample = values[:: max(len(values) // 256, 1)]
+    return sum(size_of(value) for value in sample) / len(sample) if sample else 0.0
+
+
+def _record_size(record: Dict[str, Any]) -> int:
+    # Klucze rekordów to wspólne napisy nagłówków, więc liczą się tylko wartości.
+    return sys.getsizeof(record) + sum(sys.getsizeof(value) for value in record.values())
+
+
+def _cached_value_size(value: Any) -> int:
+    """Przybliżony rozmiar odczytu: rekordów worksheetów albo uwag po entry_id."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if isinstance(item, list):
+                size += sys.getsizeof(item) + int(_sampled_mean(item, _record_size) * len(item))
+        texts = [(key, item) for key, item in value.items() if isinstance(item, str)]
+        size += int(
+            _sampled_mean(texts, lambda pair: sys.getsizeof(pair[0]) + sys.getsizeof(pair[1]))
+            * len(texts)
+        )
+    return size
+
+
+_records_cache = _SingleFlightCache(CACHE_SOFT_TTL_SECONDS, CACHE_TTL_SECONDS)
+
+
+# Ramki z _frame_cache są współdzielone przez sesje bez kopiowania danych.
+# Copy-on-write sprawia, że zmiana w jednej sesji kopiuje tylko zmieniany blok
+# i nie jest widoczna w pozostałych.
+pd.set_option("mode.copy_on_write", True)
+
+
+class _SharedFrameCache:
+    """Wspólne dla procesu ramki danych z limitem pamięci i usuwaniem LRU.
+
+    Limit obejmuje też surowe rekordy z _records_cache, z których ramki powstają.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames: "OrderedDict[Tuple[Any, ...], pd.DataFrame]" = OrderedDict()
+        self._sizes: Dict[Tuple[Any, ...], int] = {}
+        self._used = 0
+        self._budget: Optional[int] = None
+
+    def get(self, version: int, key: Tuple[Any, ...], build) -> pd.DataFrame:
+        cache_key = (version, *key)
+        with self._lock:
+            frame = self._frames.get(cache_key)
+            if frame is not None:
+                self._frames.move_to_end(cache_key)
+                instrumentation.count("cache.frames.hit")
+                return frame.copy(deep=False)
+
+        instrumentation.count("cache.frames.miss")
+        if self._budget is None:
+            self._budget = int(_get_cache_settings()["memory_budget_mb"] * 1024 * 1024)
+        frame = build()
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+
+        with self._lock:
+            # Starsze wersje danych nie będą już potrzebne po odczycie nowszej.
+            for old_key in [k for k in self._frames if k[0] < version]:
+                self._drop(old_key)
+            if cache_key in self._frames:
+                self._drop(cache_key)
+            self._frames[cache_key] = frame
+            self._sizes[cache_key] = size
+            self._used += size
+            while self._used + _records_cache.memory_usage() > self._budget and len(self._frames) > 1:
+                self._drop(next(iter(self._frames)))
+        return frame.copy(deep=False)
+
+    def _drop(self, cache_key: Tuple[Any, ...]) -> None:
+        del self._frames[cache_key]
+        self._used -= self._sizes.pop(cache_key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames.clear()
+            self._sizes.clear()
+            self._used = 0
+
+
+_frame_cache = _SharedFrameCache()
+
+
+def _invalidate_local_cache() -> None:
+    _records_cache.invalidate()
+    st.cache_data.clear()
+
+
+# Unieważnienie cache po zapisie jest rozgłaszane do pozostałych procesów przez
+# podmianę pliku SHARED_GENERATION_FILE; każdy proces sprawdza go przed odczytem.
+_generation_lock = threading.Lock()
+_seen_generation: Optional[Tuple[int, int]] = None
+
+
+def _generation_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _sync_shared_generation() -> None:
+    global _seen_generation
+    shared_dir = _shared_dir()
+    if shared_dir is None:
+        return
+    stamp = _generation_stamp(os.path.join(shared_dir, SHARED_GENERATION_FILE))
+    with _generation_lock:
+        if stamp == _seen_generation:
+            return
+        _seen_generation = stamp
+    _invalidate_local_cache()
+
+
+def _broadcast_invalidation() -> None:
+    global _seen_generation
+    shared_dir = _shared_dir()
+    if shared_dir is None:
+        return
+    path = os.path.join(shared_dir, SHARED_GENERATION_FILE)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        handle.write(uuid.uuid4().hex)
+    os.replace(temp_path, path)
+    with _generation_lock:
+        _seen_generation = _generation_stamp(path)
+
+
+def invalidate_cache() -> None:
+    _invalidate_local_cache()
+    _broadcast_invalidation()
+
+
+def _column_letter(column: int) -> str:
+    return rowcol_to_a1(1, column)[:-1]
+
+
+def _column_ranges(sheet_name: str, columns: Sequence[str]) -> List[Tuple[str, int]]:
+    """Zakresy całych kolumn (np. A:M i O:P) z kolumnami `columns` i ich szerokości."""
+    positions = [
+        index
+        for index, header in enumerate(WORKSHEET_HEADERS[sheet_name], start=1)
+        if header in columns
+    ]
+    runs: List[List[int]] = []
+    for position in positions:
+        if runs and runs[-1][1] == position - 1:
+            runs[-1][1] = position
+        else:
+            runs.append([position, position])
+    return [
+        (absolute_range_name(sheet_name, f"{_column_letter(first)}:{_column_letter(last)}"), last - first + 1)
+        for first, last in runs
+    ]
+
+
+def _join_columns(parts: Sequence[Tuple[Sequence[Sequence[Any]], int]]) -> Iterator[List[Any]]:
+    """Kolejne wiersze sklejone z kilku zakresów kolumn.
+
+    API pomija puste końcówki wierszy i zakresów, więc brakujące komórki są
+    uzupełniane pustymi wartościami. Wiersze powstają po jednym, żeby nie
+    trzymać w pamięci drugiej kopii całego worksheetu.
+    """
+    height = max((len(values) for values, _ in parts), default=0)
+    for index in range(height):
+        row: List[Any] = []
+        for values, width in parts:
+            part = values[index] if index < len(values) else []
+            row.extend(part[:width])
+            row.extend([""] * (width - len(part)))
+        yield row
+
+
+def _records_from_values(headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+    width = len(headers)
+    ignore = [index for index, header in enumerate(headers, start=1) if header in TEXT_COLUMNS]
+    records = []
+    for row in rows:
+        padded = list(row[:width]) + [""] * (width - len(row))
+        records.append(dict(zip(headers, numericise_all(padded, ignore=ignore))))
+    return records
+
+
+def _new_entry_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _backfill_entry_ids(spreadsheet, records: List[Dict[str, Any]]) -> None:
+    missing = [
+        (row_number, record)
+        for row_number, record in enumerate(records, start=2)
+        if str(record.get("username", "")).strip() and not record.get("entry_id")
+    ]
+    if not missing:
+        return
+
+    # Numery wierszy pochodzą z odczytu, a równoległe usunięcie mogło je
+    # przesunąć: przed zapisem sprawdzamy, czy pod każdym numerem nadal jest
+    # ten sam wpis bez identyfikatora.
+    id_column = _column_letter(ENTRIES_HEADERS.index("entry_id") + 1)
+    try:
+        response = spreadsheet.values_batch_get(
+            [
+                absolute_range_name("entries", "A:B"),
+                absolute_range_name("entries", f"{id_column}:{id_column}"),
+            ]
+        )
+    except APIError as exc:
+        raise _api_error_message('sprawdzanie wierszy bez identyfikatora w "entries"', exc)
+    keys, ids = (value_range.get("values", []) for value_range in response.get("valueRanges", []))
+
+    last = _column_letter(len(ENTRIES_HEADERS))
+    data = []
+    for row_number, record in missing:
+        key = keys[row_number - 1] if row_number <= len(keys) else []
+        current_id = ids[row_number - 1] if row_number <= len(ids) else []
+        expected = [str(record.get("username", "")), str(record.get("Data i czas", ""))]
+        if [str(value) for value in key[:2]] != expected or any(current_id):
+            continue
+        record["entry_id"] = _new_entry_id()
+        record["version"] = 1
+        data.append(
+            {
+                "range": absolute_range_name(
+                    "entries", f"{id_column}{row_number}:{last}{row_number}"
+                ),
+                "values": [[record["entry_id"], record["version"]]],
+            }
+        )
+    if not data:
+        return
+    try:
+        spreadsheet.values_batch_update({"valueInputOption": "RAW", "data": data})
+    except APIError as exc:
+        raise _api_error_message('nadawanie identyfikatorów wpisom w "entries"', exc)
+
+
+def _is_missing_range_error(exc: APIError) -> bool:
+    return "Unable to parse range" in str(exc)
+
+
+def _batch_get_worksheets(spreadsheet) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    names = list(WORKSHEET_HEADERS)
+    ranges = {name: _column_ranges(name, WORKSHEET_COLUMNS[name]) for name in names}
+    try:
+        response = spreadsheet.values_batch_get(
+            [range_name for name in names for range_name, _ in ranges[name]]
+        )
+    except APIError as exc:
+        if _is_missing_range_error(exc):
+            return None
+        raise _api_error_message("zbiorczy odczyt worksheetów", exc)
+
+    value_ranges = iter(response.get("valueRanges", []))
+    records: Dict[str, List[Dict[str, Any]]] = {}
+    for name in names:
+        headers = WORKSHEET_COLUMNS[name]
+        parts = [(next(value_ranges, {}).get("values", []), width) for _, width in ranges[name]]
+        # Pusty nagłówek któregoś zakresu to brak worksheetu, pusty arkusz
+        # albo stary układ "entries" bez kolumn entry_id i version.
+        if any(not values or not values[0] for values, _ in parts):
+            return None
+        rows = _join_columns(parts)
+        _check_headers(name, next(rows), headers)
+        records[name] = _records_from_values(headers, rows)
+    if len(records) != len(names):
+        return None
+    _backfill_entry_ids(spreadsheet, records["entries"])
+    return records
+
+
+def _fetch_worksheets_from_api() -> Dict[str, List[Dict[str, Any]]]:
+    spreadsheet = get_spreadsheet()
+    records = _batch_get_worksheets(spreadsheet)
+    if records is None:
+        # Brakujący worksheet, pusty wiersz nagłówków albo stary układ "entries":
+        # przygotowujemy worksheety i czytamy ponownie.
+        for name, headers in WORKSHEET_HEADERS.items():
+            _prepare_worksheet(spreadsheet, name, tuple(headers))
+        records = _batch_get_worksheets(spreadsheet)
+    if records is None:
+        raise GoogleSheetsError(
+            "Nie udało się odczytać worksheetów "
+            f"{', '.join(WORKSHEET_HEADERS)} po ich przygotowaniu."
+        )
+    return records
+
+
+def _fetch_worksheets() -> Dict[str, Sequence[Dict[str, Any]]]:
+    shared_dir = _shared_dir()
+    if shared_dir is None:
+        return _fetch_worksheets_from_api()
+    return _shared_worksheets(shared_dir)
+
+
+class _SnapshotRecords(SequenceABC):
+    """Rekordy "entries" z migawki Arrow; słowniki powstają dopiero przy pierwszym użyciu.
+
+    Ramka wszystkich wpisów jest mapowana wprost z migawki, więc proces, który
+    tylko wyświetla dane, nie tworzy własnej kopii rekordów.
+    """
+
+    def __init__(self, table, frame_table):
+        self._table = table
+        self._frame_table = frame_table
+        self._lock = threading.Lock()
+        self._records: Optional[List[Dict[str, Any]]] = None
+
+    def _materialized(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self._records is None:
+                self._records = _records_from_values(
+                    WORKSHEET_COLUMNS["entries"], _table_rows(self._table)
+                )
+            return self._records
+
+    def __len__(self) -> int:
+        return self._table.num_rows
+
+    def __getitem__(self, index):
+        return self._materialized()[index]
+
+    def __iter__(self):
+        return iter(self._materialized())
+
+    def frame(self) -> pd.DataFrame:
+        import pyarrow as pa
+
+        # Kolumny tekstowe zostają w buforach Arrow z mapowanego pliku.
+        return self._frame_table.to_pandas(
+            types_mapper=lambda arrow_type: pd.ArrowDtype(arrow_type)
+            if pa.types.is_string(arrow_type)
+            else None
+        )
+
+
+def _table_rows(table) -> Iterator[Tuple[Any, ...]]:
+    return zip(*(column.to_pylist() for column in table.columns))
+
+
+def _shared_generation_token(shared_dir: str) -> str:
     try:
-        records = worksheet.get_all_records()
+        with open(os.path.join(shared_dir, SHARED_GENERATION_FILE), encoding="utf-8") as handle:
+            return handle.read().strip() or "0"
+    except FileNotFoundError:
+        return "0"
+
+
+def _fresh_snapshot(shared_dir: str, generation: str) -> Optional[str]:
+    pointer = os.path.join(shared_dir, SHARED_SNAPSHOT_POINTER)
+    try:
+        age = time.time() - os.stat(pointer).st_mtime
+        with open(pointer, encoding="utf-8") as handle:
+            name = handle.read().strip()
+    except FileNotFoundError:
+        return None
+    if not name.startswith(f"snapshot-{generation}-") or age >= SHARED_SNAPSHOT_MAX_AGE_SECONDS:
+        return None
+    return os.path.join(shared_dir, name)
+
+
+def _arrow_text_column(values: Iterable[Any]):
+    import pyarrow as pa
+
+    return pa.array([None if pd.isna(value) else str(value) for value in values], pa.string())
+
+
+def _write_snapshot(shared_dir: str, generation: str, records: Dict[str, List[Dict[str, Any]]]) -> str:
+    import pyarrow as pa
+
+    tables = {
+        name: pa.table(
+            {
+                column: _arrow_text_column(record.get(column, "") for record in records[name])
+                for column in WORKSHEET_COLUMNS[name]
+            }
+        )
+        for name in WORKSHEET_HEADERS
+    }
+    frame = _entries_dataframe(records["entries"], include_username=True)
+    tables["entries-frame"] = pa.table(
+        {
+            column: _arrow_text_column(frame[column])
+            if frame[column].dtype == object
+            else pa.Array.from_pandas(frame[column])
+            for column in frame.columns
+        }
+    )
+
+    name = f"snapshot-{generation}-{uuid.uuid4().hex}"
+    path = os.path.join(shared_dir, name)
+    os.makedirs(path)
+    for table_name, table in tables.items():
+        with pa.OSFile(os.path.join(path, f"{table_name}.arrow"), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    pointer = os.path.join(shared_dir, SHARED_SNAPSHOT_POINTER)
+    with open(f"{pointer}.tmp", "w", encoding="utf-8") as handle:
+        handle.write(name)
+    os.replace(f"{pointer}.tmp", pointer)
+
+    # Poprzednia migawka zostaje dla procesów, które właśnie ją otwierają.
+    snapshots = sorted(
+        (entry for entry in os.scandir(shared_dir) if entry.is_dir() and entry.name.startswith("snapshot-")),
+        key=lambda entry: entry.stat().st_mtime_ns,
+    )
+    for entry in snapshots[:-2]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+    return path
+
+
+def _read_snapshot(path: str) -> Dict[str, Sequence[Dict[str, Any]]]:
+    import pyarrow as pa
+
+    def table(name: str):
+        return pa.ipc.open_file(pa.memory_map(os.path.join(path, f"{name}.arrow"))).read_all()
+
+    records: Dict[str, Sequence[Dict[str, Any]]] = {
+        name: _records_from_values(WORKSHEET_COLUMNS[name], _table_rows(table(name)))
+        for name in WORKSHEET_HEADERS
+        if name != "entries"
+    }
+    records["entries"] = _SnapshotRecords(table("entries"), table("entries-frame"))
+    return records
+
+
+def _shared_worksheets(shared_dir: str) -> Dict[str, Sequence[Dict[str, Any]]]:
+    """Worksheety z migawki wspólnej dla procesów (pliki Arrow mapowane do pamięci).
+
+    Migawka jest przypisana do wersji danych z pliku SHARED_GENERATION_FILE,
+    więc zapis w dowolnym procesie ją unieważnia. Odczyt z API wykonuje tylko
+    proces, który trzyma blokadę; pozostałe czekają i mapują jego migawkę.
+    """
+    import pyarrow as pa  # tylko w trybie wielu procesów
+
+    generation = _shared_generation_token(shared_dir)
+    path = _fresh_snapshot(shared_dir, generation)
+    if path is None:
+        with open(os.path.join(shared_dir, SHARED_SNAPSHOT_LOCK), "w") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            path = _fresh_snapshot(shared_dir, generation)
+            if path is None:
+                records = _fetch_worksheets_from_api()
+                try:
+                    path = _write_snapshot(shared_dir, generation, records)
+                except (OSError, pa.ArrowException):
+                    # Np. brak miejsca na dysku - ten proces zostaje przy własnym odczycie.
+                    instrumentation.count("cache.snapshot.write_failed")
+                    return records
+                instrumentation.count("cache.snapshot.written")
+    try:
+        records = _read_snapshot(path)
+    except (OSError, pa.ArrowException):
+        # Migawka usunięta w międzyczasie przez nowszą - czytamy sami.
+        return _fetch_worksheets_from_api()
+    instrumentation.count("cache.snapshot.mapped")
+    return records
+
+
+def _cached_worksheets() -> Tuple[Dict[str, List[Dict[str, Any]]], int]:
+    _sync_shared_generation()
+    return _records_cache.get("worksheets", _fetch_worksheets)
+
+
+def _worksheet_records(sheet_name: str) -> Tuple[List[Dict[str, Any]], int]:
+    records, version = _cached_worksheets()
+    return records[sheet_name], version
+
+
+_loader_executor = ThreadPoolExecutor(
+    max_workers=4,
+    thread_name_prefix="google-sheets-load",
+)
+
+
+class PendingLoad:
+    """Odczyt z Google Sheets uruchomiony w tle.
+
+    Zapytanie do API wykonuje wątek roboczy, a wynik jest składany dopiero
+    w `result()`, czyli w wątku skryptu, gdzie działa st.cache_data.
+    """
+
+    def __init__(self, sheet_name: str, build, priority: str = PRIORITY_HIGH):
+        # Kontekst przenosi bieżący pomiar przebiegu i priorytet do wątku roboczego.
+        context = contextvars.copy_context()
+        context.run(_request_priority.set, priority)
+        self._future: Future = _loader_executor.submit(context.run, _cached_worksheets)
+        self._sheet_name = sheet_name
+        self._build = build
+        # Wersja danych, z których zbudowano wynik; znana po `result()`.
+        self.version: Optional[int] = None
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        records, version = self._future.result(timeout)
+        self.version = version
+        return self._build(version, records[self._sheet_name])
+
+
+def _fetch_notes() -> Dict[str, str]:
+    # Uwagi i entry_id sąsiadują w arkuszu, więc wystarcza jeden zakres.
+    [(range_name, width)] = _column_ranges("entries", [NOTES_COLUMN, "entry_id"])
+    headers = [header for header in ENTRIES_HEADERS if header in (NOTES_COLUMN, "entry_id")]
+    try:
+        response = get_spreadsheet().values_batch_get([range_name])
     except APIError as exc:
-        raise _api_error_message('odczyt worksheet "users"', exc)
+        raise _api_error_message('odczyt uwag z worksheet "entries"', exc)
+
+    rows = _join_columns([(response["valueRanges"][0].get("values", []), width)])
+    header = next(rows, None)
+    if header is None:
+        return {}
+    _check_headers("entries", header, headers)
+    notes_at, id_at = headers.index(NOTES_COLUMN), headers.index("entry_id")
+    return {
+        str(row[id_at]): str(row[notes_at])
+        for row in rows
+        if row[id_at] != "" and str(row[notes_at]).strip()
+    }
+
 
+def load_notes() -> Tuple[Dict[str, str], int]:
+    """Uwagi wpisów (entry_id -> tekst) i wersja tego odczytu.
+
+    Czytane osobno i tylko na życzenie: po włączeniu "Pokaż uwagi" w historii
+    i widoku dnia oraz przy wyszukiwaniu. Wykresy i statystyki ich nie potrzebują.
+    """
+    _sync_shared_generation()
+    return _records_cache.get("notes", _fetch_notes)
+
+
+def with_notes(df: pd.DataFrame, notes: Dict[str, str]) -> pd.DataFrame:
+    """Wpisy z kolumną Uwagi z `load_notes`; wpisy spoza arkusza (np. z dziennika zapisów) zachowują swoje."""
+    if df.empty or "entry_id" not in df:
+        return df
+    loaded = df["entry_id"].astype(str).map(notes)
+    current = df[NOTES_COLUMN] if NOTES_COLUMN in df else pd.Series("", index=df.index)
+    # Przy copy-on-write płytka kopia nie kopiuje pozostałych kolumn ani nie zmienia `df`.
+    df = df.copy(deep=False)
+    df[NOTES_COLUMN] = loaded.where(loaded.notna(), current).fillna("")
+    return df
+
+
+def load_users_config() -> Dict[str, Any]:
+    records, version = _worksheet_records("users")
+    return _users_config(version, records)
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=4, show_spinner=False)
+def _users_config(version: int, _records: List[Dict[str, Any]]) -> Dict[str, Any]:
     usernames: Dict[str, Dict[str, str]] = {}
-    for record in records:
+    for record in _records:
         username = str(record.get("username", "")).strip()
         if not username:
             continue
@@ -270,6 +1496,7 @@ def load_users_config() -> Dict[str, Any]:
             "password": DEFAULT_ADMIN_HASH,
             "role": "admin",
         }
+        worksheet = ensure_worksheet("users", USERS_HEADERS)
         try:
             worksheet.append_row(
                 [
@@ -283,37 +1510,64 @@ def load_users_config() -> Dict[str, Any]:
         except APIError as exc:
             raise _api_error_message('utworzenie domyślnego admina w "users"', exc)
 
-    return {"credentials": {"usernames": usernames}}
+    # Skrót treści, a nie numer odczytu: zmienia się tylko wtedy, gdy zmienią się dane.
+    fingerprint = hashlib.sha1(repr(sorted(usernames.items())).encode()).hexdigest()
+    return {"credentials": {"usernames": usernames}, "version": fingerprint}
 
 
-def save_users_config(config: Dict[str, Any]) -> None:
-    worksheet = ensure_worksheet("users", USERS_HEADERS)
-    usernames = (
-        config.get("credentials", {})
-        .get("usernames", {})
-    )
-    rows = [USERS_HEADERS]
-    for username, user_data in usernames.items():
-        rows.append(
-            [
-                username,
-                user_data.get("name", ""),
-                user_data.get("password", ""),
-                user_data.get("role", "pacjent"),
-            ]
-        )
+def load_users_config_async(priority: str = PRIORITY_HIGH) -> PendingLoad:
+    return PendingLoad("users", _users_config, priority)
+
 
+def _appended_row_number(response: Dict[str, Any]) -> Optional[int]:
+    updated_range = str(response.get("updates", {}).get("updatedRange", ""))
+    if "!" not in updated_range:
+        return None
+    first_cell = updated_range.split("!", 1)[1].split(":", 1)[0]
     try:
-        worksheet.update(
-            range_name=f"A1:D{len(rows)}",
-            values=rows,
-            value_input_option="RAW",
-        )
-        if worksheet.row_count > len(rows):
-            worksheet.batch_clear([f"A{len(rows) + 1}:D{worksheet.row_count}"])
+        return a1_to_rowcol(first_cell)[0]
+    except Exception:
+        return None
+
+
+def _users_row_index(usernames: Sequence[Any], first_row: int = 2) -> Dict[str, int]:
+    index: Dict[str, int] = {}
+    for row_number, value in enumerate(usernames, start=first_row):
+        username = str(value).strip().lower()
+        if username and username not in index:
+            index[username] = row_number
+    return index
+
+
+def add_user(username: str, name: str, password_hash: str, role: str = "pacjent") -> None:
+    worksheet = ensure_worksheet("users", USERS_HEADERS)
+    try:
+        row = [username, name, password_hash, role]
+        response = worksheet.append_row(row, value_input_option="RAW")
+        row_number = _appended_row_number(response)
+
+        # Weryfikacja: przy równoczesnej rejestracji tego samego loginu
+        # zostaje tylko pierwszy wiersz.
+        key = username.strip().lower()
+        usernames = worksheet.col_values(1)[1:]
+        first_row = _users_row_index(usernames).get(key)
+        if row_number is not None and first_row is not None and first_row != row_number:
+            # Równoległe usunięcie mogło przesunąć wiersze: kasujemy tylko wiersz,
+            # który wciąż zawiera dokładnie dopisane dane (hash hasła jest unikalny).
+            candidates = [row_number] + [
+                number
+                for number, value in enumerate(usernames, start=2)
+                if number not in (first_row, row_number) and str(value).strip().lower() == key
+            ]
+            for candidate in candidates:
+                if worksheet.row_values(candidate)[: len(row)] == row:
+                    worksheet.delete_rows(candidate)
+                    break
+            invalidate_cache()
+            raise GoogleSheetsConflictError("❌ Taki login już istnieje")
     except APIError as exc:
-        raise _api_error_message('zapis worksheet "users"', exc)
-    st.cache_data.clear()
+        raise _api_error_message('dopisywanie użytkownika do worksheet "users"', exc)
+    invalidate_cache()
 
 
 def _normalize_entry_value(value: Any) -> Any:
@@ -338,15 +1592,18 @@ def _normalize_entry_value(value: Any) -> Any:
     return value
 
 
-def _entry_row(username: str, entry_dict: Dict[str, Any]) -> List[Any]:
+def _entry_row(username: str, entry_dict: Dict[str, Any], entry_id: str, version: int) -> List[Any]:
     return [
         username,
         *[_normalize_entry_value(entry_dict.get(column, "")) for column in ENTRY_DATA_HEADERS],
+        entry_id,
+        version,
     ]
 
 
+@instrumentation.timed()
 def _entries_dataframe(records: Iterable[Dict[str, Any]], include_username: bool) -> pd.DataFrame:
-    headers = ENTRIES_HEADERS if include_username else ENTRY_DATA_HEADERS
+    headers = ENTRIES_HEADERS if include_username else USER_ENTRY_HEADERS
     df = pd.DataFrame(records)
     if df.empty:
         return pd.DataFrame(columns=headers)
@@ -354,54 +1611,250 @@ def _entries_dataframe(records: Iterable[Dict[str, Any]], include_username: bool
     df = df.reindex(columns=ENTRIES_HEADERS)
     for column in ENTRY_NUMERIC_COLUMNS:
         df[column] = pd.to_numeric(df[column], errors="coerce")
+    df["entry_id"] = df["entry_id"].fillna("").astype(str)
+    df["version"] = pd.to_numeric(df["version"], errors="coerce").fillna(0).astype("int64")
 
     df["_sort_key"] = pd.to_datetime(df["Data i czas"], errors="coerce")
     df = df.sort_values("_sort_key", na_position="last").drop(columns="_sort_key")
     df = df.reset_index(drop=True)
 
-    if include_username:
-        return df.reindex(columns=ENTRIES_HEADERS)
-    return df.reindex(columns=ENTRY_DATA_HEADERS)
+    return df.reindex(columns=headers)
+
+
+def without_entry_metadata(df: pd.DataFrame) -> pd.DataFrame:
+    return df.drop(columns=ENTRY_META_HEADERS, errors="ignore")
 
 
 def filter_entries_for_user(entries_df: pd.DataFrame, username: str) -> pd.DataFrame:
     if entries_df.empty or "username" not in entries_df:
-        return pd.DataFrame(columns=ENTRY_DATA_HEADERS)
+        return pd.DataFrame(columns=USER_ENTRY_HEADERS)
 
     user_entries = entries_df.loc[
         entries_df["username"].fillna("").astype(str).str.strip() == username
     ].copy()
     if "username" in user_entries:
         user_entries = user_entries.drop(columns=["username"])
-    return user_entries.reindex(columns=ENTRY_DATA_HEADERS).reset_index(drop=True)
+    return user_entries.reindex(columns=USER_ENTRY_HEADERS).reset_index(drop=True)
 
 
-@st.cache_data(ttl=60)
 def load_user_entries(username: str) -> pd.DataFrame:
-    return filter_entries_for_user(load_all_entries(), username)
+    records, version = _worksheet_records("entries")
+    return _user_entries_frame(version, username, records)
+
+
+def _user_entries_frame(
+    version: int,
+    username: str,
+    records: List[Dict[str, Any]],
+) -> pd.DataFrame:
+    return _frame_cache.get(
+        version,
+        ("user", username),
+        lambda: filter_entries_for_user(_all_entries_frame(version, records), username),
+    )
+
+
+def load_user_entries_async(username: str) -> PendingLoad:
+    return PendingLoad(
+        "entries",
+        lambda version, records: _user_entries_frame(version, username, records),
+    )
 
 
-@st.cache_data(ttl=60)
 def load_all_entries() -> pd.DataFrame:
-    worksheet = ensure_worksheet("entries", ENTRIES_HEADERS)
-    try:
-        records = worksheet.get_all_records()
-    except APIError as exc:
-        raise _api_error_message('odczyt wszystkich wpisów z worksheet "entries"', exc)
+    records, version = _worksheet_records("entries")
+    return _all_entries_frame(version, records)
+
 
-    return _entries_dataframe(records, include_username=True)
+def load_all_entries_async() -> PendingLoad:
+    return PendingLoad("entries", _all_entries_frame, PRIORITY_LOW)
 
 
-def append_user_entry(username: str, entry_dict: Dict[str, Any]) -> None:
+def _all_entries_frame(version: int, records: Sequence[Dict[str, Any]]) -> pd.DataFrame:
+    if isinstance(records, _SnapshotRecords):
+        return _frame_cache.get(version, ("all",), records.frame)
+    return _frame_cache.get(
+        version, ("all",), lambda: _entries_dataframe(records, include_username=True)
+    )
+
+
+def append_user_entry(
+    username: str,
+    entry_dict: Dict[str, Any],
+    entry_id: Optional[str] = None,
+) -> str:
     worksheet = ensure_worksheet("entries", ENTRIES_HEADERS)
+    entry_id = entry_id or _new_entry_id()
+    alert_rows = _entry_alert_rows(username, entry_dict, entry_id, replaces_day=False)
     try:
         worksheet.append_row(
-            _entry_row(username, entry_dict),
+            _entry_row(username, entry_dict, entry_id, 1),
             value_input_option="RAW",
         )
     except APIError as exc:
         raise _api_error_message('dopisywanie wpisu do worksheet "entries"', exc)
-    st.cache_data.clear()
+    _remember_write(username, entry_id, entry_dict)
+    try:
+        _append_alert_rows(alert_rows)
+    finally:
+        invalidate_cache()
+    return entry_id
+
+
+# Wpisy i alerty zapisane przez ten proces, z wersją ostatniego odczytu
+# w chwili zapisu. Uzupełniają ten odczyt przy liczeniu alertów, dopóki
+# kolejny odczyt ich nie zawiera.
+_recent_writes: deque = deque(maxlen=256)
+_recent_alert_ids: deque = deque(maxlen=256)
+
+
+def _latest_worksheet_records(sheet_name: str) -> Tuple[List[Dict[str, Any]], int]:
+    # Ostatni odczyt wystarcza do alertów; po zapisie nie wymuszamy pełnego odczytu.
+    latest = _records_cache.latest("worksheets")
+    if latest is None:
+        return _worksheet_records(sheet_name)
+    records, version = latest
+    return records[sheet_name], version
+
+
+def _latest_version() -> int:
+    latest = _records_cache.latest("worksheets")
+    return latest[1] if latest is not None else 0
+
+
+def _remember_write(username: str, entry_id: str, entry_dict: Dict[str, Any]) -> None:
+    _recent_writes.append((_latest_version(), username, entry_id, entry_dict))
+
+
+def _entry_alert_rows(
+    username: str,
+    entry_dict: Dict[str, Any],
+    entry_id: str,
+    replaces_day: bool,
+) -> List[List[Any]]:
+    """Wiersze nowych alertów dla wpisu, liczone z ostatniego odczytu historii.
+
+    Identyfikatory alertów są stałe, więc alerty już zapisane są pomijane,
+    a ponowienie zapisu z kolejki nie tworzy duplikatów.
+    """
+    records, version = _latest_worksheet_records("entries")
+    history = _user_entries_frame(version, username, records)
+    written = [
+        {**entry, "entry_id": written_id}
+        for seen, user, written_id, entry in list(_recent_writes)
+        if user == username and seen >= version
+    ]
+    if written:
+        history = pd.concat([history, pd.DataFrame(written)], ignore_index=True)
+    if not history.empty:
+        history = history.loc[history["entry_id"].astype(str) != entry_id]
+    if replaces_day and not history.empty:
+        _, day = _parse_entry_datetime(str(entry_dict.get("Data i czas", ""))[:10])
+        history_days = pd.to_datetime(history["Data i czas"], errors="coerce").dt.date
+        history = history.loc[history_days != day]
+
+    alerts = analytics.entry_alerts(entry_dict, history)
+    if not alerts:
+        return []
+
+    alert_records, version = _latest_worksheet_records("alerts")
+    existing = {str(record.get("alert_id", "")) for record in alert_records}
+    existing.update(alert_id for seen, alert_id in list(_recent_alert_ids) if seen >= version)
+    created = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    rows = []
+    for alert in alerts:
+        scope = f"{username}:{alert['klucz']}" if alert["klucz"] else entry_id
+        alert_id = f"{scope}:{alert['rodzaj']}"
+        if alert_id in existing:
+            continue
+        rows.append(
+            [
+                alert_id,
+                username,
+                entry_id,
+                _normalize_entry_value(entry_dict.get("Data i czas", "")),
+                alert["rodzaj"],
+                alert["opis"],
+                created,
+                "",
+                "",
+            ]
+        )
+    return rows
+
+
+def _append_alert_rows(rows: List[List[Any]]) -> None:
+    # Wywoływane dopiero po udanym zapisie wpisu, żeby alert nie wskazywał
+    # wpisu, którego nie ma; cache unieważnia wywołujący razem z wpisem.
+    if not rows:
+        return
+    worksheet = ensure_worksheet("alerts", ALERTS_HEADERS)
+    try:
+        worksheet.append_rows(rows, value_input_option="RAW")
+    except APIError as exc:
+        raise _api_error_message('dopisywanie alertów do worksheet "alerts"', exc)
+    version = _latest_version()
+    _recent_alert_ids.extend((version, row[0]) for row in rows)
+    instrumentation.count("alerts.created", len(rows))
+
+
+def record_entry_alerts(
+    username: str,
+    entry_dict: Dict[str, Any],
+    entry_id: str,
+    replaces_day: bool = False,
+) -> None:
+    """Zapisuje alerty już zapisanego wpisu (np. gdy wcześniej zawiódł sam zapis alertów)."""
+    rows = _entry_alert_rows(username, entry_dict, entry_id, replaces_day)
+    if rows:
+        _append_alert_rows(rows)
+        invalidate_cache()
+
+
+def _alerts_frame(version: int, records: List[Dict[str, Any]]) -> pd.DataFrame:
+    def build() -> pd.DataFrame:
+        df = pd.DataFrame(records).reindex(columns=ALERTS_HEADERS)
+        df["alert_id"] = df["alert_id"].fillna("").astype(str)
+        df = df.loc[df["alert_id"] != ""]
+        return df.iloc[::-1].reset_index(drop=True)
+
+    return _frame_cache.get(version, ("alerts",), build)
+
+
+def load_alerts() -> pd.DataFrame:
+    """Alerty całej poradni, od najnowszych."""
+    records, version = _worksheet_records("alerts")
+    return _alerts_frame(version, records)
+
+
+def load_alerts_async() -> PendingLoad:
+    return PendingLoad("alerts", _alerts_frame, PRIORITY_LOW)
+
+
+def acknowledge_alerts(alert_ids: Sequence[str], reviewer: str) -> None:
+    records, _ = _worksheet_records("alerts")
+    rows = {
+        str(record.get("alert_id", "")): row_number
+        for row_number, record in enumerate(records, start=2)
+    }
+    first = rowcol_to_a1(1, ALERTS_HEADERS.index("przejrzano") + 1)[:-1]
+    last = rowcol_to_a1(1, ALERTS_HEADERS.index("przejrzał") + 1)[:-1]
+    reviewed = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    data = [
+        {
+            "range": absolute_range_name("alerts", f"{first}{rows[alert_id]}:{last}{rows[alert_id]}"),
+            "values": [[reviewed, reviewer]],
+        }
+        for alert_id in alert_ids
+        if alert_id in rows
+    ]
+    if not data:
+        return
+    try:
+        get_spreadsheet().values_batch_update({"valueInputOption": "RAW", "data": data})
+    except APIError as exc:
+        raise _api_error_message('oznaczanie alertów w worksheet "alerts"', exc)
+    invalidate_cache()
 
 
 def _parse_entry_datetime(value: Any) -> Tuple[Optional[datetime.datetime], Optional[datetime.date]]:
@@ -422,77 +1875,177 @@ def _parse_entry_datetime(value: Any) -> Tuple[Optional[datetime.datetime], Opti
     return parsed_datetime, None
 
 
-def _matching_entry_rows(
-    rows: Sequence[Sequence[Any]],
-    username: str,
-    entry_datetime: Any,
-) -> Tuple[List[int], bool]:
+def _matching_entries(username: str, entry_datetime: Any) -> Tuple[List[Tuple[str, int]], bool]:
     target_datetime, target_date = _parse_entry_datetime(entry_datetime)
     if target_datetime is None and target_date is None:
         return [], False
 
-    matched_rows: List[int] = []
-    date_match = target_date is not None
-    for row_number, row in enumerate(rows[1:], start=2):
-        row_username = str(row[0]).strip() if len(row) > 0 else ""
-        row_datetime = str(row[1]).strip() if len(row) > 1 else ""
-        if row_username != username or not row_datetime:
-            continue
+    # Bez st.cache_data: funkcja działa także w wątku kolejki zapisów.
+    records, _ = _worksheet_records("entries")
+    user_entries = pd.DataFrame(
+        [
+            record
+            for record in records
+            if str(record.get("username", "")).strip() == username
+            and record.get("entry_id")
+        ],
+        columns=ENTRIES_HEADERS,
+    )
+    parsed = pd.to_datetime(user_entries["Data i czas"], errors="coerce").dt.floor("min")
+    if target_date is not None:
+        mask = parsed.dt.date == target_date
+    else:
+        mask = parsed == pd.Timestamp(target_datetime)
+    matched = user_entries.loc[mask.fillna(False)]
+    return list(zip(matched["entry_id"], matched["version"])), target_date is not None
+
+
+def entry_exists(entry_id: str) -> bool:
+    """Czy wpis jest już w arkuszu; sprawdzane tylko przy ponowieniu zapisu.
+
+    Nieudana próba mogła jednak dojść do arkusza, więc wcześniejszy odczyt
+    z cache nie wystarcza. Nowy odczyt trafia do wspólnego cache i zastępuje
+    ten, który widok i tak wykonałby po zapisie.
+    """
+    _records_cache.invalidate()
+    return entry_id in _entry_row_index()
+
+
+def _entry_row_index() -> Dict[str, int]:
+    records, _ = _worksheet_records("entries")
+    return {
+        str(record.get("entry_id", "")): row_number
+        for row_number, record in enumerate(records, start=2)
+        if record.get("entry_id")
+    }
 
-        parsed = pd.to_datetime(row_datetime, errors="coerce")
-        if pd.isna(parsed):
-            continue
-        parsed_datetime = parsed.to_pydatetime().replace(second=0, microsecond=0)
 
-        if target_date is not None and parsed_datetime.date() == target_date:
-            matched_rows.append(row_number)
-        elif target_datetime is not None and parsed_datetime == target_datetime:
-            matched_rows.append(row_number)
+def _row_version(row: Sequence[Any]) -> int:
+    try:
+        return int(float(row[ENTRIES_HEADERS.index("version")]))
+    except (IndexError, TypeError, ValueError):
+        return 0
+
+
+def _locate_entry(worksheet, entry_id: str, expected_version: Optional[int]) -> Tuple[int, List[Any]]:
+    id_column = ENTRIES_HEADERS.index("entry_id") + 1
+
+    def row_entry_id(row: Sequence[Any]) -> str:
+        return str(row[id_column - 1]) if len(row) >= id_column else ""
+
+    row_number = _entry_row_index().get(entry_id)
+    current = worksheet.row_values(row_number) if row_number else []
+    if row_entry_id(current) != entry_id:
+        # Wiersze przesunęły się od ostatniego odczytu: czytamy tylko kolumnę ID.
+        ids = worksheet.col_values(id_column)
+        row_number = next(
+            (
+                number
+                for number, value in enumerate(ids[1:], start=2)
+                if str(value) == entry_id
+            ),
+            None,
+        )
+        current = worksheet.row_values(row_number) if row_number else []
+    if not row_number or row_entry_id(current) != entry_id:
+        raise GoogleSheetsConflictError(
+            "Wpis nie istnieje – mógł zostać usunięty w innej sesji. Odśwież stronę."
+        )
+    if expected_version is not None and _row_version(current) != int(expected_version):
+        raise GoogleSheetsConflictError(
+            "Wpis został zmieniony w innej sesji. Odśwież stronę i spróbuj ponownie."
+        )
+    return row_number, current
 
-    return matched_rows, date_match
 
+def update_entry(entry_id: str, expected_version: Optional[int], entry_dict: Dict[str, Any]) -> None:
+    _update_entry_row(entry_id, expected_version, entry_dict)
+    invalidate_cache()
 
-def update_user_entry(username: str, entry_datetime: Any, entry_dict: Dict[str, Any]) -> None:
+
+def _update_entry_row(entry_id: str, expected_version: Optional[int], entry_dict: Dict[str, Any]) -> None:
     worksheet = ensure_worksheet("entries", ENTRIES_HEADERS)
     try:
-        rows = worksheet.get_all_values()
-        matched_rows, date_match = _matching_entry_rows(rows, username, entry_datetime)
-        new_row = _entry_row(username, entry_dict)
+        row_number, current = _locate_entry(worksheet, entry_id, expected_version)
+        new_row = _entry_row(
+            str(current[0]).strip(),
+            entry_dict,
+            entry_id,
+            _row_version(current) + 1,
+        )
+        last_column = rowcol_to_a1(1, len(ENTRIES_HEADERS))[:-1]
+        worksheet.update(
+            range_name=f"A{row_number}:{last_column}{row_number}",
+            values=[new_row],
+            value_input_option="RAW",
+        )
+    except APIError as exc:
+        raise _api_error_message('aktualizacja wpisu w worksheet "entries"', exc)
 
-        if not matched_rows:
-            worksheet.append_row(new_row, value_input_option="RAW")
-            st.cache_data.clear()
-            return
 
-        if len(matched_rows) == 1 and not date_match:
-            row_number = matched_rows[0]
-            worksheet.update(
-                range_name=f"A{row_number}:N{row_number}",
-                values=[new_row],
-                value_input_option="RAW",
-            )
-            st.cache_data.clear()
-            return
+def _delete_entries(worksheet, entries: Sequence[Tuple[str, Optional[int]]]) -> None:
+    located = [_locate_entry(worksheet, entry_id, version)[0] for entry_id, version in entries]
+    for row_number in sorted(located, reverse=True):
+        worksheet.delete_rows(row_number)
+
 
-        for row_number in sorted(matched_rows, reverse=True):
-            worksheet.delete_rows(row_number)
-        worksheet.append_row(new_row, value_input_option="RAW")
+def delete_entry(entry_id: str, expected_version: Optional[int]) -> None:
+    worksheet = ensure_worksheet("entries", ENTRIES_HEADERS)
+    try:
+        _delete_entries(worksheet, [(entry_id, expected_version)])
     except APIError as exc:
-        raise _api_error_message('aktualizacja wpisu w worksheet "entries"', exc)
-    st.cache_data.clear()
+        raise _api_error_message('usuwanie wpisu z worksheet "entries"', exc)
+    invalidate_cache()
+
+
+def update_user_entry(
+    username: str,
+    entry_datetime: Any,
+    entry_dict: Dict[str, Any],
+    new_entry_id: Optional[str] = None,
+    replaced: Optional[Sequence[Tuple[str, Optional[int]]]] = None,
+) -> None:
+    """Zastępuje wpisy użytkownika z danej chwili lub dnia nowym wpisem.
+
+    `replaced` to pary (entry_id, version) zastępowanych wpisów, odczytane
+    w chwili decyzji użytkownika. Bez nich wpisy są szukane w cache, a wtedy
+    sprawdzenie wersji nie wykryje zmian wprowadzonych w międzyczasie.
+    """
+    if replaced is not None:
+        matched, date_match = list(replaced), True
+    else:
+        matched, date_match = _matching_entries(username, entry_datetime)
+    if len(matched) == 1 and not date_match:
+        new_entry_id = matched[0][0]
+        alert_rows = _entry_alert_rows(username, entry_dict, new_entry_id, replaces_day=True)
+        _update_entry_row(new_entry_id, matched[0][1], entry_dict)
+    else:
+        worksheet = ensure_worksheet("entries", ENTRIES_HEADERS)
+        new_entry_id = new_entry_id or _new_entry_id()
+        alert_rows = _entry_alert_rows(username, entry_dict, new_entry_id, replaces_day=True)
+        try:
+            _delete_entries(worksheet, matched)
+            worksheet.append_row(
+                _entry_row(username, entry_dict, new_entry_id, 1),
+                value_input_option="RAW",
+            )
+        except APIError as exc:
+            raise _api_error_message('aktualizacja wpisu w worksheet "entries"', exc)
+    _remember_write(username, new_entry_id, entry_dict)
+    try:
+        _append_alert_rows(alert_rows)
+    finally:
+        invalidate_cache()
 
 
 def delete_user_entry(username: str, entry_datetime: Any) -> None:
+    matched, date_match = _matching_entries(username, entry_datetime)
+    if not matched:
+        return
+
     worksheet = ensure_worksheet("entries", ENTRIES_HEADERS)
     try:
-        rows = worksheet.get_all_values()
-        matched_rows, date_match = _matching_entry_rows(rows, username, entry_datetime)
-        if not matched_rows:
-            return
-
-        rows_to_delete = matched_rows if date_match else matched_rows[:1]
-        for row_number in sorted(rows_to_delete, reverse=True):
-            worksheet.delete_rows(row_number)
+        _delete_entries(worksheet, matched if date_match else matched[:1])
     except APIError as exc:
         raise _api_error_message('usuwanie wpisu z worksheet "entries"', exc)
-    st.cache_data.clear()
+    invalidate_cache()
@@ -0,0 +1,299 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+import streamlit as st
+
+
+# Można nadpisać w st.secrets w sekcji [instrumentation].
+DEFAULT_INSTRUMENTATION_SETTINGS: Dict[str, str] = {
+    # Plik JSON Lines, do którego trafia każdy przebieg skryptu.
+    "jsonl_path": "",
+    # Kolektor OpenTelemetry (OTLP/HTTP, JSON), np. http://localhost:4318/v1/traces.
+    "otlp_endpoint": "",
+}
+
+SERVICE_NAME = "dziennik-nastroju"
+
+
+class Span:
+    __slots__ = ("name", "category", "start", "duration", "thread", "span_id")
+
+    def __init__(self, name: str, category: str, start: float, duration: float):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.duration = duration
+        self.thread = threading.current_thread().name
+        self.span_id = uuid.uuid4().hex[:16]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "category": self.category,
+            "start": self.start,
+            "duration_ms": self.duration * 1000,
+            "thread": self.thread,
+        }
+
+
+class RerunTrace:
+    """Pomiary jednego przebiegu skryptu Streamlit."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.trace_id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[Span] = []
+        self.counters: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def add_span(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def finish(self) -> None:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._started
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [span.as_dict() for span in self.spans]
+            counters = dict(self.counters)
+        return {
+            "trace_id": self.trace_id,
+            "label": self.label,
+            "started_at": self.started_at,
+            "duration_ms": (self.duration or 0) * 1000,
+            "spans": spans,
+            "counters": counters,
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[RerunTrace]] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+
+def current_trace() -> Optional[RerunTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, category: str = "code") -> Iterator[None]:
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(Span(name, category, start, time.perf_counter() - started))
+
+
+def timed(name: Optional[str] = None, category: str = "code"):
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(span_name, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, amount: int = 1) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.count(name, amount)
+
+
+def _get_instrumentation_settings() -> Dict[str, str]:
+    settings = dict(DEFAULT_INSTRUMENTATION_SETTINGS)
+    try:
+        overrides = dict(st.secrets.get("instrumentation", {}))
+    except Exception:
+        overrides = {}
+    for key, value in overrides.items():
+        if key in settings:
+            settings[key] = str(value).strip()
+    return settings
+
+
+def _otlp_payload(trace: RerunTrace) -> Dict[str, Any]:
+    root_id = uuid.uuid4().hex[:16]
+    started_ns = int(trace.started_at * 1e9)
+    spans = [
+        {
+            "traceId": trace.trace_id,
+            "spanId": root_id,
+            "name": trace.label,
+            "kind": 2,
+            "startTimeUnixNano": str(started_ns),
+            "endTimeUnixNano": str(started_ns + int((trace.duration or 0) * 1e9)),
+            "attributes": [
+                {"key": f"counter.{name}", "value": {"intValue": str(value)}}
+                for name, value in trace.counters.items()
+            ],
+        }
+    ]
+    for item in trace.spans:
+        start_ns = int(item.start * 1e9)
+        spans.append(
+            {
+                "traceId": trace.trace_id,
+                "spanId": item.span_id,
+                "parentSpanId": root_id,
+                "name": item.name,
+                "kind": 3 if item.category == "api" else 1,
+                "startTimeUnixNano": str(start_ns),
+                "endTimeUnixNano": str(start_ns + int(item.duration * 1e9)),
+                "attributes": [
+                    {"key": "category", "value": {"stringValue": item.category}},
+                    {"key": "thread.name", "value": {"stringValue": item.thread}},
+                ],
+            }
+        )
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }
+        ]
+    }
+
+
+class _Exporter:
+    """Zapisuje zakończone przebiegi w tle, żeby nie wydłużać odpowiedzi."""
+
+    def __init__(self, jsonl_path: str, otlp_endpoint: str):
+        self._jsonl_path = jsonl_path
+        self._otlp_endpoint = otlp_endpoint
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._jsonl_path or self._otlp_endpoint)
+
+    def submit(self, trace: RerunTrace) -> None:
+        threading.Thread(
+            target=self._export,
+            args=(trace,),
+            name="instrumentation-export",
+            daemon=True,
+        ).start()
+
+    def _export(self, trace: RerunTrace) -> None:
+        if self._jsonl_path:
+            line = json.dumps(trace.as_dict(), ensure_ascii=False)
+            with self._lock:
+                directory = os.path.dirname(self._jsonl_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self._jsonl_path, "a", encoding="utf-8") as handle:
+                    handle.write(line + "\n")
+        if self._otlp_endpoint:
+            try:
+                self._session.post(self._otlp_endpoint, json=_otlp_payload(trace), timeout=5)
+            except requests.RequestException:
+                # Brak kolektora nie może psuć aplikacji.
+                pass
+
+
+@st.cache_resource(show_spinner=False)
+def _get_exporter() -> _Exporter:
+    settings = _get_instrumentation_settings()
+    return _Exporter(settings["jsonl_path"], settings["otlp_endpoint"])
+
+
+def start_rerun(label: str) -> RerunTrace:
+    """Zaczyna pomiar przebiegu; poprzedni, przerwany przez st.stop/st.rerun, jest zamykany."""
+    previous = st.session_state.get("_rerun_trace")
+    if previous is not None and previous.duration is None:
+        finish_rerun(previous)
+    trace = RerunTrace(label)
+    st.session_state["_rerun_trace"] = trace
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_rerun(trace: Optional[RerunTrace] = None) -> None:
+    trace = trace or _current_trace.get()
+    if trace is None or trace.duration is not None:
+        return
+    trace.finish()
+    exporter = _get_exporter()
+    if exporter.enabled:
+        exporter.submit(trace)
+
+
+def render_diagnostics(container, quota: Optional[Dict[str, Dict[str, float]]] = None) -> None:
+    """Panel z pomiarami bieżącego przebiegu (tylko dla admina)."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+
+    elapsed = time.perf_counter() - trace._started
+    with container.expander("🔧 Diagnostyka przebiegu"):
+        st.caption(f"Czas przebiegu do tego miejsca: {elapsed * 1000:.0f} ms")
+        data = trace.as_dict()
+        if data["spans"]:
+            totals: Dict[str, List[float]] = {}
+            for item in data["spans"]:
+                totals.setdefault(item["name"], []).append(item["duration_ms"])
+            st.dataframe(
+                [
+                    {
+                        "operacja": name,
+                        "liczba": len(durations),
+                        "suma [ms]": round(sum(durations), 1),
+                        "maks. [ms]": round(max(durations), 1),
+                    }
+                    for name, durations in sorted(
+                        totals.items(), key=lambda item: -sum(item[1])
+                    )
+                ],
+                use_container_width=True,
+                hide_index=True,
+            )
+        if data["counters"]:
+            st.json(data["counters"])
+        if quota:
+            st.markdown("**Limity Google Sheets API (ostatnia minuta)**")
+            st.dataframe(
+                [{"rodzaj": kind, **usage} for kind, usage in quota.items()],
+                use_container_width=True,
+                hide_index=True,
+            )
+        st.download_button(
+            "Pobierz pomiary (JSON)",
+            json.dumps(data, ensure_ascii=False, indent=2),
+            file_name=f"przebieg-{trace.trace_id}.json",
+            mime="application/json",
+            key="diagnostics_download",
+        )
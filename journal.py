@@ -0,0 +1,360 @@
+import datetime
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from google_sheets import (
+    GoogleSheetsConflictError,
+    GoogleSheetsError,
+    append_user_entry,
+    entry_exists,
+    is_transient_error,
+    record_entry_alerts,
+    update_user_entry,
+)
+
+
+# Można nadpisać w st.secrets w sekcji [journal].
+DEFAULT_JOURNAL_SETTINGS: Dict[str, Any] = {
+    "path": "data/journal.jsonl",
+    "retry_initial_seconds": 2.0,
+    "retry_max_seconds": 300.0,
+    # Po tylu ukończonych operacjach dziennik jest przepisywany bez nich.
+    "compact_after_ops": 200,
+}
+
+# Zapisywany przed pierwszą próbą: po błędzie lub restarcie wpis mógł już trafić do arkusza.
+STATUS_STARTED = "started"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_DISMISSED = "dismissed"
+
+
+class JournalError(Exception):
+    """Base exception with a user-facing message for Streamlit."""
+
+
+def _get_journal_settings() -> Dict[str, Any]:
+    settings = dict(DEFAULT_JOURNAL_SETTINGS)
+    try:
+        overrides = dict(st.secrets.get("journal", {}))
+    except Exception:
+        overrides = {}
+
+    for key, value in overrides.items():
+        if key not in settings:
+            continue
+        if key == "path":
+            # "{port}" pozwala nadać osobny dziennik każdemu procesowi Streamlit.
+            settings[key] = str(value).format(port=st.get_option("server.port"))
+            continue
+        try:
+            settings[key] = float(value)
+        except (TypeError, ValueError):
+            raise JournalError(f'st.secrets["journal"]["{key}"] musi być liczbą.')
+
+    if settings["compact_after_ops"] < 1:
+        raise JournalError('st.secrets["journal"]["compact_after_ops"] musi być dodatnie.')
+    settings["compact_after_ops"] = int(settings["compact_after_ops"])
+    if not 0 < settings["retry_initial_seconds"] <= settings["retry_max_seconds"]:
+        raise JournalError(
+            'st.secrets["journal"]: retry_initial_seconds musi być dodatnie '
+            "i nie większe niż retry_max_seconds."
+        )
+    return settings
+
+
+class EntryJournal:
+    """Lokalny dziennik zapisów formularza odtwarzany w tle do Google Sheets.
+
+    Każda operacja trafia najpierw do pliku JSONL (jedna linia, fsync), więc
+    przetrwa błąd API, limit zapytań i restart serwera. `op_id` jest zapisywany
+    jako entry_id, dzięki czemu ponowienie po częściowym sukcesie nie duplikuje
+    wpisu.
+    """
+
+    def __init__(self, path: str, retry_initial: float, retry_max: float, compact_after: int):
+        self._path = path
+        self._retry_initial = retry_initial
+        self._retry_max = retry_max
+        self._compact_after = compact_after
+        self._done_since_compact = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._failed: Dict[str, Dict[str, Any]] = {}
+        self._last_error: Optional[str] = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Osobny plik blokady, bo _compact podmienia plik dziennika.
+        self._lock_file = open(f"{path}.lock", "w")
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            raise JournalError(
+                f"Dziennik zapisów {path} jest używany przez inny proces. "
+                'Ustaw osobną ścieżkę, np. path = "data/journal-{port}.jsonl".'
+            )
+        self._recover()
+        self._file = open(path, "a", encoding="utf-8")
+
+        self._worker = threading.Thread(
+            target=self._run,
+            name="entry-journal",
+            daemon=True,
+        )
+        self._worker.start()
+
+    def _recover(self) -> None:
+        if not os.path.exists(self._path):
+            return
+
+        with open(self._path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Urwana ostatnia linia po awarii - operacja nie została potwierdzona.
+                    continue
+                op_id = record.get("op_id")
+                status = record.get("status")
+                if status is None:
+                    self._pending[op_id] = record
+                elif status == STATUS_STARTED and op_id in self._pending:
+                    self._pending[op_id]["started"] = True
+                elif status == STATUS_DONE:
+                    self._pending.pop(op_id, None)
+                elif status == STATUS_FAILED and op_id in self._pending:
+                    failed = self._pending.pop(op_id)
+                    self._failed[op_id] = {**failed, "error": record.get("error", "")}
+                elif status == STATUS_DISMISSED:
+                    self._failed.pop(op_id, None)
+
+        self._compact()
+
+    def _compact(self) -> None:
+        # Przepisuje dziennik tylko z nieukończonymi operacjami (atomowo przez os.replace).
+        temp_path = f"{self._path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            for op in [*self._failed.values(), *self._pending.values()]:
+                op = {key: value for key, value in op.items() if key != "error"}
+                handle.write(json.dumps(op, ensure_ascii=False) + "\n")
+            for op_id, op in self._failed.items():
+                handle.write(
+                    json.dumps(
+                        {"op_id": op_id, "status": STATUS_FAILED, "error": op["error"]},
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                )
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, self._path)
+
+    def _compact_open(self) -> None:
+        # Wywoływane pod self._lock: plik dziennika jest podmieniany.
+        self._file.close()
+        self._compact()
+        self._file = open(self._path, "a", encoding="utf-8")
+        self._done_since_compact = 0
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _submit(self, op: Dict[str, Any]) -> str:
+        op = {
+            "op_id": uuid.uuid4().hex,
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            **op,
+        }
+        with self._lock:
+            self._write(op)
+            self._pending[op["op_id"]] = op
+        self._wakeup.set()
+        return op["op_id"]
+
+    def submit_append(self, username: str, entry: Dict[str, Any]) -> str:
+        return self._submit({"kind": "append", "username": username, "entry": entry})
+
+    def submit_replace(
+        self,
+        username: str,
+        entry_date: datetime.date,
+        entry: Dict[str, Any],
+        replaced: List[Tuple[str, Optional[int]]],
+    ) -> str:
+        """`replaced` to (entry_id, version) wpisów z tego dnia widocznych dla użytkownika."""
+        return self._submit(
+            {
+                "kind": "replace",
+                "username": username,
+                "entry_date": entry_date.isoformat(),
+                "entry": entry,
+                "replaced": [list(item) for item in replaced],
+            }
+        )
+
+    def pending_ops(self, username: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            ops = list(self._pending.values())
+        return [op for op in ops if username is None or op["username"] == username]
+
+    def failed_ops(self, username: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            ops = list(self._failed.values())
+        return [op for op in ops if username is None or op["username"] == username]
+
+    @property
+    def last_error(self) -> Optional[str]:
+        return self._last_error
+
+    def _mark(self, op_id: str, status: str, error: str = "") -> None:
+        record: Dict[str, Any] = {"op_id": op_id, "status": status}
+        if error:
+            record["error"] = error
+        with self._lock:
+            self._write(record)
+            op = self._pending.pop(op_id)
+            if status == STATUS_FAILED:
+                self._failed[op_id] = {**op, "error": error}
+            else:
+                self._done_since_compact += 1
+                if self._done_since_compact >= self._compact_after:
+                    self._compact_open()
+
+    def _mark_started(self, op_id: str) -> None:
+        with self._lock:
+            self._write({"op_id": op_id, "status": STATUS_STARTED})
+            self._pending[op_id] = {**self._pending[op_id], "started": True}
+
+    def _convert_to_append(self, op_id: str) -> None:
+        # Pełny rekord bez statusu zastępuje operację przy odtwarzaniu dziennika.
+        with self._lock:
+            op = {**self._pending[op_id], "kind": "append"}
+            op.pop("replaced", None)
+            self._write(op)
+            self._pending[op_id] = op
+
+    def retry_failed(self, op_id: str) -> Optional[str]:
+        """Ponawia nieudany wpis jako nowy wpis (bez zastępowania innych)."""
+        with self._lock:
+            op = self._failed.get(op_id)
+        if op is None:
+            return None
+        new_op_id = self.submit_append(op["username"], op["entry"])
+        self.dismiss_failed(op_id)
+        return new_op_id
+
+    def dismiss_failed(self, op_id: str) -> None:
+        with self._lock:
+            if self._failed.pop(op_id, None) is not None:
+                self._write({"op_id": op_id, "status": STATUS_DISMISSED})
+
+    def _replay(self, op: Dict[str, Any]) -> None:
+        # Przy pierwszej próbie wpisu o nowym op_id nie może być w arkuszu.
+        if op.get("started") and entry_exists(op["op_id"]):
+            # Wpis jest już zapisany; ponawiamy tylko alerty, gdyby ich zapis zawiódł.
+            record_entry_alerts(
+                op["username"], op["entry"], op["op_id"], replaces_day=op["kind"] == "replace"
+            )
+            return
+        if op["kind"] == "append":
+            append_user_entry(op["username"], op["entry"], entry_id=op["op_id"])
+        else:
+            update_user_entry(
+                op["username"],
+                datetime.date.fromisoformat(op["entry_date"]),
+                op["entry"],
+                new_entry_id=op["op_id"],
+                # Operacje zapisane przed dodaniem "replaced" szukają wpisów w cache.
+                replaced=[tuple(item) for item in op["replaced"]] if "replaced" in op else None,
+            )
+
+    def _run(self) -> None:
+        delay = self._retry_initial
+        while True:
+            self._wakeup.clear()
+            ops = self.pending_ops()
+            if not ops:
+                self._wakeup.wait()
+                continue
+
+            op = ops[0]
+            if not op.get("started"):
+                self._mark_started(op["op_id"])
+            try:
+                self._replay(op)
+            except GoogleSheetsConflictError as exc:
+                if op["kind"] == "replace":
+                    # Zastępowany wpis zmieniono lub usunięto w innej sesji: nie
+                    # nadpisujemy tamtej zmiany, ale nowy wpis zapisujemy obok.
+                    self._convert_to_append(op["op_id"])
+                    continue
+                self._mark(op["op_id"], STATUS_FAILED, str(exc))
+            except Exception as exc:
+                if is_transient_error(exc):
+                    # Sieć, błąd serwera lub limit zapytań - operacja czeka w dzienniku.
+                    self._last_error = str(exc)
+                    time.sleep(delay)
+                    delay = min(delay * 2, self._retry_max)
+                    continue
+                # Błąd, którego ponowienie nie naprawi (np. nagłówki arkusza), nie
+                # blokuje kolejki: trafia do nieudanych, skąd można go ponowić lub odrzucić.
+                if isinstance(exc, GoogleSheetsError):
+                    self._mark(op["op_id"], STATUS_FAILED, str(exc))
+                else:
+                    self._mark(op["op_id"], STATUS_FAILED, f"{type(exc).__name__}: {exc}")
+            else:
+                self._mark(op["op_id"], STATUS_DONE)
+            self._last_error = None
+            delay = self._retry_initial
+
+
+@st.cache_resource(show_spinner=False)
+def get_entry_journal() -> EntryJournal:
+    settings = _get_journal_settings()
+    return EntryJournal(
+        settings["path"],
+        settings["retry_initial_seconds"],
+        settings["retry_max_seconds"],
+        settings["compact_after_ops"],
+    )
+
+
+def replaced_entries(df: pd.DataFrame, entry_date: datetime.date) -> List[Tuple[str, Optional[int]]]:
+    """Pary (entry_id, version) wpisów z danego dnia w ramce użytkownika."""
+    if df.empty or "entry_id" not in df:
+        return []
+    entry_dates = pd.to_datetime(df["Data i czas"], errors="coerce").dt.date
+    day = df.loc[entry_dates == entry_date]
+    return [
+        (str(entry_id), None if pd.isna(version) else int(version))
+        for entry_id, version in zip(day["entry_id"], day["version"])
+        if entry_id
+    ]
+
+
+def with_pending_entries(df: pd.DataFrame, ops: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Dokłada do wpisów użytkownika operacje, które czekają jeszcze w dzienniku."""
+    known_ids = set(df["entry_id"]) if "entry_id" in df else set()
+    for op in ops:
+        if op["op_id"] in known_ids:
+            continue
+        if op["kind"] == "replace" and not df.empty:
+            entry_dates = pd.to_datetime(df["Data i czas"], errors="coerce").dt.date
+            df = df.loc[entry_dates != datetime.date.fromisoformat(op["entry_date"])]
+        row = pd.DataFrame([{**op["entry"], "entry_id": op["op_id"], "version": None}])
+        df = row if df.empty else pd.concat([df, row], ignore_index=True)
+    return df
@@ -0,0 +1,187 @@
+import bisect
+import re
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+import instrumentation
+
+
+NOTES_COLUMN = "Uwagi"
+SEARCH_MAX_RESULTS = 200
+SNIPPET_CONTEXT_CHARS = 60
+
+# Wyszukiwanie ignoruje wielkość liter i polskie znaki diakrytyczne,
+# żeby "zmiana leków" znajdowało także "ZMIANA LEKOW".
+_FOLD = str.maketrans("ąćęłńóśźż", "acelnoszz")
+_TOKEN = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    """Małe litery bez polskich znaków; długość tekstu się nie zmienia."""
+    folded = text.lower()
+    if len(folded) != len(text):
+        # Np. "İ" ma dwuznakową małą literę; fragmenty trafień liczą pozycje w oryginale.
+        folded = "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+    return folded.translate(_FOLD)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(normalize_text(text))
+
+
+class _Note:
+    __slots__ = ("username", "timestamp", "text", "tokens")
+
+    def __init__(self, username: str, timestamp: str, text: str):
+        self.username = username
+        self.timestamp = timestamp
+        self.text = text
+        self.tokens = frozenset(tokenize(text))
+
+
+class NoteIndex:
+    """Indeks odwrócony uwag pacjentów, uzupełniany przyrostowo.
+
+    Przy nowej wersji danych porównywane są tylko treści wpisów (po entry_id);
+    ponownie dzielony na słowa jest wyłącznie tekst wpisów dodanych lub
+    zmienionych od poprzedniej wersji, a usunięte wpisy wypadają z indeksu.
+    Słowa zapytania są traktowane jako początki słów ("lek" znajdzie "leków").
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[Hashable] = None
+        self._notes: Dict[str, _Note] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        # Posortowane słowa do wyszukiwania po początku słowa.
+        self._vocabulary: List[str] = []
+
+    def sync(self, version: Hashable, entries: pd.DataFrame) -> None:
+        with self._lock:
+            if version == self._version:
+                return
+            current = self._current_notes(entries)
+            indexed = {
+                entry_id: (note.username, note.timestamp, note.text)
+                for entry_id, note in self._notes.items()
+            }
+            changed = [entry_id for entry_id, note in current.items() if indexed.get(entry_id) != note]
+            removed = [entry_id for entry_id in self._notes if entry_id not in current]
+            with instrumentation.span("indeks uwag"):
+                for entry_id in removed:
+                    self._remove(entry_id)
+                for entry_id in changed:
+                    self._remove(entry_id)
+                    self._add(entry_id, _Note(*current[entry_id]))
+            instrumentation.count("search.notes.indexed", len(changed))
+            instrumentation.count("search.notes.removed", len(removed))
+            self._version = version
+
+    @staticmethod
+    def _current_notes(entries: pd.DataFrame) -> Dict[str, Tuple[str, str, str]]:
+        if entries.empty or NOTES_COLUMN not in entries or "entry_id" not in entries:
+            return {}
+        texts = entries[NOTES_COLUMN].fillna("").astype(str).str.strip()
+        notes = entries.loc[texts != ""]
+        return {
+            entry_id: (username, timestamp, text)
+            for entry_id, username, timestamp, text in zip(
+                notes["entry_id"].astype(str),
+                notes["username"].fillna("").astype(str).str.strip(),
+                notes["Data i czas"].fillna("").astype(str),
+                texts.loc[notes.index],
+            )
+            if entry_id
+        }
+
+    def _add(self, entry_id: str, note: _Note) -> None:
+        self._notes[entry_id] = note
+        for token in note.tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                bisect.insort(self._vocabulary, token)
+            postings.add(entry_id)
+
+    def _remove(self, entry_id: str) -> None:
+        note = self._notes.pop(entry_id, None)
+        if note is None:
+            return
+        for token in note.tokens:
+            postings = self._postings[token]
+            postings.discard(entry_id)
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+
+    def _prefix_matches(self, prefix: str) -> Set[str]:
+        matches: Set[str] = set()
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            matches |= self._postings[token]
+        return matches
+
+    def search(
+        self,
+        query: str,
+        username: Optional[str] = None,
+        limit: int = SEARCH_MAX_RESULTS,
+    ) -> List[Dict[str, Any]]:
+        """Wpisy zawierające wszystkie słowa zapytania, od najnowszych."""
+        terms = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not terms:
+            return []
+        with self._lock:
+            matched: Optional[Set[str]] = None
+            for term in terms:
+                ids = self._prefix_matches(term)
+                matched = ids if matched is None else matched & ids
+                if not matched:
+                    return []
+            notes = [self._notes[entry_id] for entry_id in matched]
+
+        if username is not None:
+            notes = [note for note in notes if note.username == username]
+        notes.sort(key=lambda note: note.timestamp, reverse=True)
+        return [
+            {
+                "username": note.username,
+                "Data i czas": note.timestamp,
+                "fragment": snippet(note.text, terms),
+            }
+            for note in notes[:limit]
+        ]
+
+
+def snippet(text: str, terms: List[str], context: int = SNIPPET_CONTEXT_CHARS) -> str:
+    """Fragment tekstu wokół pierwszego trafienia któregoś ze słów."""
+    normalized = normalize_text(text)
+    positions = [
+        match.start()
+        for match in (re.search(rf"\b{re.escape(term)}", normalized) for term in terms)
+        if match is not None
+    ]
+    position = min(positions, default=0)
+    start = max(position - context, 0)
+    end = min(position + context, len(text))
+    return f"{'…' if start > 0 else ''}{text[start:end].strip()}{'…' if end < len(text) else ''}"
+
+
+_note_index = NoteIndex()
+
+
+def search_notes(
+    version: Hashable,
+    entries: pd.DataFrame,
+    query: str,
+    username: Optional[str] = None,
+) -> pd.DataFrame:
+    """Wyniki wyszukiwania w uwagach całej poradni jako ramka (username, Data i czas, fragment)."""
+    _note_index.sync(version, entries)
+    with instrumentation.span("wyszukiwanie w uwagach"):
+        results = _note_index.search(query, username)
+    return pd.DataFrame(results, columns=["username", "Data i czas", "fragment"])
@@ -0,0 +1,104 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+import bcrypt
+import streamlit as st
+
+
+# Można nadpisać w st.secrets w sekcji [auth].
+DEFAULT_AUTH_SETTINGS: Dict[str, int] = {
+    "bcrypt_rounds": 12,
+    "hash_workers": 2,
+    "hash_queue_size": 32,
+}
+
+MIN_BCRYPT_ROUNDS = 4
+MAX_BCRYPT_ROUNDS = 31
+
+
+class PasswordHashingError(Exception):
+    """Base exception with a user-facing message for Streamlit."""
+
+
+class PasswordHashingBusyError(PasswordHashingError):
+    """Raised when too many passwords are waiting to be hashed."""
+
+
+def _get_auth_settings() -> Dict[str, int]:
+    settings = dict(DEFAULT_AUTH_SETTINGS)
+    try:
+        overrides = dict(st.secrets.get("auth", {}))
+    except Exception:
+        overrides = {}
+
+    for key, value in overrides.items():
+        if key not in settings:
+            continue
+        try:
+            settings[key] = int(value)
+        except (TypeError, ValueError):
+            raise PasswordHashingError(
+                f'st.secrets["auth"]["{key}"] musi być liczbą całkowitą.'
+            )
+
+    rounds = settings["bcrypt_rounds"]
+    if not MIN_BCRYPT_ROUNDS <= rounds <= MAX_BCRYPT_ROUNDS:
+        raise PasswordHashingError(
+            'st.secrets["auth"]["bcrypt_rounds"] musi mieścić się w zakresie '
+            f"{MIN_BCRYPT_ROUNDS}-{MAX_BCRYPT_ROUNDS}."
+        )
+    if settings["hash_workers"] < 1 or settings["hash_queue_size"] < 0:
+        raise PasswordHashingError(
+            'st.secrets["auth"]: hash_workers musi być dodatnie, '
+            "a hash_queue_size nieujemne."
+        )
+    return settings
+
+
+class _PasswordHasher:
+    """Pula wątków dla bcrypt z ograniczoną kolejką oczekujących haseł."""
+
+    def __init__(self, rounds: int, workers: int, queue_size: int):
+        self._rounds = rounds
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="bcrypt",
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def submit(self, password: str) -> "Future[str]":
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusyError(
+                "Zbyt wiele rejestracji w tej chwili. Spróbuj ponownie za kilka sekund."
+            )
+        try:
+            future = self._executor.submit(self._hash, password)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _hash(self, password: str) -> str:
+        # bcrypt zwalnia GIL, więc wątki skryptów Streamlit działają dalej.
+        salt = bcrypt.gensalt(rounds=self._rounds)
+        return bcrypt.hashpw(password.encode(), salt).decode()
+
+
+@st.cache_resource(show_spinner=False)
+def _get_password_hasher() -> _PasswordHasher:
+    settings = _get_auth_settings()
+    return _PasswordHasher(
+        settings["bcrypt_rounds"],
+        settings["hash_workers"],
+        settings["hash_queue_size"],
+    )
+
+
+def hash_password_async(password: str) -> "Future[str]":
+    return _get_password_hasher().submit(password)
+
+
+def hash_password(password: str, timeout: Optional[float] = None) -> str:
+    return hash_password_async(password).result(timeout)